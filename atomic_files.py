@@ -0,0 +1,31 @@
+"""
+CommGame project tools for subsequent video rater task.
+
+Atomic file writing for the sidecar caches (video_probe.py, video_times.py) and the chunk manifest (video_chunks.py):
+the content is written to a temporary file next to the target, which then replaces the target (os.replace), so that
+parallel or interrupted runs never see a partially written file.
+
+"""
+
+import os
+import tempfile
+
+
+def write_atomic(path, write, mode='w'):
+    """
+    Writes a file atomically, see the module docstring. If writing fails, the temporary file is removed and the
+    exception is passed on.
+
+    :param path:   Path to the file to (over)write.
+    :param write:  Callable write(f), writing the content to the open temporary file f.
+    :param mode:   Str, file mode for the temporary file, 'w' (text) or 'wb' (binary). Defaults to 'w'.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, mode) as f:
+            write(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
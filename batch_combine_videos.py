@@ -0,0 +1,313 @@
+"""
+CommGame project tools for subsequent video rater task.
+
+Batch utility to combine the videos of every pair and session found under a data tree, using combine_frames from
+combine_videos.py in a pool of worker processes.
+
+USAGE: python3 batch_combine_videos.py INPUT_DIR [--sessions SESSION ...] [--output_dir OUTPUT_DIR]
+                                                 [--processes N] [--workers N] [--force] [--plan] [--use_plans]
+
+Input args:
+- INPUT_DIR:    Path to the root of the data tree. It is walked once, looking for pair[N]_Mordor_behav and
+                pair[N]_Gondor_behav folders containing pair[N]_[LAB]_[SESSION].mov videos and the corresponding
+                pair[N]_[LAB]_[SESSION]_*imes.mat timestamp files.
+- --sessions:   Only combine these sessions (e.g. freeConv BG1). Defaults to all sessions found.
+- --output_dir: Folder for all outputs. Defaults to None, meaning that outputs of each pair are saved into the
+                folder containing its Mordor and Gondor behav folders (same as calling combine_videos.py with
+                that folder as INPUT_DIR).
+- --processes:  Number of jobs running in parallel. Defaults to None, meaning it is derived from the number of
+                CPU cores and the available memory (see JOB_MEM_BYTES).
+- --workers:    Number of composition threads within each job, passed on to combine_frames. Defaults to 0.
+- --force:      Combine videos even if outputs are already up to date.
+- --plan:       Dry run: only plan the jobs (timestamps, container probing, alignment, no decoding, see
+                combine_plan.py), in seconds for a whole tree. Saves out a plan file per job and a plan table.
+- --use_plans:  Use the plan file of each job from an earlier --plan run, if there is one, instead of planning again.
+                A job fails if its input files changed since planning.
+
+Outputs:
+- Per job, the same outputs as from combine_videos.py (combined video, _start.npz and _start.mat files),
+  plus a log file with the printed output of the job:
+    [OUTPUT_DIR]/pair[PAIR_NO]_[SESSION]_combined_video.log
+- With --plan, only a plan file per job and the plan table (alignment, starting frames, expected output length and
+  start times of each job, see combine_plan.PLAN_TABLE_FIELDS), printed and saved out to:
+    [OUTPUT_DIR]/pair[PAIR_NO]_[SESSION]_combined_video_plan.json
+    [INPUT_DIR or --output_dir]/batch_combine_plan.csv
+- A summary table of all jobs (status, wall time, frames written, fps achieved, errors), printed at the end and
+  saved out to:
+    [INPUT_DIR or --output_dir]/batch_combine_summary.csv
+
+Notes:
+- A job is skipped if its combined video and _start.npz file both exist and are newer than all of its input files.
+
+"""
+
+import argparse
+import contextlib
+import csv
+import os
+import re
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from combine_plan import plan_path, save_plan, plan_row, write_plan_table, PLAN_TABLE_FIELDS
+from combine_videos import combine_frames, plan_combination, save_start_times
+
+
+# Rough peak memory use of one combine_frames job (two decoders, encoder, frame buffers), used for sizing the pool.
+JOB_MEM_BYTES = 2 * 1024 ** 3
+# Patterns for behav folders and for the video / timestamp files inside them.
+BEHAV_DIR_PATTERN = re.compile(r'^pair(\d+)_(Mordor|Gondor)_behav$')
+VIDEO_FILE_PATTERN = r'^pair{pair_no}_{lab}_(\w+?)\.mov$'
+TIMES_FILE_PATTERN = r'^pair{pair_no}_{lab}_(\w+?)_\w*imes\.mat$'
+# Columns of the summary table.
+SUMMARY_FIELDS = ['pair_no', 'session', 'status', 'wall_time_s', 'frames_written', 'fps_achieved', 'output_path',
+                  'error']
+
+
+def discover_jobs(input_dir, sessions=None):
+    """
+    Walks input_dir once and collects the video and timestamp files for each pair and session.
+
+    :param input_dir:  Path to the root of the data tree.
+    :param sessions:   List of session names to keep. Defaults to None (all sessions found).
+    :return: jobs:     List of dicts, sorted by pair number and session, with keys
+                       'pair_no', 'session', 'video_files' (Mordor, Gondor), 'times_files' (Mordor, Gondor) and
+                       'pair_dir' (common parent folder of the two behav folders).
+    """
+    # found[(pair_no, session)][lab] = {'video': path, 'times': path}
+    found = {}
+    for dirpath, dirnames, filenames in os.walk(input_dir):
+        match = BEHAV_DIR_PATTERN.match(os.path.basename(dirpath))
+        if not match:
+            continue
+        pair_no, lab = int(match.group(1)), match.group(2)
+        video_re = re.compile(VIDEO_FILE_PATTERN.format(pair_no=pair_no, lab=lab))
+        times_re = re.compile(TIMES_FILE_PATTERN.format(pair_no=pair_no, lab=lab))
+        for filename in sorted(filenames):
+            for key, pattern in (('video', video_re), ('times', times_re)):
+                file_match = pattern.match(filename)
+                if file_match:
+                    lab_files = found.setdefault((pair_no, file_match.group(1)), {}).setdefault(lab, {})
+                    # keep the first one, as glob(...)[0] would in combine_videos.py
+                    lab_files.setdefault(key, os.path.join(dirpath, filename))
+
+    jobs = []
+    for (pair_no, session), labs in sorted(found.items()):
+        if sessions is not None and session not in sessions:
+            continue
+        files = [labs.get(lab, {}).get(key) for lab in ('Mordor', 'Gondor') for key in ('video', 'times')]
+        if None in files:
+            print('Incomplete files for pair', pair_no, 'session', session, '- skipping:', labs)
+            continue
+        video_m, times_m, video_g, times_g = files
+        jobs.append({'pair_no': pair_no,
+                     'session': session,
+                     'video_files': (video_m, video_g),
+                     'times_files': (times_m, times_g),
+                     'pair_dir': os.path.commonpath([os.path.dirname(video_m), os.path.dirname(video_g)])})
+    return jobs
+
+
+def job_outputs(job, output_dir):
+    """
+    Paths of the combined video and of the _start.npz file for a job, as written by combine_frames and save_start_times.
+    """
+    prefix = os.path.join(output_dir, 'pair' + str(job['pair_no']) + '_' + job['session'] + '_combined_video')
+    return prefix + '.mp4', prefix + '_start.npz'
+
+
+def is_up_to_date(job, output_dir):
+    """
+    Returns True if all outputs of the job exist and are newer than all of its inputs.
+    """
+    outputs = job_outputs(job, output_dir)
+    if not all(os.path.exists(path) for path in outputs):
+        return False
+    newest_input = max(os.path.getmtime(path) for path in job['video_files'] + job['times_files'])
+    return min(os.path.getmtime(path) for path in outputs) > newest_input
+
+
+def default_process_count():
+    """
+    Number of parallel jobs: CPU cores, limited by the available memory (JOB_MEM_BYTES per job). At least 1.
+    """
+    cores = os.cpu_count() or 1
+    try:
+        available_mem = os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (ValueError, OSError, AttributeError):
+        # no sysconf info (non-Linux), go with the core count only
+        return cores
+    return max(1, min(cores, available_mem // JOB_MEM_BYTES))
+
+
+def plan_job(job, output_dir):
+    """
+    Runs the planning stage (combine_videos.plan_combination) for one job and saves out its plan file, with the printed
+    output suppressed. Exceptions are caught and reported in the returned plan table row.
+
+    :param job:         Dict, one element of the list returned by discover_jobs.
+    :param output_dir:  Path to folder for the plan file.
+    :return: row:       Dict with the keys in PLAN_TABLE_FIELDS, plus 'error'.
+    """
+    row = dict.fromkeys(PLAN_TABLE_FIELDS, '')
+    row.update(pair_no=job['pair_no'], session=job['session'], error='')
+    try:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            plan = plan_combination(output_dir, job['pair_no'], job['session'], video_files=job['video_files'],
+                                    times_files=job['times_files'])
+        save_plan(plan, plan_path(output_dir, job['pair_no'], job['session']))
+        row.update(plan_row(plan))
+    except Exception as exc:
+        row['error'] = repr(exc)
+    return row
+
+
+def batch_plan(input_dir, sessions=None, output_dir=None):
+    """
+    Plans all jobs under input_dir, without decoding any video. Plan files are saved out to the output folder of each
+    job, for batch_combine(use_plans=True).
+
+    :param input_dir:   Path to the root of the data tree.
+    :param sessions:    List of session names to plan. Defaults to None (all sessions found).
+    :param output_dir:  Path to folder for all outputs. Defaults to None (the pair folder of each job).
+    :return: rows:      List of plan table rows (keys in PLAN_TABLE_FIELDS plus 'error'), one per job.
+    """
+    jobs = discover_jobs(input_dir, sessions)
+    print('\nFound', len(jobs), 'jobs under', input_dir)
+    rows = []
+    for job in jobs:
+        row = plan_job(job, output_dir if output_dir is not None else job['pair_dir'])
+        if row['error']:
+            print('pair', row['pair_no'], row['session'], '- error', row['error'])
+        rows.append(row)
+    return rows
+
+
+def run_job(job, output_dir, workers=0, use_plan=False):
+    """
+    Runs combine_frames and save_start_times for one job, with the printed output redirected to a log file.
+    Exceptions are caught and reported in the returned summary row.
+
+    :param job:         Dict, one element of the list returned by discover_jobs.
+    :param output_dir:  Path to folder for the outputs.
+    :param workers:     Int, number of composition threads, passed on to combine_frames.
+    :param use_plan:    Boolean flag, if True, the plan file of the job (see plan_job) is used if there is one.
+                        Defaults to False.
+    :return: row:       Dict with the keys in SUMMARY_FIELDS.
+    """
+    row = dict.fromkeys(SUMMARY_FIELDS, '')
+    row.update(pair_no=job['pair_no'], session=job['session'])
+    video_path, _ = job_outputs(job, output_dir)
+    log_path = video_path[:-len('.mp4')] + '.log'
+    plan = plan_path(output_dir, job['pair_no'], job['session'])
+    if not (use_plan and os.path.exists(plan)):
+        plan = None
+    run_stats = {}
+    start = time.perf_counter()
+    try:
+        with open(log_path, 'w') as log, contextlib.redirect_stdout(log):
+            abs_start, shared_start, rel_start, output_path = combine_frames(
+                output_dir, job['pair_no'], job['session'], workers=workers, output_dir=output_dir,
+                video_files=job['video_files'], times_files=job['times_files'], plan=plan, run_stats=run_stats)
+            save_start_times(output_dir, job['pair_no'], job['session'], abs_start, shared_start, rel_start)
+        row['status'] = 'done'
+        row['output_path'] = output_path
+    except Exception as exc:
+        row['status'] = 'error'
+        row['error'] = repr(exc)
+        with open(log_path, 'a') as log:
+            traceback.print_exc(file=log)
+    row['wall_time_s'] = round(time.perf_counter() - start, 2)
+    if row['status'] == 'done':
+        # output frames actually written by combine_frames in this run
+        row['frames_written'] = run_stats['frames_written']
+        row['fps_achieved'] = round(row['frames_written'] / row['wall_time_s'], 2) if row['wall_time_s'] else ''
+    return row
+
+
+def batch_combine(input_dir, sessions=None, output_dir=None, processes=None, workers=0, force=False, use_plans=False):
+    """
+    Discovers all jobs under input_dir, skips the up-to-date ones and runs the rest in a process pool.
+
+    :param input_dir:   Path to the root of the data tree.
+    :param sessions:    List of session names to combine. Defaults to None (all sessions found).
+    :param output_dir:  Path to folder for all outputs. Defaults to None (the pair folder of each job).
+    :param processes:   Int, number of parallel jobs. Defaults to None (see default_process_count).
+    :param workers:     Int, number of composition threads within each job. Defaults to 0.
+    :param force:       Boolean flag, if True, up-to-date jobs are also run. Defaults to False.
+    :param use_plans:   Boolean flag, if True, jobs use their plan files from batch_plan, if any. Defaults to False.
+    :return: rows:      List of summary dicts (keys in SUMMARY_FIELDS), one per job.
+    """
+    jobs = discover_jobs(input_dir, sessions)
+    print('\nFound', len(jobs), 'jobs under', input_dir)
+
+    rows = []
+    pending = []
+    for job in jobs:
+        job_dir = output_dir if output_dir is not None else job['pair_dir']
+        if not force and is_up_to_date(job, job_dir):
+            row = dict.fromkeys(SUMMARY_FIELDS, '')
+            row.update(pair_no=job['pair_no'], session=job['session'], status='skipped',
+                       output_path=job_outputs(job, job_dir)[0])
+            rows.append(row)
+        else:
+            pending.append((job, job_dir))
+    print('Skipping', len(rows), 'up-to-date jobs, running', len(pending))
+
+    if processes is None:
+        processes = default_process_count()
+    print('Process pool size:', processes, '\n')
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        futures = [pool.submit(run_job, job, job_dir, workers, use_plans) for job, job_dir in pending]
+        for future in as_completed(futures):
+            row = future.result()
+            print('pair', row['pair_no'], row['session'], '-', row['status'], row['error'])
+            rows.append(row)
+
+    rows.sort(key=lambda r: (r['pair_no'], r['session']))
+    return rows
+
+
+def write_summary(rows, summary_path):
+    """
+    Prints the summary table and saves it out to a csv file.
+    """
+    print('\nBatch summary:')
+    print('\t'.join(SUMMARY_FIELDS[:6]))
+    for row in rows:
+        print('\t'.join(str(row[field]) for field in SUMMARY_FIELDS[:6]))
+    with open(summary_path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=SUMMARY_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+    print('\nSummary saved out to', summary_path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('input_dir', help='Path to the root of the data tree, walked for all pairs and sessions')
+    parser.add_argument('--sessions', nargs='+', default=None,
+                        help='Sessions to combine (BG1, ... BG9, freeConv, playback). Defaults to all found.')
+    parser.add_argument('--output_dir', default=None,
+                        help='Folder for all outputs. Defaults to the pair folder of each job.')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='Number of parallel jobs. Defaults to a value derived from CPU cores and memory.')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='Number of composition threads within each job. Defaults to 0.')
+    parser.add_argument('--force', action='store_true', help='Run jobs even if their outputs are up to date.')
+    parser.add_argument('--plan', action='store_true',
+                        help='Dry run: only plan the jobs (alignment, start frames, output length), no decoding.')
+    parser.add_argument('--use_plans', action='store_true',
+                        help='Use the plan files of an earlier --plan run instead of planning again.')
+    args = parser.parse_args()
+
+    summary_dir = args.output_dir if args.output_dir is not None else args.input_dir
+    if args.plan:
+        plan_rows = batch_plan(args.input_dir, sessions=args.sessions, output_dir=args.output_dir)
+        write_plan_table(plan_rows, os.path.join(summary_dir, 'batch_combine_plan.csv'))
+    else:
+        summary_rows = batch_combine(args.input_dir, sessions=args.sessions, output_dir=args.output_dir,
+                                     processes=args.processes, workers=args.workers, force=args.force,
+                                     use_plans=args.use_plans)
+        write_summary(summary_rows, os.path.join(summary_dir, 'batch_combine_summary.csv'))
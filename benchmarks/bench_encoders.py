@@ -0,0 +1,90 @@
+"""
+CommGame project tools for subsequent video rater task.
+
+Benchmark for the encoder backends of the combined video writer (video_writers.py).
+
+A fixed synthetic clip (moving gradients, text and some noise, at the combined frame layout) is encoded with the
+opencv backend (mp4v) and with the ffmpeg backend at a few preset / CRF settings. Encode fps and output file size are
+printed for each. The ffmpeg configurations are skipped if ffmpeg is not on the PATH.
+
+USAGE: python3 benchmarks/bench_encoders.py [--frames N] [--width W] [--height H] [--threads N] [--output_dir DIR]
+
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from video_writers import open_writer  # noqa: E402
+
+
+# (label, backend, options) configurations to compare.
+CONFIGURATIONS = [('opencv mp4v', 'opencv', {}),
+                  ('ffmpeg libx264 ultrafast crf23', 'ffmpeg', {'preset': 'ultrafast', 'crf': 23}),
+                  ('ffmpeg libx264 veryfast crf23', 'ffmpeg', {'preset': 'veryfast', 'crf': 23}),
+                  ('ffmpeg libx264 medium crf23', 'ffmpeg', {'preset': 'medium', 'crf': 23}),
+                  ('ffmpeg libx264 veryfast crf28', 'ffmpeg', {'preset': 'veryfast', 'crf': 28})]
+
+
+def synthetic_clip(frames, width, height, seed=0):
+    """
+    Generates a fixed synthetic clip: a list of BGR uint8 frames with two moving panels on a black background.
+    """
+    rng = np.random.default_rng(seed)
+    panel_h, panel_w = int(height * 5 / 8), width // 2
+    y, x = np.mgrid[0:panel_h, 0:panel_w]
+    clip = []
+    for i in range(frames):
+        frame = np.zeros((height, width, 3), np.uint8)
+        for p in range(2):
+            panel = frame[0:panel_h, p * panel_w:(p + 1) * panel_w]
+            panel[..., 0] = (x + 4 * i) % 256
+            panel[..., 1] = (y + 3 * i * (p + 1)) % 256
+            panel[..., 2] = 128
+            panel += rng.integers(0, 8, panel.shape, dtype=np.uint8)
+            cv2.putText(panel, 'frame ' + str(i), (panel_w // 4, panel_h // 2), cv2.FONT_HERSHEY_SIMPLEX, 2,
+                        (255, 255, 255), 4)
+        clip.append(frame)
+    return clip
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--frames', type=int, default=300, help='Number of frames in the clip. Defaults to 300.')
+    parser.add_argument('--width', type=int, default=1920, help='Frame width. Defaults to 1920.')
+    parser.add_argument('--height', type=int, default=1080, help='Frame height. Defaults to 1080.')
+    parser.add_argument('--threads', type=int, default=0, help='ffmpeg encoder threads. Defaults to 0 (auto).')
+    parser.add_argument('--output_dir', default=None,
+                        help='Folder for the encoded clips. Defaults to a temporary folder, deleted at the end.')
+    args = parser.parse_args()
+
+    clip = synthetic_clip(args.frames, args.width, args.height)
+    output_dir = args.output_dir or tempfile.mkdtemp(prefix='bench_encoders_')
+    has_ffmpeg = shutil.which('ffmpeg') is not None
+    print('Clip:', args.frames, 'frames at', args.width, 'x', args.height, '; output folder:', output_dir)
+
+    print('\n{:<34}{:>12}{:>14}'.format('configuration', 'encode fps', 'output MB'))
+    for idx, (label, backend, options) in enumerate(CONFIGURATIONS):
+        if backend == 'ffmpeg':
+            if not has_ffmpeg:
+                print('{:<34}{:>26}'.format(label, 'skipped (no ffmpeg)'))
+                continue
+            options = dict(options, threads=args.threads)
+        output_path = os.path.join(output_dir, 'clip' + str(idx) + '.mp4')
+        start = time.perf_counter()
+        writer = open_writer(output_path, 30, (args.width, args.height), backend=backend, **options)
+        for frame in clip:
+            writer.write(frame)
+        writer.release()
+        elapsed = time.perf_counter() - start
+        print('{:<34}{:>12.1f}{:>14.2f}'.format(label, args.frames / elapsed, os.path.getsize(output_path) / 1024 ** 2))
+
+    if args.output_dir is None:
+        shutil.rmtree(output_dir)
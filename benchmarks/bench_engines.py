@@ -0,0 +1,153 @@
+"""
+CommGame project tools for subsequent video rater task.
+
+Equivalence check and speed comparison of the two combination engines of combine_videos.py: the Python frame loop
+(engine='python') and the single ffmpeg filtergraph (engine='ffmpeg', see ffmpeg_engine.py), on a synthetic Mordor /
+Gondor pair (synthetic_fixtures.py). Needs ffmpeg on the PATH.
+
+Both engines combine the same pair with the same encoder (libx264 with --crf, the Python engine through the ffmpeg
+writer backend), each in a fresh process. For each engine the run time, frames / sec and peak RSS are printed. Then
+the two combined videos are decoded side-by-side:
+- frame counts must match,
+- the source frame indices decoded from each frame pair (frame index codes, see synthetic_fixtures.py) must match,
+  i.e. both engines combine the same source frames,
+- the mean absolute pixel difference of each frame pair must be within --tolerance intensity levels (resampling and
+  color conversion differ slightly, swscale vs cv2.resize, yuv420p vs BGR).
+The script exits with status 1 if the outputs are not equivalent.
+
+USAGE: python3 benchmarks/bench_engines.py [--session S] [--width W] [--height H] [--duration SECS] [--fps FPS]
+                                           [--offset SECS] [--seed N] [--geometry {full,compact}] [--info_strip H]
+                                           [--crf N] [--tolerance LEVELS] [--output_dir DIR]
+
+"""
+
+import argparse
+import contextlib
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import combine_videos  # noqa: E402
+from frame_layout import compute_layout  # noqa: E402
+from run_metrics import peak_rss_mb  # noqa: E402
+from synthetic_fixtures import make_pair, decode_frame_indices  # noqa: E402
+
+
+# Pair number of the synthetic recordings.
+BENCH_PAIR_NO = 1
+# Default tolerance for the mean absolute pixel difference of corresponding frames, in intensity levels.
+PIXEL_TOLERANCE = 4.0
+
+
+def bench_engine(data_dir, session, output_dir, engine, geometry, info_strip, crf):
+    """
+    Runs combine_frames with the given engine. Returns (seconds, peak RSS in MiB, output video path).
+    """
+    output_subdir = os.path.join(output_dir, engine)
+    os.makedirs(output_subdir, exist_ok=True)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        output_path = combine_videos.combine_frames(data_dir, BENCH_PAIR_NO, session, alignment='start',
+                                                    output_dir=output_subdir, encoder='ffmpeg',
+                                                    encoder_options={'crf': crf}, geometry=geometry,
+                                                    info_strip=info_strip, engine=engine)[3]
+        elapsed = time.perf_counter() - start
+    return elapsed, peak_rss_mb(), output_path
+
+
+def compare_outputs(path_a, path_b, layout):
+    """
+    Decodes two combined videos side-by-side. Returns (frame count a, frame count b, number of frame pairs with
+    different decoded source frame indices, mean and max of the per-frame mean absolute pixel difference).
+    """
+    cap_a, cap_b = cv2.VideoCapture(path_a), cv2.VideoCapture(path_b)
+    count_a = count_b = index_mismatches = 0
+    diffs = []
+    while True:
+        ret_a, frame_a = cap_a.read()
+        ret_b, frame_b = cap_b.read()
+        count_a += ret_a
+        count_b += ret_b
+        if not (ret_a and ret_b):
+            # count the rest of the longer video
+            while ret_a and cap_a.grab():
+                count_a += 1
+            while ret_b and cap_b.grab():
+                count_b += 1
+            break
+        if decode_frame_indices(frame_a, layout) != decode_frame_indices(frame_b, layout):
+            index_mismatches += 1
+        diffs.append(np.mean(cv2.absdiff(frame_a, frame_b)))
+    cap_a.release()
+    cap_b.release()
+    if not diffs:
+        return count_a, count_b, index_mismatches, None, None
+    return count_a, count_b, index_mismatches, float(np.mean(diffs)), float(np.max(diffs))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--session', type=str, default='freeConv', help='Session name. Defaults to freeConv.')
+    parser.add_argument('--width', type=int, default=1920, help='Video width. Defaults to 1920.')
+    parser.add_argument('--height', type=int, default=1080, help='Video height. Defaults to 1080.')
+    parser.add_argument('--duration', type=float, default=20.0, help='Recording length in secs. Defaults to 20.')
+    parser.add_argument('--fps', type=float, default=30.0, help='Nominal frame rate. Defaults to 30.')
+    parser.add_argument('--offset', type=float, default=0.5,
+                        help='Start offset of the Gondor recording relative to Mordor, in secs. Defaults to 0.5.')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed. Defaults to 0.')
+    parser.add_argument('--geometry', type=str, default='full', choices=['full', 'compact'],
+                        help='Output frame geometry. Defaults to full.')
+    parser.add_argument('--info_strip', type=int, default=0, help='Info strip height. Defaults to 0 (none).')
+    parser.add_argument('--crf', type=float, default=12,
+                        help='libx264 CRF for both engines, low so that coding noise does not mask differences. '
+                             'Defaults to 12.')
+    parser.add_argument('--tolerance', type=float, default=PIXEL_TOLERANCE,
+                        help='Maximal mean absolute pixel difference of corresponding frames. Defaults to ' +
+                             str(PIXEL_TOLERANCE) + '.')
+    parser.add_argument('--output_dir', default=None,
+                        help='Folder for the fixtures and outputs. Defaults to a temporary folder, deleted at the end.')
+    args = parser.parse_args()
+
+    if shutil.which('ffmpeg') is None:
+        sys.exit('ffmpeg is not on the PATH, needed for the ffmpeg engine!')
+    bench_dir = args.output_dir or tempfile.mkdtemp(prefix='bench_engines_')
+    data_dir = os.path.join(bench_dir, 'data')
+    # no jitter and no dropped frames: lockstep reading, the same starting frames for both engines
+    pair = make_pair(data_dir, BENCH_PAIR_NO, session=args.session, width=args.width, height=args.height,
+                     duration=args.duration, fps=args.fps, jitter=0.0, drop_rate=0.0,
+                     offsets=(0.0, args.offset), seed=args.seed)
+    print('Synthetic pair:', args.width, 'x', args.height, ',', pair['Mordor']['frame_times'].size, '/',
+          pair['Gondor']['frame_times'].size, 'frames (Mordor / Gondor); folder:', bench_dir)
+
+    header = '{:<9}{:>10}{:>10}{:>10}'
+    print('\n' + header.format('engine', 'secs', 'fps', 'RSS MiB'))
+    outputs = {}
+    for engine in combine_videos.ENGINES:
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            elapsed, rss, outputs[engine] = pool.submit(bench_engine, data_dir, args.session, bench_dir, engine,
+                                                        args.geometry, args.info_strip, args.crf).result()
+        cap = cv2.VideoCapture(outputs[engine])
+        frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        cap.release()
+        print(header.format(engine, '{:.2f}'.format(elapsed), '{:.1f}'.format(frames / elapsed), '{:.0f}'.format(rss)))
+
+    layout = compute_layout((args.width, args.height), geometry=args.geometry, info_strip=args.info_strip)
+    count_py, count_ff, mismatches, diff_mean, diff_max = compare_outputs(outputs['python'], outputs['ffmpeg'], layout)
+    print('\nframes (python / ffmpeg):', count_py, '/', count_ff, '; source index mismatches:', mismatches,
+          '; mean abs pixel difference (mean / max over frames):',
+          '-' if diff_mean is None else '{:.2f} / {:.2f}'.format(diff_mean, diff_max))
+    equivalent = (count_py == count_ff and mismatches == 0 and diff_max is not None and
+                  diff_max <= args.tolerance)
+    print('Outputs are', 'equivalent' if equivalent else 'NOT equivalent',
+          '(tolerance: ' + str(args.tolerance) + ' levels).')
+
+    if args.output_dir is None:
+        shutil.rmtree(bench_dir)
+    sys.exit(0 if equivalent else 1)
@@ -0,0 +1,87 @@
+"""
+CommGame project tools for subsequent video rater task.
+
+Micro-benchmark for frame composition: the original frame_connect (resize full frames, allocate a new canvas per
+frame, copy the central columns) against FrameComposer from combine_videos.py (crop before resize, reusable canvas,
+resize directly into the canvas).
+
+Reports frames/sec and the memory allocated per frame (via tracemalloc, numpy and the cv2 python bindings report
+their array allocations to it), and checks that the two methods give identical frames.
+
+USAGE: python3 benchmarks/bench_frame_connect.py [--frames N] [--seed SEED]
+
+"""
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from combine_videos import FrameComposer  # noqa: E402
+
+
+def frame_connect_original(frame_left, frame_right):
+    """
+    Reference implementation, frame_connect as it was before FrameComposer.
+    """
+    video_h, video_w = 1080, 1920
+    frame_l = cv2.resize(frame_left, (int(video_w/8*5), int(video_h/8*5)), interpolation=cv2.INTER_AREA)
+    frame_r = cv2.resize(frame_right, (int(video_w/8*5), int(video_h/8*5)), interpolation=cv2.INTER_AREA)
+    image = np.zeros((video_h, video_w, 3), np.uint8)
+    image[0:int(video_h/8*5), 0:int(960)] = frame_l[:, 120:1080]
+    image[0:int(video_h/8*5), int(960):int(1920)] = frame_r[:, 120:1080]
+    return image
+
+
+def run(compose_func, frames_m, frames_g):
+    """
+    Composes all frame pairs, returns (frames/sec, allocated bytes per frame, last combined frame).
+    """
+    # warm-up call, so that one-off allocations (e.g. the canvas of the composer) are not counted
+    img = compose_func(frames_m[0], frames_g[0])
+    # timing pass
+    start = time.perf_counter()
+    for frame_m, frame_g in zip(frames_m, frames_g):
+        img = compose_func(frame_m, frame_g)
+    elapsed = time.perf_counter() - start
+    # allocation pass, traced separately as tracemalloc slows things down
+    tracemalloc.start()
+    allocated = 0
+    for frame_m, frame_g in zip(frames_m, frames_g):
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        img = compose_func(frame_m, frame_g)
+        # memory allocated during the call, temporary buffers included
+        allocated += tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+    return len(frames_m) / elapsed, allocated / len(frames_m), img.copy()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--frames', type=int, default=200, help='Number of frame pairs to compose. Defaults to 200.')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed. Defaults to 0.')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    # a handful of distinct random source frames, cycled
+    sources = [rng.integers(0, 256, (1080, 1920, 3), dtype=np.uint8) for _ in range(4)]
+    frames_m = [sources[i % 4] for i in range(args.frames)]
+    frames_g = [sources[(i + 1) % 4] for i in range(args.frames)]
+
+    composer = FrameComposer()
+    results = {'frame_connect (original)': run(frame_connect_original, frames_m, frames_g),
+               'FrameComposer': run(composer.compose, frames_m, frames_g)}
+
+    print('{:<28}{:>12}{:>20}'.format('method', 'frames/sec', 'MB allocated/frame'))
+    for name, (fps, alloc, _) in results.items():
+        print('{:<28}{:>12.1f}{:>20.2f}'.format(name, fps, alloc / 1024 ** 2))
+
+    images = [img for _, _, img in results.values()]
+    if not np.array_equal(images[0], images[1]):
+        raise ValueError('Combined frames differ across methods!')
+    print('\nCombined frames are identical.')
@@ -0,0 +1,87 @@
+"""
+CommGame project tools for subsequent video rater task.
+
+Benchmark for the frame pairing engine (frame_pairing.py) against the per-tick argmin loop that was used in
+combine_videos_BG.frame_alignment_accurate.
+
+Synthetic frame capture timestamps are generated for two labs (Mordor and Gondor) at a nominal 30 fps, with gaussian
+jitter and a small start offset, then both methods pair the frames to a shared time axis. Results are checked for
+equality and the run times are printed.
+
+USAGE: python3 benchmarks/bench_frame_pairing.py [--duration SECS] [--fps FPS] [--jitter SECS] [--seed SEED]
+
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from frame_pairing import pair_frame_indices  # noqa: E402
+
+
+def synthetic_capture_times(start_t, duration, fps, jitter, rng):
+    """
+    Generates monotonic, jittered frame capture timestamps.
+
+    :param start_t:   Float, timestamp of the first frame.
+    :param duration:  Float, length of the recording in seconds.
+    :param fps:       Float, nominal frame rate.
+    :param jitter:    Float, std of the gaussian jitter added to each timestamp, in seconds.
+    :param rng:       Numpy random Generator.
+    :return: times:   1D numpy array of frame capture timestamps.
+    """
+    nominal = start_t + np.arange(int(duration * fps)) / fps
+    times = nominal + rng.normal(0, jitter, nominal.size)
+    # jitter must not reorder frames
+    return np.maximum.accumulate(times)
+
+
+def pair_frames_loop(frame_times_m, frame_times_g, shared_times):
+    """
+    Reference implementation, the per-tick loop from the original frame_alignment_accurate.
+    """
+    paired_frame_indices = []
+    for frame in shared_times:
+        diffs_m = np.abs(frame_times_m - frame)
+        frame_idx_m = np.where(diffs_m == np.min(diffs_m))[0][0]
+        diffs_g = np.abs(frame_times_g - frame)
+        frame_idx_g = np.where(diffs_g == np.min(diffs_g))[0][0]
+        paired_frame_indices.append([frame_idx_m, frame_idx_g])
+    return np.array(paired_frame_indices)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--duration', type=float, default=300,
+                        help='Length of the synthetic recordings in seconds. Defaults to 300. A freeConv session is '
+                             'about 900 s, the loop takes minutes at that length.')
+    parser.add_argument('--fps', type=float, default=30, help='Nominal frame rate. Defaults to 30.')
+    parser.add_argument('--jitter', type=float, default=0.004,
+                        help='Std of frame capture time jitter in seconds. Defaults to 0.004.')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed. Defaults to 0.')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    shared_start = 1.6e9
+    times_m = synthetic_capture_times(shared_start + 0.150, args.duration, args.fps, args.jitter, rng)
+    times_g = synthetic_capture_times(shared_start + 0.170, args.duration, args.fps, args.jitter, rng)
+    ticks = np.arange(shared_start, shared_start + args.duration, 1 / args.fps)
+    print('Frames, Mordor:', times_m.size, '; Gondor:', times_g.size, '; shared time ticks:', ticks.size)
+
+    t0 = time.perf_counter()
+    pairs_fast = pair_frame_indices(times_m, times_g, ticks)
+    t_fast = time.perf_counter() - t0
+    print('\nsearchsorted pairing: {:.4f} s'.format(t_fast))
+
+    t0 = time.perf_counter()
+    pairs_loop = pair_frames_loop(times_m, times_g, ticks)
+    t_loop = time.perf_counter() - t0
+    print('per-tick argmin loop: {:.4f} s'.format(t_loop))
+
+    if not np.array_equal(pairs_fast, pairs_loop):
+        raise ValueError('Paired frame indices differ across methods!')
+    print('\nPaired frame indices are identical. Speed-up: {:.1f}x'.format(t_loop / t_fast))
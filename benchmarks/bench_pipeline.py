@@ -0,0 +1,167 @@
+"""
+CommGame project tools for subsequent video rater task.
+
+End-to-end benchmark for combine_videos.py on synthetic Mordor / Gondor recordings (synthetic_fixtures.py), runnable
+offline on a CPU-only box.
+
+A synthetic pair (videos and _times.mat files, in the directory layout the globs expect) is generated with the requested
+resolution, duration, frame rate, timestamp jitter, dropped frames and start offset. Then, each in a fresh process so
+that peak memory is measured per stage:
+- alignment:  Timestamp extraction (extract_video_times_mat, no cache) and frame alignment (frames_alignment or
+              frame_alignment_accurate, depending on the session). Run time and peak RSS.
+- combine:    combine_frames, once for each --workers value, with per-stage instrumentation (run_metrics.py).
+              Overall frames / sec, frames / sec of each stage (decode Mordor, decode Gondor, compose, encode) and
+              peak RSS.
+The alignment error of each combined video is measured on the output: the source frame indices are decoded from
+each combined frame (frame index codes, see synthetic_fixtures.py), and the capture time difference of the paired
+Mordor and Gondor frames is reported (mean and max, ms), with the number of frames that could not be decoded.
+
+USAGE: python3 benchmarks/bench_pipeline.py [--session S] [--width W] [--height H] [--duration SECS] [--fps FPS]
+                                            [--jitter SECS] [--drop_rate P] [--offset SECS] [--seed N]
+                                            [--workers N [N ...]] [--encoder {opencv,ffmpeg}] [--output_dir DIR]
+
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import combine_videos  # noqa: E402
+from frame_layout import compute_layout  # noqa: E402
+from run_metrics import STAGES, peak_rss_mb  # noqa: E402
+from synthetic_fixtures import make_pair, decode_frame_indices  # noqa: E402
+
+
+# Pair number of the synthetic recordings.
+BENCH_PAIR_NO = 1
+
+
+def run_isolated(func, *args):
+    """
+    Runs func(*args) in a fresh process, so that peak memory is measured per stage.
+    """
+    with ProcessPoolExecutor(max_workers=1) as pool:
+        return pool.submit(func, *args).result()
+
+
+def bench_alignment(data_dir, session):
+    """
+    Times timestamp extraction and frame alignment. Returns (seconds, peak RSS in MiB).
+    """
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        timestamps = combine_videos.extract_video_times_mat(data_dir, BENCH_PAIR_NO, session, use_cache=False)
+        if session.startswith('BG'):
+            combine_videos.frame_alignment_accurate(timestamps)
+        else:
+            combine_videos.frames_alignment(timestamps['frame_times_m'], timestamps['frame_times_g'],
+                                            combine_videos.VIDEO_START_FRAME)
+        elapsed = time.perf_counter() - start
+    return elapsed, peak_rss_mb()
+
+
+def bench_combine(data_dir, session, output_dir, workers, encoder):
+    """
+    Runs combine_frames with instrumentation. Returns (metrics summary dict, output video path).
+    """
+    metrics_file = os.path.join(output_dir, 'metrics_workers' + str(workers) + '.jsonl')
+    output_subdir = os.path.join(output_dir, 'workers' + str(workers))
+    os.makedirs(output_subdir, exist_ok=True)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        output_path = combine_videos.combine_frames(data_dir, BENCH_PAIR_NO, session, workers=workers,
+                                                    output_dir=output_subdir, encoder=encoder,
+                                                    metrics_file=metrics_file)[3]
+    with open(metrics_file) as f:
+        summary = [json.loads(line) for line in f][-1]
+    return summary, output_path
+
+
+def alignment_error(output_path, fixture):
+    """
+    Decodes the source frame indices of each combined frame and returns (mean error ms, max error ms, undecodable
+    frame count), where the error is the capture time difference of the paired Mordor and Gondor frames.
+    """
+    times_m, times_g = fixture['Mordor']['frame_times'], fixture['Gondor']['frame_times']
+    cap = cv2.VideoCapture(output_path)
+    width, height = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    src = cv2.VideoCapture(fixture['Mordor']['video'])
+    layout = compute_layout((int(src.get(cv2.CAP_PROP_FRAME_WIDTH)), int(src.get(cv2.CAP_PROP_FRAME_HEIGHT))),
+                            (width, height))
+    src.release()
+    errors, failed = [], 0
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        idx_m, idx_g = decode_frame_indices(frame, layout)
+        if idx_m >= times_m.size or idx_g >= times_g.size:
+            failed += 1
+            continue
+        errors.append(abs(times_m[idx_m] - times_g[idx_g]))
+    cap.release()
+    if not errors:
+        return None, None, failed
+    errors = 1000 * np.asarray(errors)
+    return float(errors.mean()), float(errors.max()), failed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--session', type=str, default='freeConv',
+                        help='Session name, BG sessions use the accurate alignment. Defaults to freeConv.')
+    parser.add_argument('--width', type=int, default=1920, help='Video width. Defaults to 1920.')
+    parser.add_argument('--height', type=int, default=1080, help='Video height. Defaults to 1080.')
+    parser.add_argument('--duration', type=float, default=20.0, help='Recording length in secs. Defaults to 20.')
+    parser.add_argument('--fps', type=float, default=30.0, help='Nominal frame rate. Defaults to 30.')
+    parser.add_argument('--jitter', type=float, default=0.002, help='Timestamp jitter std in secs. Defaults to 0.002.')
+    parser.add_argument('--drop_rate', type=float, default=0.0, help='Probability of dropped frames. Defaults to 0.')
+    parser.add_argument('--offset', type=float, default=0.5,
+                        help='Start offset of the Gondor recording relative to Mordor, in secs. Defaults to 0.5.')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed. Defaults to 0.')
+    parser.add_argument('--workers', type=int, nargs='+', default=[0, 4],
+                        help='Composition worker counts to benchmark combine_frames with. Defaults to 0 4.')
+    parser.add_argument('--encoder', type=str, default='opencv', help='Encoder backend. Defaults to opencv.')
+    parser.add_argument('--output_dir', default=None,
+                        help='Folder for the fixtures and outputs. Defaults to a temporary folder, deleted at the end.')
+    args = parser.parse_args()
+
+    bench_dir = args.output_dir or tempfile.mkdtemp(prefix='bench_pipeline_')
+    data_dir = os.path.join(bench_dir, 'data')
+    start_t = time.perf_counter()
+    pair = make_pair(data_dir, BENCH_PAIR_NO, session=args.session, width=args.width, height=args.height,
+                     duration=args.duration, fps=args.fps, jitter=args.jitter, drop_rate=args.drop_rate,
+                     offsets=(0.0, args.offset), seed=args.seed)
+    print('Synthetic pair:', args.width, 'x', args.height, ',', pair['Mordor']['frame_times'].size, '/',
+          pair['Gondor']['frame_times'].size, 'frames (Mordor / Gondor), generated in',
+          round(time.perf_counter() - start_t, 1), 's; folder:', bench_dir)
+
+    align_s, align_rss = run_isolated(bench_alignment, data_dir, args.session)
+    print('\nalignment: {:.1f} ms; peak RSS {:.0f} MiB'.format(1000 * align_s, align_rss))
+
+    header = '{:<9}{:>8}' + '{:>14}' * len(STAGES) + '{:>9}{:>13}{:>12}{:>8}'
+    print('\n' + header.format('workers', 'fps', *[stage + ' fps' for stage in STAGES],
+                               'RSS MiB', 'err mean ms', 'err max ms', 'failed'))
+    for workers in args.workers:
+        summary, video_path = run_isolated(bench_combine, data_dir, args.session, bench_dir, workers, args.encoder)
+        stage_fps = []
+        for stage in STAGES:
+            stats = summary['stages'].get(stage)
+            stage_fps.append('{:.1f}'.format(stats['count'] / stats['total_s']) if stats and stats['total_s'] else '-')
+        err_mean, err_max, n_failed = alignment_error(video_path, pair)
+        print(header.format(workers, '{:.1f}'.format(summary['fps']), *stage_fps,
+                            '{:.0f}'.format(summary['peak_rss_mb']),
+                            '-' if err_mean is None else '{:.2f}'.format(err_mean),
+                            '-' if err_max is None else '{:.2f}'.format(err_max), n_failed))
+
+    if args.output_dir is None:
+        shutil.rmtree(bench_dir)
@@ -0,0 +1,91 @@
+"""
+CommGame project tools for subsequent video rater task.
+
+Micro-benchmark for the composition paths of combine_videos.py: the BGR path (decoded yuv420p frames converted to BGR,
+FrameComposer, combined frame converted back to yuv420p for the encoder) against the planar yuv420p path
+(frame_yuv.YUVFrameComposer, no conversions). Decoding and encoding themselves are not timed, only what differs
+between the two paths.
+
+Reports frames/sec, the bytes of the source and combined frames handled per output frame, and the PSNR of the Y
+plane of the yuv420p path against the BGR path (the two resample differently, chroma at half resolution, so they are
+close but not identical).
+
+USAGE: python3 benchmarks/bench_yuv.py [--frames N] [--width W] [--height H] [--geometry {full,compact}]
+
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from combine_videos import FrameComposer  # noqa: E402
+from frame_layout import compute_layout  # noqa: E402
+from frame_yuv import YUVFrameComposer  # noqa: E402
+from synthetic_fixtures import draw_frame  # noqa: E402
+
+
+def run(compose_func, frames_m, frames_g):
+    """
+    Composes all frame pairs, returns (frames/sec, last combined frame).
+    """
+    # warm-up call
+    img = compose_func(frames_m[0], frames_g[0])
+    start = time.perf_counter()
+    for frame_m, frame_g in zip(frames_m, frames_g):
+        img = compose_func(frame_m, frame_g)
+    elapsed = time.perf_counter() - start
+    return len(frames_m) / elapsed, img.copy()
+
+
+def psnr(a, b):
+    """
+    Peak signal-to-noise ratio of two uint8 arrays, in dB (inf if identical).
+    """
+    mse = np.mean((a.astype(np.float64) - b) ** 2)
+    return float('inf') if mse == 0 else 10 * np.log10(255 ** 2 / mse)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--frames', type=int, default=200, help='Number of frame pairs to compose. Defaults to 200.')
+    parser.add_argument('--width', type=int, default=1920, help='Source frame width. Defaults to 1920.')
+    parser.add_argument('--height', type=int, default=1080, help='Source frame height. Defaults to 1080.')
+    parser.add_argument('--geometry', type=str, default='full', choices=['full', 'compact'],
+                        help='Output frame geometry. Defaults to full.')
+    args = parser.parse_args()
+
+    layout = compute_layout((args.width, args.height), geometry=args.geometry)
+    out_w, out_h = layout['out_size']
+    # a handful of distinct source frames, cycled, as the decoder delivers them (yuv420p)
+    sources = [cv2.cvtColor(draw_frame(i, args.width, args.height, lab), cv2.COLOR_BGR2YUV_I420)
+               for i, lab in enumerate(('Mordor', 'Gondor', 'Mordor', 'Gondor'))]
+    frames_m = [sources[i % 4] for i in range(args.frames)]
+    frames_g = [sources[(i + 1) % 4] for i in range(args.frames)]
+
+    bgr_composer = FrameComposer(layout)
+    yuv_composer = YUVFrameComposer(layout)
+
+    def compose_bgr(frame_m, frame_g):
+        # decoder conversion (cv2.VideoCapture.read), composition, encoder conversion (writer)
+        combined = bgr_composer.compose(cv2.cvtColor(frame_m, cv2.COLOR_YUV2BGR_I420),
+                                        cv2.cvtColor(frame_g, cv2.COLOR_YUV2BGR_I420))
+        return cv2.cvtColor(combined, cv2.COLOR_BGR2YUV_I420)
+
+    src_bytes_yuv, out_bytes_yuv = sources[0].nbytes, out_w * out_h * 3 // 2
+    results = {'BGR (convert, compose, convert)': run(compose_bgr, frames_m, frames_g) +
+               (2 * 2 * args.width * args.height * 3 + 2 * src_bytes_yuv + 2 * out_w * out_h * 3 + out_bytes_yuv,),
+               'yuv420p (YUVFrameComposer)': run(yuv_composer.compose, frames_m, frames_g) +
+               (2 * src_bytes_yuv + out_bytes_yuv,)}
+
+    print('Sources:', args.width, 'x', args.height, '; combined frames:', out_w, 'x', out_h)
+    print('\n{:<34}{:>12}{:>18}'.format('path', 'frames/sec', 'MB handled/frame'))
+    for name, (fps, _, handled) in results.items():
+        print('{:<34}{:>12.1f}{:>18.2f}'.format(name, fps, handled / 1024 ** 2))
+
+    (_, img_bgr, _), (_, img_yuv, _) = results.values()
+    print('\nY plane PSNR, yuv420p vs BGR path: {:.1f} dB'.format(psnr(img_yuv[:out_h], img_bgr[:out_h])))
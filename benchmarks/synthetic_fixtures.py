@@ -0,0 +1,168 @@
+"""
+CommGame project tools for subsequent video rater task.
+
+Synthetic Mordor / Gondor recordings for benchmarks, in the directory layout combine_videos.py globs for:
+    [ROOT]/pair[N]/pair[N]_Mordor_behav/pair[N]_Mordor_[SESSION].mov
+    [ROOT]/pair[N]/pair[N]_Mordor_behav/pair[N]_Mordor_[SESSION]_times.mat
+    (same for Gondor)
+
+Each video frame shows its own frame index as a row of black / white code blocks (FRAME_CODE_BITS bits, most
+significant first), in the central band of the frame, which is visible on the combined frame (see frame_layout.py).
+decode_frame_indices reads the indices back from a combined frame, so the source frames used for each output frame,
+and the alignment error, can be checked on the output video.
+
+Capture timestamps (frameCaptTime) follow a nominal frame rate, with gaussian jitter, randomly dropped frames (capture
+ticks without a frame, so the next timestamp is a frame period later) and a per-lab start offset, relative to a shared
+start time (sharedStartTime). A NaN is appended, as in the real .mat files.
+
+USAGE: python3 benchmarks/synthetic_fixtures.py ROOT PAIR_NO [--session S] [--width W] [--height H] [--duration SECS]
+                                               [--fps FPS] [--jitter SECS] [--drop_rate P] [--offset SECS] [--seed N]
+
+"""
+
+import argparse
+import os
+
+import cv2
+import numpy as np
+from scipy import io as sio
+
+
+# Number of bits of the frame index code.
+FRAME_CODE_BITS = 16
+# Horizontal extent of the frame index code, as fractions of the frame width (inside the visible, uncropped columns).
+FRAME_CODE_X = (0.2, 0.8)
+# Vertical extent of the frame index code, as fractions of the frame height.
+FRAME_CODE_Y = (0.4, 0.6)
+# Shared start time (sharedStartTime) of the synthetic recordings, and the delay of the first capture tick after it.
+SHARED_START_TIME = 1000.0
+CAPTURE_DELAY_S = 0.1
+
+
+def _code_block_edges(width):
+    edges = np.linspace(FRAME_CODE_X[0] * width, FRAME_CODE_X[1] * width, FRAME_CODE_BITS + 1)
+    return edges.round().astype(int)
+
+
+def draw_frame(frame_idx, width, height, lab):
+    """
+    Returns a synthetic BGR frame showing frame_idx as a code block row, with a lab-specific background.
+    """
+    frame = np.zeros((height, width, 3), np.uint8)
+    # moving background, so that the encoder has some work to do
+    x = np.arange(width, dtype=np.int32)
+    frame[:, :, 0] = ((x + 8 * frame_idx) % 256).astype(np.uint8)
+    frame[:, :, 1] = 90 if lab == 'Mordor' else 160
+    frame[:, :, 2] = ((x // 4 + 3 * frame_idx) % 256).astype(np.uint8)
+    edges = _code_block_edges(width)
+    y0, y1 = int(FRAME_CODE_Y[0] * height), int(FRAME_CODE_Y[1] * height)
+    for bit in range(FRAME_CODE_BITS):
+        value = 255 if (frame_idx >> (FRAME_CODE_BITS - 1 - bit)) & 1 else 0
+        frame[y0:y1, edges[bit]:edges[bit + 1]] = value
+    cv2.putText(frame, lab + ' ' + str(frame_idx), (width // 4, height // 4), cv2.FONT_HERSHEY_SIMPLEX,
+                height / 360, (255, 255, 255), max(1, height // 240))
+    return frame
+
+
+def decode_frame_indices(combined_frame, layout):
+    """
+    Reads the frame indices of the Mordor and Gondor frames shown on a combined frame.
+
+    :param combined_frame:  Cv2 frame, combined frame.
+    :param layout:          Dict, layout of the combined frame, see frame_layout.compute_layout.
+    :return: indices:       Tuple of ints (Mordor, Gondor).
+    """
+    src_w, src_h = layout['src_size']
+    panel_h = layout['panel_size'][1]
+    crop_x0, scale = layout['crop_x'][0], layout['scale']
+    edges = _code_block_edges(src_w)
+    centers = (edges[:-1] + edges[1:]) / 2
+    y = int(round((FRAME_CODE_Y[0] + FRAME_CODE_Y[1]) / 2 * src_h * scale))
+    y = min(y, panel_h - 1)
+    gray = combined_frame.mean(axis=2)
+    indices = []
+    for panel_x in layout['panel_x']:
+        xs = (panel_x + (centers - crop_x0) * scale).round().astype(int)
+        bits = gray[y, xs] > 127
+        indices.append(int(sum(1 << (FRAME_CODE_BITS - 1 - bit) for bit in range(FRAME_CODE_BITS) if bits[bit])))
+    return tuple(indices)
+
+
+def capture_times(duration, fps, jitter, drop_rate, offset, rng):
+    """
+    Generates the frame capture timestamps of one synthetic recording.
+
+    :param duration:   Float, recording length in seconds.
+    :param fps:        Float, nominal frame rate.
+    :param jitter:     Float, std of the gaussian timestamp jitter in seconds.
+    :param drop_rate:  Float, probability of a capture tick without a frame (dropped frame).
+    :param offset:     Float, start offset of the recording in seconds.
+    :param rng:        Numpy random Generator.
+    :return: times:    1D numpy array of increasing timestamps, one per recorded frame.
+    """
+    ticks = np.arange(int(round(duration * fps)))
+    kept = ticks[rng.random(ticks.size) >= drop_rate]
+    times = SHARED_START_TIME + CAPTURE_DELAY_S + offset + kept / fps + rng.normal(0, jitter, kept.size)
+    # jitter must not reorder frames
+    return np.maximum.accumulate(times)
+
+
+def make_pair(root, pair_no, session='freeConv', width=1920, height=1080, duration=10.0, fps=30.0, jitter=0.002,
+              drop_rate=0.0, offsets=(0.0, 0.005), seed=0):
+    """
+    Writes a synthetic Mordor / Gondor recording pair (videos and timestamp .mat files) under root, see the module
+    docstring.
+
+    :param root:       Path to the data folder, the pair folder is created in it.
+    :param pair_no:    Int, pair number.
+    :param session:    Str, session name. Defaults to 'freeConv'.
+    :param width:      Int, video width. Defaults to 1920.
+    :param height:     Int, video height. Defaults to 1080.
+    :param duration:   Float, recording length in seconds. Defaults to 10.
+    :param fps:        Float, nominal frame rate. Defaults to 30.
+    :param jitter:     Float, std of the timestamp jitter in seconds. Defaults to 0.002.
+    :param drop_rate:  Float, probability of dropped frames. Defaults to 0.
+    :param offsets:    Tuple of floats, start offsets (Mordor, Gondor) in seconds. Defaults to (0, 0.005).
+    :param seed:       Int, random seed. Defaults to 0.
+    :return: fixture:  Dict with "lab: {'video': path, 'times_mat': path, 'frame_times': array}" pairs,
+                       lab is 'Mordor' or 'Gondor'.
+    """
+    rng = np.random.default_rng(seed)
+    fixture = {}
+    for lab, offset in zip(('Mordor', 'Gondor'), offsets):
+        lab_dir = os.path.join(root, 'pair' + str(pair_no), 'pair' + str(pair_no) + '_' + lab + '_behav')
+        os.makedirs(lab_dir, exist_ok=True)
+        prefix = os.path.join(lab_dir, 'pair' + str(pair_no) + '_' + lab + '_' + session)
+        frame_times = capture_times(duration, fps, jitter, drop_rate, offset, rng)
+        writer = cv2.VideoWriter(prefix + '.mov', cv2.VideoWriter.fourcc('m', 'p', '4', 'v'), fps, (width, height))
+        for frame_idx in range(frame_times.size):
+            writer.write(draw_frame(frame_idx, width, height, lab))
+        writer.release()
+        sio.savemat(prefix + '_times.mat', {'sharedStartTime': SHARED_START_TIME,
+                                            'stopCaptureTime': frame_times[-1] + 1 / fps,
+                                            'frameCaptTime': np.append(frame_times, np.nan)})
+        fixture[lab] = {'video': prefix + '.mov', 'times_mat': prefix + '_times.mat', 'frame_times': frame_times}
+    return fixture
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('root', help='Path to the data folder for the synthetic pair')
+    parser.add_argument('pair_no', type=int, help='Pair number')
+    parser.add_argument('--session', type=str, default='freeConv', help='Session name. Defaults to freeConv.')
+    parser.add_argument('--width', type=int, default=1920, help='Video width. Defaults to 1920.')
+    parser.add_argument('--height', type=int, default=1080, help='Video height. Defaults to 1080.')
+    parser.add_argument('--duration', type=float, default=10.0, help='Recording length in secs. Defaults to 10.')
+    parser.add_argument('--fps', type=float, default=30.0, help='Nominal frame rate. Defaults to 30.')
+    parser.add_argument('--jitter', type=float, default=0.002, help='Timestamp jitter std in secs. Defaults to 0.002.')
+    parser.add_argument('--drop_rate', type=float, default=0.0, help='Probability of dropped frames. Defaults to 0.')
+    parser.add_argument('--offset', type=float, default=0.005,
+                        help='Start offset of the Gondor recording relative to Mordor, in secs. Defaults to 0.005.')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed. Defaults to 0.')
+    args = parser.parse_args()
+
+    pair = make_pair(args.root, args.pair_no, session=args.session, width=args.width, height=args.height,
+                     duration=args.duration, fps=args.fps, jitter=args.jitter, drop_rate=args.drop_rate,
+                     offsets=(0.0, args.offset), seed=args.seed)
+    for lab_name, files in pair.items():
+        print(lab_name + ':', files['video'], '-', files['frame_times'].size, 'frames;', files['times_mat'])
@@ -0,0 +1,203 @@
+"""
+CommGame project tools for subsequent video rater task.
+
+Python replacement of combine_audio.m: combines the two (Mordor and Gondor) repaired mono audio recordings of a session
+into one stereo track, aligned to the combined video (combine_videos.py), and muxes it into the combined video.
+
+USAGE: python3 combine_audio.py INPUT_DIR PAIR_NO [SESSION] [--silent_time SECS] [--no_mux]
+
+Input args:
+- INPUT_DIR:     Path to folder containing the pair-level data, including the combined video and its start times
+                 (output of combine_videos.py). The folder is globbed recursively for the audio files.
+- PAIR_NO:       Pair number.
+- SESSION:       Session name. Defaults to freeConv.
+- --silent_time: Extra padding with silence at the beginning of the combined audio, to account for audio-to-video
+                 delay, in seconds (0 - 2). Defaults to 0.
+- --no_mux:      Only write the combined audio file, do not mux it into the combined video.
+
+Outputs:
+- Combined stereo audio (left: Mordor, right: Gondor) at:
+    [INPUT_DIR]/pair[PAIR_NO]_[SESSION]_combined_audio_padded[SILENT_TIME * 1000].wav
+- The combined video, with the combined audio as its audio stream (replaced in place):
+    [INPUT_DIR]/pair[PAIR_NO]_[SESSION]_combined_video.mp4
+
+Notes:
+- The repaired mono recordings (e.g. pair99_Mordor_freeConv_repaired_mono.wav, outputs of audioRepair.m in the
+  commgame_transcripts repo) are aligned to the shared start time (sharedStartTime). Both are trimmed by
+  round(rel_start * sample rate) samples, where rel_start is the start of the combined video relative to the shared
+  start time (see combine_videos.save_start_times), then cut to the shorter one. combine_audio.m indexes from sample
+  round(rel_start * sample rate) in 1-based MATLAB indexing, that is, keeps one more sample at the start.
+- The recordings are memory-mapped and the combined audio is written in blocks (see wav_reader.py), so memory use
+  does not depend on the recording length.
+- Muxing needs an ffmpeg executable on the PATH. The video stream is copied, not re-encoded.
+- Combining the videos and the audio in one run: combine_videos.py --audio.
+
+"""
+
+import argparse
+import glob
+import os
+import shutil
+import subprocess
+import tempfile
+
+import numpy as np
+
+from wav_reader import WavFile, write_wav_blocks
+
+
+# Expected sampling rate of the repaired mono recordings, and the allowed deviation from it, in Hz.
+AUDIO_SR = 44100
+AUDIO_SR_TOL = 0.01
+# Maximal padding with silence, in seconds (larger values are probably a mistake).
+MAX_SILENT_TIME = 2
+# Encoder settings for the audio stream of the combined video.
+AUDIO_CODEC = 'aac'
+AUDIO_BITRATE = '192k'
+
+
+def find_audio_files(input_dir, pair_no, session='freeConv'):
+    """
+    Finds the repaired mono audio files of a pair and session.
+
+    :param input_dir:  Path to folder containing pair-level data, globbed recursively.
+    :param pair_no:    Numeric value, pair number.
+    :param session:    Str, session name. Defaults to 'freeConv'.
+    :return: wav_m:    Path to the Mordor wav file.
+    :return: wav_g:    Path to the Gondor wav file.
+    """
+    wav_files = []
+    for lab in ('Mordor', 'Gondor'):
+        matches = glob.glob(os.path.join(input_dir, '**', 'pair' + str(pair_no) + '_' + lab + '_' + session +
+                                         '_repaired_mono.wav'), recursive=True)
+        if not matches:
+            raise FileNotFoundError('Cannot find the ' + lab + ' repaired mono wav file for pair ' + str(pair_no) +
+                                    ', session ' + session + ' under ' + input_dir + '!')
+        wav_files.append(matches[0])
+    return tuple(wav_files)
+
+
+def _open_checked(wav_file):
+    wav = WavFile(wav_file)
+    if abs(wav.sample_rate - AUDIO_SR) >= AUDIO_SR_TOL:
+        raise ValueError('Unexpected sampling rate (' + str(wav.sample_rate) + ' Hz) in audio at ' + wav_file + '!')
+    return wav
+
+
+def combine_audio(wav_files, rel_start, output_path, silent_time=0):
+    """
+    Trims the two mono recordings to the start of the combined video, cuts them to the shorter one and saves them as
+    one stereo track (left: Mordor, right: Gondor), optionally padded with silence at the beginning.
+
+    :param wav_files:    Tuple of paths (Mordor wav, Gondor wav).
+    :param rel_start:    Numeric value, start of the combined video relative to the shared start time, in seconds
+                         (rel_start output of combine_videos.combine_frames).
+    :param output_path:  Path to the output wav file.
+    :param silent_time:  Numeric value, padding with silence at the beginning, in seconds. Defaults to 0.
+    :return: duration:   Float, length of the combined audio, in seconds.
+    """
+    if not 0 <= silent_time <= MAX_SILENT_TIME:
+        raise ValueError('Unrealistic padding, probably a mistake! Keep it between 0 and ' + str(MAX_SILENT_TIME) +
+                         ' seconds!')
+    with _open_checked(wav_files[0]) as wav_m, _open_checked(wav_files[1]) as wav_g:
+        if wav_m.dtype != wav_g.dtype:
+            raise ValueError('Sample formats of the Mordor and Gondor audio do not match!')
+        sr = wav_m.sample_rate
+        start = int(round(rel_start * sr))
+        if start < 0:
+            raise ValueError('Combined video starts before the audio recordings (rel_start: ' + str(rel_start) + ')!')
+        length = min(wav_m.frames, wav_g.frames) - start
+        if length <= 0:
+            raise ValueError('Audio recordings end before the start of the combined video!')
+        # first channels only, as in combine_audio.m; zero-copy views of the memory-mapped recordings
+        channels = [wav_m.samples(start, start + length), wav_g.samples(start, start + length)]
+        frames = write_wav_blocks(output_path, channels, sr, padding=int(round(silent_time * sr)))
+    print('Combined audio (' + str(round(frames / sr, 2)) + ' s, padded with', silent_time,
+          's of silence) saved out to:', output_path)
+    return frames / sr
+
+
+def mux_audio(video_path, audio_path, output_path=None, ffmpeg=None):
+    """
+    Muxes an audio file into a video file with ffmpeg, as its only audio stream. The video stream is copied.
+
+    :param video_path:   Path to the video file.
+    :param audio_path:   Path to the audio file.
+    :param output_path:  Path to the output video file. Defaults to None, meaning that video_path is replaced.
+    :param ffmpeg:       Path to the ffmpeg executable. Defaults to None, meaning 'ffmpeg' on the PATH.
+    :return: output_path: Str, path to the output video file.
+    """
+    if ffmpeg is None:
+        ffmpeg = shutil.which('ffmpeg')
+        if ffmpeg is None:
+            raise RuntimeError('Cannot find ffmpeg on the PATH, needed for muxing the audio!')
+    if output_path is None:
+        output_path = video_path
+    # write to a temporary file first, the output might be the input video
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(output_path)), suffix='.mp4')
+    os.close(fd)
+    try:
+        cmd = [ffmpeg, '-y', '-loglevel', 'error', '-i', video_path, '-i', audio_path,
+               '-map', '0:v:0', '-map', '1:a:0', '-c:v', 'copy', '-c:a', AUDIO_CODEC, '-b:a', AUDIO_BITRATE,
+               tmp_path]
+        subprocess.run(cmd, check=True)
+        os.replace(tmp_path, output_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    print('Combined audio muxed into:', output_path)
+    return output_path
+
+
+def combine_and_mux(input_dir, pair_no, rel_start, video_path, session='freeConv', silent_time=0, output_dir=None,
+                    wav_files=None, mux=True):
+    """
+    Combines the audio of a pair and session (combine_audio) and muxes it into the combined video (mux_audio).
+
+    :param input_dir:    Path to folder containing pair-level data, globbed recursively for the audio files.
+    :param pair_no:      Numeric value, pair number.
+    :param rel_start:    Numeric value, start of the combined video relative to the shared start time, in seconds.
+    :param video_path:   Path to the combined video.
+    :param session:      Str, session name. Defaults to 'freeConv'.
+    :param silent_time:  Numeric value, padding with silence at the beginning, in seconds. Defaults to 0.
+    :param output_dir:   Path to folder for the combined audio. Defaults to None, meaning input_dir.
+    :param wav_files:    Tuple of paths (Mordor wav, Gondor wav). Defaults to None, meaning input_dir is globbed.
+    :param mux:          Boolean flag, if False, the combined audio is not muxed into the video. Defaults to True.
+    :return: audio_path: Str, path to the combined audio file.
+    """
+    if wav_files is None:
+        wav_files = find_audio_files(input_dir, pair_no, session)
+    print('\nFound audio files:')
+    print(wav_files[0])
+    print(wav_files[1])
+    if output_dir is None:
+        output_dir = input_dir
+    audio_path = os.path.join(output_dir, 'pair' + str(pair_no) + '_' + session + '_combined_audio_padded' +
+                              str(int(round(silent_time * 1000))) + '.wav')
+    combine_audio(wav_files, rel_start, audio_path, silent_time)
+    if mux:
+        mux_audio(video_path, audio_path)
+    return audio_path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('input_dir', help='Path to the dir containing the audio files and the combined video')
+    parser.add_argument('pair_no', type=int, help='Pair number (between 1-999)')
+    parser.add_argument('session', type=str, nargs='?', default='freeConv',
+                        help='Name of the recording session. Defaults to freeConv.')
+    parser.add_argument('--silent_time', type=float, default=0,
+                        help='Padding with silence at the beginning of the combined audio, in secs. Defaults to 0.')
+    parser.add_argument('--no_mux', action='store_true',
+                        help='Only write the combined audio file, do not mux it into the combined video.')
+    args = parser.parse_args()
+
+    start_file = os.path.join(args.input_dir, 'pair' + str(args.pair_no) + '_' + args.session +
+                              '_combined_video_start.npz')
+    with np.load(start_file) as start_times:
+        relative_start_t = float(start_times['rel_start'])
+    combined_video = os.path.join(args.input_dir, 'pair' + str(args.pair_no) + '_' + args.session +
+                                  '_combined_video.mp4')
+    combine_and_mux(args.input_dir, args.pair_no, relative_start_t, combined_video, session=args.session,
+                    silent_time=args.silent_time, mux=not args.no_mux)
+    print('\nAu revoir, adios, ha det bra, cheerios!')
@@ -0,0 +1,116 @@
+"""
+CommGame project tools for subsequent video rater task.
+
+Alignment plans for combine_videos.py: the result of the planning stage of combine_frames (combine_videos.
+plan_combination), which only reads the timestamp .mat files and probes the video containers, without decoding any
+video. A plan holds the alignment decision, the starting frames, the frame schedule (pair table, for the accurate
+alignment), the expected output length and the absolute / shared / relative start times of a pair and session.
+
+Plans are saved out to json files (combine_videos.py --plan, batch_combine_videos.py --plan):
+    [OUTPUT_DIR]/pair[PAIR_NO]_[SESSION]_combined_video_plan.json
+and can be fed back into the real run (combine_frames(plan=...), combine_videos.py --from_plan, batch_combine_videos.py
+--use_plans), which then skips the planning stage. A plan records the path, size and modification time of its input
+files (videos and .mat files), and is refused (check_plan) if any of them changed, or if it was made for another pair,
+session, starting frame or alignment method.
+
+The plan table (PLAN_TABLE_FIELDS) has one row per pair and session, for checking a batch before combining.
+
+"""
+
+import csv
+import json
+import os
+
+import numpy as np
+
+
+# Suffix of plan files, after pair[PAIR_NO]_[SESSION].
+PLAN_FILE_SUFFIX = '_combined_video_plan.json'
+# Columns of the plan table.
+PLAN_TABLE_FIELDS = ['pair_no', 'session', 'alignment', 'realigned', 'start_diff_ms', 'start_frame_m', 'start_frame_g',
+                     'frame_count_m', 'frame_count_g', 'fps', 'width', 'height', 'output_frames', 'duration_s',
+                     'absolute_start', 'shared_start', 'rel_start']
+
+
+def plan_path(output_dir, pair_no, session):
+    """
+    Path of the plan file of a pair and session.
+    """
+    return os.path.join(output_dir, 'pair' + str(pair_no) + '_' + session + PLAN_FILE_SUFFIX)
+
+
+def file_key(path):
+    """
+    Returns [absolute path, size, modification time (ns)] of an input file, for detecting changed inputs.
+    """
+    stat = os.stat(path)
+    return [os.path.abspath(path), stat.st_size, stat.st_mtime_ns]
+
+
+def save_plan(plan, path):
+    """
+    Saves out a plan (see combine_videos.plan_combination) to a json file.
+    """
+    record = dict(plan)
+    if record['frame_schedule'] is not None:
+        record['frame_schedule'] = np.asarray(record['frame_schedule']).tolist()
+    with open(path, 'w') as f:
+        json.dump(record, f)
+    return path
+
+
+def load_plan(path):
+    """
+    Loads a plan saved out with save_plan. The frame schedule (if any) is returned as an (N, 2) int array.
+    """
+    with open(path) as f:
+        plan = json.load(f)
+    if plan['frame_schedule'] is not None:
+        plan['frame_schedule'] = np.asarray(plan['frame_schedule'], dtype=np.int64).reshape(-1, 2)
+    return plan
+
+
+def check_plan(plan, pair_no, session, start_frame, alignment=None):
+    """
+    Raises ValueError if a plan cannot be used for combining pair_no and session: it was made for another pair,
+    session, starting frame or alignment method (alignment None accepts the plan's own), or one of its input files
+    changed since planning.
+    """
+    expected = {'pair_no': int(pair_no), 'session': session, 'start_frame': int(start_frame)}
+    if alignment is not None:
+        expected['alignment'] = alignment
+    for key, value in expected.items():
+        if plan[key] != value:
+            raise ValueError('Plan was made for ' + key + '=' + str(plan[key]) + ', not ' + str(value) + '!')
+    for key in plan['inputs']:
+        if not os.path.exists(key[0]) or file_key(key[0]) != key:
+            raise ValueError('Input file ' + key[0] + ' changed since planning, plan again!')
+
+
+def plan_row(plan):
+    """
+    Returns the plan table row (PLAN_TABLE_FIELDS) of a plan.
+    """
+    row = {field: plan.get(field, '') for field in PLAN_TABLE_FIELDS}
+    row['start_diff_ms'] = round(1000 * plan['start_diff_s'], 2)
+    row['frame_count_m'], row['frame_count_g'] = plan['frame_counts']
+    row['duration_s'] = round(plan['output_frames'] / plan['fps'], 2) if plan['fps'] else ''
+    return row
+
+
+def write_plan_table(rows, table_path=None):
+    """
+    Prints the plan table and saves it out to a csv file, if table_path is given.
+    """
+    fields = PLAN_TABLE_FIELDS[:-3] + ['rel_start']
+    print('\nPlan:')
+    print('\t'.join(fields))
+    for row in rows:
+        print('\t'.join(str(row[field]) for field in fields))
+    if table_path is not None:
+        with open(table_path, 'w', newline='') as f:
+            # plus any extra columns of the rows (e.g. errors of batch_combine_videos.py)
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]) if rows else PLAN_TABLE_FIELDS)
+            writer.writeheader()
+            writer.writerows(rows)
+        print('\nPlan table saved out to', table_path)
@@ -1,20 +1,90 @@
 """
 CommGame project tools for subsequent video rater task.
 
-Utility to combine videos from a CommGame freeConv task into one, combined video. The combined video shows
+Utility to combine videos from a CommGame freeConv or BG task into one, combined video. The combined video shows
 corresponding frames from source videos next to each other, on the same frame.
 
-USAGE: python3 combine_videos.py INPUT_DIR PAIR_NO SESSION
+USAGE: python3 combine_videos.py INPUT_DIR PAIR_NO SESSION [--workers N] [--output_size W H] [--slow_frame_count]
+                                [--seek {grab,seek}] [--verify_seek]
+                                [--encoder {opencv,ffmpeg}] [--codec C] [--preset P] [--crf N] [--encoder_threads N]
+                                [--segments SEGMENTS_FILE] [--segments_only] [--chunk_frames N] [--keep_chunks]
+                                [--processes N] [--preview] [--metrics FILE] [--profile]
+                                [--proxy {also,only}] [--proxy_size W H] [--proxy_fps FPS]
+                                [--geometry {full,compact}] [--info_strip H] [--audio] [--silent_time SECS]
+                                [--engine {python,ffmpeg}] [--frame_format {bgr,yuv420p}] [--compose_processes N]
+                                [--plan] [--from_plan PLAN_FILE] [--no_provenance]
 
 Input args:
 - INPUT_DIR:  Path to folder containing relevant videos for PAIR_NO and SESSION. The folder is globbed recursively.
 - PAIR_NO:    Pair number.
-- SESSION:    Name of the session the videos of which to combine. Defaults to freeConv, as other videos do not
-              work yet (resolutions are not handled dynamically, relevant parameters are hardcoded).
+- SESSION:    Name of the session the videos of which to combine (BG1, ... BG9, freeConv, playback).
+- --output_size: Resolution (width height) of the combined video. Defaults to the resolution of the source videos
+              (1920 * 1080 for freeConv, 1280 * 720 for BG sessions).
+- --slow_frame_count: Exact frame counts (container packet index, cached in [VIDEO].probe.json sidecar files).
+- --seek:     Method for positioning the videos at their starting frames (grab or seek), see frame_pipeline.py.
+              Defaults to grab, or to seek with --processes or --frame_format yuv420p. Seeking lands on frames
+              confirmed by their pts (ffprobe).
+- --verify_seek: Check the landed starting frames against decoded reference frames (not with --processes).
+- --encoder:  Encoder backend, opencv (cv2.VideoWriter with mp4v, default) or ffmpeg (frames piped to ffmpeg, with
+              configurable --codec, --preset, --crf and --encoder_threads), see video_writers.py.
+- --segments: Path to a segments file (e.g. segmentation_points_5parts.txt, lines like "1 00:00:00 00:03:00"). The
+              segments are written in the same pass as the combined video, with frame-exact boundaries.
+- --segments_only: Only write the segments, not the full combined video.
+- --chunk_frames: Resumable, chunked mode: the combined video is written in chunks of N frames with a checkpoint
+              manifest, and a restarted run resumes from the last complete chunk (see video_chunks.py).
+- --keep_chunks: Keep the chunk files after concatenating them into the combined video (--chunk_frames or
+              --processes).
+- --processes: Chunk-parallel mode: the aligned frame range is split into N contiguous chunks, combined and encoded
+              in N worker processes, then concatenated losslessly (needs ffmpeg).
+- --preview:  Show the combined frames in a window while combining, pressing 'q' in the window stops (see
+              frame_preview.py). Combining runs headless otherwise.
+- --metrics:  Path to a JSON lines file ('-' for stdout) for progress records (frames / sec, ETA, peak RSS, per-stage
+              frame times) and a summary at the end, see run_metrics.py.
+- --proxy:    Low-resolution proxy video (e.g. for checking sync and content), alongside the full combined video
+              ('also') or instead of it ('only'). With 'only', frames are downscaled right in the composition (from the
+              visible source columns) and skipped frames are not decoded, so it takes a fraction of the full run time.
+- --proxy_size: Resolution (width height) of the proxy video (in the 'full' geometry). Defaults to 640 * 360.
+- --geometry: Output frame geometry, full (default, the output size with black rows below the panels) or compact (only
+              the panel rows, e.g. 1920 * 676 for 1080p, fewer pixels to encode), see frame_layout.py.
+- --info_strip: Height (pixels) of an info strip below the panels, with pair, session and panel labels.
+- --proxy_fps: Frame rate of the proxy video, rounded to a whole fraction of the source frame rate. Defaults to 15.
+- --audio:    Combine the repaired mono audio recordings of the session into a stereo track aligned to the combined
+              video and mux it into the combined video, in the same run (see combine_audio.py, needs ffmpeg).
+- --silent_time: Padding with silence at the beginning of the combined audio, in seconds, see combine_audio.py.
+- --engine:   Combination engine, python (default, frames are decoded, composed and encoded in the Python frame loop)
+              or ffmpeg (the alignment and the layout are translated into one ffmpeg filtergraph, run as a single
+              subprocess, see ffmpeg_engine.py). The ffmpeg engine takes the --codec, --preset, --crf and
+              --encoder_threads options, and cannot be combined with --segments, --chunk_frames, --processes,
+              --proxy also or --preview.
+- --frame_format: Pixel format of the Python composition path, bgr (default, cv2 decoding and composition) or yuv420p
+              (frames are decoded, composed and encoded as planar yuv420p, without BGR conversions, see frame_yuv.py).
+              yuv420p needs --encoder ffmpeg, and cannot be combined with --proxy also or --preview.
+- --compose_processes: Process-based composition: reader processes decode both videos into shared memory frame rings,
+              N worker processes compose the frames in place, frames are not pickled between processes (see
+              frame_shm.py). Cannot be combined with --processes.
+- --plan:     Dry run: only the planning stage runs (timestamps, container probing, alignment, no decoding), the plan
+              (alignment decision, starting frames, expected output length, start times) is printed and saved out, see
+              combine_plan.py. For all pairs and sessions of a data tree, see batch_combine_videos.py --plan.
+- --from_plan: Path to a plan file from an earlier --plan run, the planning stage is skipped. Refused if the input files
+              changed since planning.
+- --no_provenance: Do not write the per-output-frame provenance table (see Outputs).
+- --profile:  Print a per-stage histogram of frame times (decode Mordor, decode Gondor, compose, encode) at the end.
 
 Outputs:
 - The combined video is saved out to an mp4 file at:
     [INPUT_DIR]/pair[PAIR_NO]_[SESSION]_combined_video.mp4
+- If --audio is set, the combined audio is saved out to a wav file and muxed into the combined video:
+    [INPUT_DIR]/pair[PAIR_NO]_[SESSION]_combined_audio_padded[SILENT_TIME * 1000].wav
+- If --plan is set, nothing else is written but the plan file:
+    [INPUT_DIR]/pair[PAIR_NO]_[SESSION]_combined_video_plan.json
+- If --proxy is set, the proxy video is saved out to an mp4 file at:
+    [INPUT_DIR]/pair[PAIR_NO]_[SESSION]_combined_video_proxy.mp4
+- If --segments is set, segments are saved out to mp4 files at:
+    [INPUT_DIR]/pair[PAIR_NO]_[SESSION]_combined_video_seg[SEGMENT_NO].mp4
+- The provenance table (output frame index, Mordor and Gondor frame indices, their frameCaptTime values and the
+  residual offset between them, one record per output frame) is saved out to a memory-mappable npy file at:
+    [INPUT_DIR]/pair[PAIR_NO]_[SESSION]_combined_video_frames.npy
+  (_combined_video_proxy_frames.npy with --proxy only), see frame_provenance.py.
 - Important timestamps are saved out to a npz (numpy) and to a mat file at:
     [INPUT_DIR]/pair[PAIR_NO]_[SESSION]_combined_video_start.npz
     [INPUT_DIR]/pair[PAIR_NO]_[SESSION]_combined_video_start.mat
@@ -29,9 +99,14 @@ Outputs:
 
 Notes:
 - Uses glob to find the two (Mordor and Gondor lab) .mov files for a given pair and session.
+- For combining all pairs and sessions under a data tree, see batch_combine_videos.py.
+- Segments are cut from the frame stream (see video_writers.SegmentWriter), so the full combined video is not read
+  again, and segment boundaries are not snapped to keyframes as with the stream-copy cuts of video_segmentation.
 - Videos are only combined from the "n"th frame on, because frame capture timestamps are variable (jitter) for the
   first few frames, probably due to an initial period needed for stable frame rate. "n" is defined as a constant
   (VIDEO_START_FRAME).
+- Combining runs headless. SIGINT (Ctrl+C) or SIGTERM stops it after the current frame, with the output written so
+  far finalised cleanly (see run_control.py). In --chunk_frames mode, a stopped run can be resumed.
 - Timestamps are extracted from relevant .mat files ("frameCaptTime", "sharedStartTime", "stopCaptureTime").
 - If there is a discrepancy across the timestamps of the "n"th video frames, an adjustment is made,
   so that corresponding frames are found (details in combine_frames function).
@@ -45,18 +120,46 @@ import glob
 import argparse
 import sys
 import os
+import itertools
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from combine_audio import combine_and_mux
+from combine_plan import plan_path, file_key, save_plan, load_plan, check_plan, plan_row, write_plan_table
+from ffmpeg_engine import combine_ffmpeg, schedule_start_frames
+from frame_layout import compute_layout, draw_info_strip, GEOMETRIES
+from frame_pairing import nearest_frame_indices, pair_frame_indices
+from frame_preview import FramePreview
+from frame_provenance import provenance_path, ProvenanceWriter
+from frame_shm import shm_composed_frames
+from frame_yuv import open_capture, YUVFrameComposer, FRAME_FORMATS
+from frame_pipeline import sequential_frames, threaded_frames, compose_frames, seek_video, verify_seek
+from run_control import StopOnSignals, child_signals
+from run_metrics import RunMetrics
+from video_probe import probe_video, probe_frame_pts, check_frame_count
+from video_times import load_video_times
+from video_chunks import chunk_dir_for, chunk_path, concat_chunks, resume_manifest, ChunkedWriter
+from video_writers import (open_writer, parse_segments_file, SegmentWriter, TeeWriter, ProxyWriter,
+                           ENCODER_BACKENDS)
 
 
 # Videos are combined from this frame on.
 VIDEO_START_FRAME = 10
-# Video frame resolution constants.
+# Video frame resolution constants, default for FrameComposer (the resolution of freeConv videos).
 VIDEO_H = 1080
 VIDEO_W = 1920
+# Default resolution and frame rate of proxy videos.
+PROXY_SIZE = (640, 360)
+PROXY_FPS = 15
 # Tolerance for frame capture time discrepancies, see function combine_frames for details.
 CAPTURE_TIME_TOL_S = 0.02
+# Combination engines, see function combine_frames.
+ENGINES = ('python', 'ffmpeg')
+# Chunk-parallel mode: interval (secs) for checking stop requests while waiting for the chunk processes.
+CHUNK_POLL_SECS = 0.5
 
 
-def extract_video_times_mat(input_dir, pair_no, session):
+def extract_video_times_mat(input_dir, pair_no, session, times_files=None, use_cache=True):
     """
     Searches for .mat files containing sharedStartTime and other timestamps for given pair and session,
     then extracts timestamps and returns them in a dict.
@@ -64,6 +167,10 @@ def extract_video_times_mat(input_dir, pair_no, session):
     :param input_dir: Path to directory containing behavioral data. The script uses glob recursively to find .mat file.
     :param pair_no: Int, pair number
     :param session: Str, one of ['BG1', 'BG2', 'BG3', ..., 'BG9', 'freeConv', 'playback']
+    :param times_files: Tuple of paths (Mordor .mat, Gondor .mat). If supplied, input_dir is not globbed.
+                        Defaults to None.
+    :param use_cache:   Boolean flag for using the timestamp cache sidecar files ([MAT].cache.npz) written next to the
+                        .mat files, see video_times.py. Defaults to True.
 
     :return: timestamps:  Dictionary with the following "key: value" pairs:
         start_time_m: Float, timestamp of task (recording) start, for Mordor lab recording
@@ -72,29 +179,26 @@ def extract_video_times_mat(input_dir, pair_no, session):
         start_time_g: Float, timestamp of task (recording) start, for Gondor lab recording
         stop_time_g: Float, timestamp of task (recording) end, for Gondor lab recording
         frame_times_g: Numpy array of frame capture timestamps, for Gondor lab recording
+        times_files: Tuple of paths (Mordor .mat, Gondor .mat) the timestamps were extracted from
 
     (not returned anymore as earlier data misses it, and is not crucial: "vidcaptureStartTime" var from .mat files)
     """
 
     timestamps = {}
-    # look for either **_times.mat or **_videoTimes.mat
-    times_mat = glob.glob(f'{input_dir}/**/pair{pair_no}_Mordor_behav/pair{pair_no}_Mordor_{session}_**imes.mat',
-                          recursive=True)[0]
-    video_times = sio.loadmat(times_mat)
-    timestamps['start_time_m'] = float(video_times['sharedStartTime'].flatten())
-    timestamps['stop_time_m'] = float(video_times['stopCaptureTime'].flatten())
-    # timestamps['start_time_capture_m'] = float(video_times['vidcaptureStartTime'].flatten())
-    frame_times_m = video_times['frameCaptTime'].flatten()
-    timestamps['frame_times_m'] = frame_times_m[np.logical_not(np.isnan(frame_times_m))]
-
-    times_mat = glob.glob(f'{input_dir}/**/pair{pair_no}_Gondor_behav/pair{pair_no}_Gondor_{session}_**imes.mat',
-                          recursive=True)[0]
-    video_times = sio.loadmat(times_mat)
-    timestamps['start_time_g'] = float(video_times['sharedStartTime'].flatten())
-    timestamps['stop_time_g'] = float(video_times['stopCaptureTime'].flatten())
-    # timestamps['start_time_capture_g'] = float(video_times['vidcaptureStartTime'].flatten())
-    frame_times_g = video_times['frameCaptTime'].flatten()
-    timestamps['frame_times_g'] = frame_times_g[np.logical_not(np.isnan(frame_times_g))]
+    # look for either **_times.mat or **_videoTimes.mat, for both labs in one walk
+    if times_files is None:
+        found = glob.glob(f'{input_dir}/**/pair{pair_no}_*_behav/pair{pair_no}_*_{session}_**imes.mat', recursive=True)
+        times_files = tuple([path for path in found
+                             if os.path.basename(os.path.dirname(path)) == f'pair{pair_no}_{lab}_behav'
+                             and os.path.basename(path).startswith(f'pair{pair_no}_{lab}_{session}_')][0]
+                            for lab in ('Mordor', 'Gondor'))
+    # only the needed variables are loaded, NaN-filtered values are cached next to the .mat files (see video_times.py)
+    for times_mat, lab in zip(times_files, ('m', 'g')):
+        video_times = load_video_times(times_mat, use_cache=use_cache)
+        timestamps['start_time_' + lab] = video_times['start_time']
+        timestamps['stop_time_' + lab] = video_times['stop_time']
+        timestamps['frame_times_' + lab] = video_times['frame_times']
+    timestamps['times_files'] = tuple(times_files)
 
     return timestamps
 
@@ -104,7 +208,8 @@ def count_frames_accurate(video_file):
     Function to loop through each frame in a video, in order to get an exact frame count.
     Other (quicker) methods are generally less reliable and might return an erroneous count.
 
-    VERY SLOW!
+    VERY SLOW! Decodes every frame. Kept as a reference for troubleshooting, combine_frames uses the (cached) packet
+    count from video_probe.probe_video instead.
 
     :param video_file: Path to video file.
     :return: total:    Frame count.
@@ -129,34 +234,92 @@ def count_frames_accurate(video_file):
     return total
 
 
+class FrameComposer:
+    """
+    Combines two frames onto one output frame, according to a layout from frame_layout.compute_layout. With the
+    default layout (1920 * 1080 source and output) this is the layout of the original frame_connect: the upper 675
+    pixels of a 1920 * 1080 frame are filled with the two source frames side-by-side (left and right), 10-10% from the
+    left and right sides of the source frames are cut.
+
+    The composer owns a reusable output frame (canvas), its black part is only zeroed once. The source frames are
+    cropped to the visible columns before resizing, so that only the visible part is resampled, and the resized
+    pixels are written directly into the canvas (dst= views), without intermediate buffers.
+
+    If the layout has an info strip, info_text is drawn on it once per canvas.
+
+    SOURCE FRAME RESOLUTION IS NOT CHECKED, IT MUST MATCH layout['src_size']!
+    """
+
+    def __init__(self, layout=None, info_text=None):
+        """
+        :param layout:     Dict, output of frame_layout.compute_layout. Defaults to None, meaning the layout for
+                           VIDEO_W * VIDEO_H source frames and output.
+        :param info_text:  Str, static text for the info strip of the layout (e.g. pair and session). Defaults to None.
+        """
+        if layout is None:
+            layout = compute_layout((VIDEO_W, VIDEO_H))
+        self.layout = layout
+        self.out_w, self.out_h = layout['out_size']
+        self.panel_w, self.panel_h = layout['panel_size']
+        self.panel_x = layout['panel_x']
+        self.crop_x0, self.crop_x1 = layout['crop_x']
+        self.interpolation = layout['interpolation']
+        self.info_y, self.info_h = layout.get('info_strip', (self.panel_h, 0))
+        self.info_text = info_text
+        self.canvas = self.new_canvas()
+
+    def new_canvas(self):
+        """
+        Returns a black (zeroed) output frame, 3D numpy array with dimensions height * width * layers (3), with the info
+        text on the info strip, if any.
+        """
+        canvas = np.zeros((self.out_h, self.out_w, 3), np.uint8)
+        return draw_info_strip(canvas, self.layout, self.info_text)
+
+    def compose(self, frame_left, frame_right, out=None):
+        """
+        :param frame_left:    Cv2 frame, to be used on the left side of the combined frame.
+        :param frame_right:   Cv2 frame, to be used on the right side of the combined frame.
+        :param out:           Output frame to write into, from new_canvas(). Only the panel region is overwritten.
+                              Defaults to None, meaning the composer's own canvas.
+        :return: out:         The combined frame (the composer's canvas, if out was not supplied).
+        """
+        if out is None:
+            out = self.canvas
+        panel_h, panel_w = self.panel_h, self.panel_w
+        for frame, panel_x in ((frame_left, self.panel_x[0]), (frame_right, self.panel_x[1])):
+            cv2.resize(frame[:, self.crop_x0:self.crop_x1], (panel_w, panel_h),
+                       dst=out[0:panel_h, panel_x:panel_x + panel_w], interpolation=self.interpolation)
+        return out
+
+
+# Per-thread composers for frame_connect, keyed by source frame shape.
+_thread_composers = threading.local()
+
+
 def frame_connect(frame_left, frame_right):
     """
-    Two high-def (1920 * 1080) frames (frame_left and frame_right) are resized and combined onto one frame.
-    The resulting frame is also 1920 * 1080, with the upper 675 pixels filled with the two original frames side-by-side
-    (left and right). 10-10% from the left and right sides of the original frames are cut before combining them.
+    Two frames (frame_left and frame_right) are resized and combined onto one frame, of the same resolution as the
+    input frames. For 1920 * 1080 frames, the upper 675 pixels of the result are filled with the two original frames
+    side-by-side (left and right). 10-10% from the left and right sides of the original frames are cut before
+    combining them. See frame_layout.py for the general layout.
 
-    ONLY FOR FRAMES WITH 1920 * 1080 RES! RESOLUTION IS NOT CHECKED!
+    Uses a FrameComposer (one per thread and frame size), so the returned frame is REUSED (overwritten) by the next
+    call from the same thread. Copy it if it needs to be kept.
 
-    :param frame_left:    Cv2 frame, res 1920 * 1080, to be used on the left side of the combined frame.
-    :param frame_right:   Cv2 frame, res 1920 * 1080, to be used on the right side of the combined frame.
+    :param frame_left:    Cv2 frame, to be used on the left side of the combined frame.
+    :param frame_right:   Cv2 frame with the same resolution, to be used on the right side of the combined frame.
     :return: image:       3D numpy array corresponding to the combined frame, with dimensions
-                          height (1080) * width (1920) * layers (3). Uint8 type.
+                          height * width * layers (3), same as the input frames. Uint8 type.
     """
-    # Resolution must be 1920*180!
-    video_h = VIDEO_H
-    video_w = VIDEO_W
-    if video_h != 1080 or video_w != 1920:
-        raise ValueError('Frame resolution is not 1920*180!!!!')
-    # Input frames are first resized to 1200*675 (if input is - as it should be - 1920*1080)
-    frame_l = cv2.resize(frame_left, (int(video_w/8*5), int(video_h/8*5)), interpolation=cv2.INTER_AREA)
-    frame_r = cv2.resize(frame_right, (int(video_w/8*5), int(video_h/8*5)), interpolation=cv2.INTER_AREA)
-    # Create black blank image
-    image = np.zeros((video_h, video_w, 3), np.uint8)
-    # Position the (horizontal) centers of resized input frames on the left and right
-    image[0:int(video_h/8*5), 0:int(960)] = frame_l[:, 120:1080]
-    image[0:int(video_h/8*5), int(960):int(1920)] = frame_r[:, 120:1080]
-
-    return image
+    composers = getattr(_thread_composers, 'composers', None)
+    if composers is None:
+        composers = _thread_composers.composers = {}
+    frame_h, frame_w = frame_left.shape[:2]
+    composer = composers.get((frame_w, frame_h))
+    if composer is None:
+        composer = composers[(frame_w, frame_h)] = FrameComposer(compute_layout((frame_w, frame_h)))
+    return composer.compose(frame_left, frame_right)
 
 
 def frames_alignment(timestamps_m, timestamps_g, start_frame_no):
@@ -167,8 +330,7 @@ def frames_alignment(timestamps_m, timestamps_g, start_frame_no):
     if timestamps_m[start_frame_no] >= timestamps_g[start_frame_no]:
         print('\n', start_frame_no, 'th frame happened later in Mordor.')
         start_frame_m = start_frame_no
-        diffs = np.abs(timestamps_g-timestamps_m[start_frame_m])
-        start_frame_g = np.where(diffs == np.min(diffs))[0][0]
+        start_frame_g = nearest_frame_indices(timestamps_g, timestamps_m[start_frame_m])
         print('Minimum difference is maintained at starting frames:')
         print('Mordor:', start_frame_m, '; timestamp:', timestamps_m[start_frame_m])
         print('Gondor:', start_frame_g, '; timestamp:', timestamps_g[start_frame_g])
@@ -176,8 +338,7 @@ def frames_alignment(timestamps_m, timestamps_g, start_frame_no):
     elif timestamps_m[start_frame_no] < timestamps_g[start_frame_no]:
         print('\n', start_frame_no, 'th frame happened later in Gondor.')
         start_frame_g = start_frame_no
-        diffs = np.abs(timestamps_m-timestamps_g[start_frame_g])
-        start_frame_m = np.where(diffs == np.min(diffs))[0][0]
+        start_frame_m = nearest_frame_indices(timestamps_m, timestamps_g[start_frame_g])
         print('Minimum difference is maintained at starting frames:')
         print('Mordor:', start_frame_m, '; timestamp:', timestamps_m[start_frame_m])
         print('Gondor:', start_frame_g, '; timestamp:', timestamps_g[start_frame_g])
@@ -188,36 +349,267 @@ def frames_alignment(timestamps_m, timestamps_g, start_frame_no):
     return start_frame_m, start_frame_g
 
 
-def combine_frames(input_dir, pair_no, session='freeConv', start_frame=10, slow_frame_count=False):
+def frame_alignment_accurate(timestamps, target_fps=30, start_frame=VIDEO_START_FRAME):
     """
-    Main function that loads timestamps, videos and loops through their corresponding frames, combining them.
+    Helper function to find corresponding frames of two videos on a shared time axis, based on frame capture timestamps.
+    The shared time axis starts at sharedStartTime, with ticks at target_fps, and lasts for the shorter of the two
+    recordings. For each tick, the closest frame from both videos is selected (see frame_pairing.py).
 
-    :param input_dir:        Path to folder containing the video and timestamp files for given pair and session.
-                             glob-ed recursively for relevant files.
-    :param pair_no:          Numeric value, pair number.
-    :param session:          Str, session name. Only support 'freeConv' at the moment! Defaults to 'freeConv'.
-    :param start_frame:      Numeric value, the frame number we start the frame combinations from. Initial frames have
-                             jittery frame capture times, so - by default - we only start video combinations
-                             from this frame on. Defaults to 10.
-    :param slow_frame_count: Boolean flag for using the slow frame-counting method (count_frame_accurate, which loops
-                             through the frames)
+    :param timestamps:   Dict, output of extract_video_times_mat.
+    :param target_fps:   Numeric value, frame rate of the shared time axis. Defaults to 30.
+    :param start_frame:  Int, index of the shared time axis tick used as the start of the combined video.
+                         Defaults to VIDEO_START_FRAME.
+    :return: paired_frame_indices: Numpy int array with shape (ticks, 2), Mordor and Gondor frame index for each tick.
+    :return: start_idx_m:          Int, Mordor frame index at the start tick.
+    :return: start_idx_g:          Int, Gondor frame index at the start tick.
+    :return: total_time_max:       Float, length of the shared time axis in seconds.
+    """
+    frame_times_m = timestamps['frame_times_m']
+    frame_times_g = timestamps['frame_times_g']
 
-    :return: abs_video_start:   Unix timestamp in seconds, frame capture time for the vide frame we start from.
-    :return: shared_start_time: Unix timestamp in seconds, shared start time for session in synchronized, cross-lab time.
-    :return: relative_start:    Numeric value, difference between abs_video_start and shared_start_time in seconds.
-    :return: output_path:       Str, path to the saved-out combined video (mp4) file.
+    total_time_m = timestamps['stop_time_m'] - timestamps['start_time_m']
+    total_time_g = timestamps['stop_time_g'] - timestamps['start_time_g']
+    total_time_max = min(total_time_m, total_time_g)
+    print('Total time max: {}' .format(total_time_max))
 
-    File output!
-    The combined video is saved out to an mp4 file at:
-    [INPUT_DIR]/pair[PAIR_NO]_[SESSION]_combined_video.mp4
+    # start_time_m and start_time_g are both the mean sharedStartTime, so does not matter which one we use
+    shared_start_t = timestamps['start_time_m']
+    shared_times = np.arange(shared_start_t, shared_start_t + total_time_max, 1/target_fps)
 
-    Notes:
-    - If the 'start_frame'th video frames are not aligned well enough across the two videos, an adjustment is made.
-      In this case, the latter of the 'start_frame'th frames are treated as the reference, and the corresponding frame
-      from the other video is identified based on the frame capture timestamps.
-      Then a further check is made for subsequent frames, and if there remain discrepancies, a simple matching is made
-      across all videoframes so that we combine the truly corresponding frames only.
-    - Only works with input video resolutions 1920 * 1080. Checks video res and aborts for different values.
+    # closest Mordor and Gondor frames for each tick of the shared time axis, (ticks, 2) int array
+    paired_frame_indices = pair_frame_indices(frame_times_m, frame_times_g, shared_times)
+
+    start_idx_m = int(paired_frame_indices[start_frame][0])
+    start_idx_g = int(paired_frame_indices[start_frame][1])
+
+    return paired_frame_indices, start_idx_m, start_idx_g, total_time_max
+
+
+def encode_chunk(video_files, layout, chunk_file, fps, first_frames, frame_count=None, pairs=None,
+                 seek_method='grab', workers=0, encoder='opencv', encoder_options=None, info_text=None,
+                 frame_format='bgr', stop_event=None):
+    """
+    Combines and encodes one contiguous chunk of the combined video, on its own, for chunk-parallel encoding in
+    combine_chunks_parallel. Both source videos are opened and positioned at the first source frames of the chunk.
+
+    :param video_files:    Tuple of paths (Mordor .mov, Gondor .mov).
+    :param layout:         Dict, layout of the combined frame, see frame_layout.compute_layout.
+    :param chunk_file:     Path to the chunk video file.
+    :param fps:            Numeric value, frame rate of the output video.
+    :param first_frames:   Tuple (Mordor, Gondor) of the source frame indices for the first frame of the chunk.
+    :param frame_count:    Int, number of frames in the chunk, for frames read in lockstep. Defaults to None, meaning
+                           until the end of either video.
+    :param pairs:          (N, 2) int array, the (Mordor, Gondor) source frame indices for each frame of the chunk
+                           (pair table slice). Defaults to None, meaning lockstep reading.
+    :param seek_method:    Str, see frame_pipeline.seek_video ('seek' lands on frames confirmed by their pts).
+                           Defaults to 'grab'.
+    :param workers:        Int, number of composition worker threads within the process. Defaults to 0.
+    :param encoder:        Str, encoder backend, see video_writers.open_writer. Defaults to 'opencv'.
+    :param encoder_options: Dict of encoder options, see video_writers.open_writer. Defaults to None.
+    :param info_text:      Str, text for the info strip, see FrameComposer. Defaults to None.
+    :param frame_format:   Str, pixel format of the composition path, one of frame_yuv.FRAME_FORMATS. Defaults to
+                           'bgr'.
+    :param stop_event:     multiprocessing.Event, once it is set, the chunk ends after the current frame (the chunk
+                           file written so far is a valid video). Defaults to None.
+    :return: frames:       Int, number of frames written.
+    """
+    caps = [open_capture(video_file, frame_format, layout['src_size']) for video_file in video_files]
+    positions = tuple(seek_video(cap, video_file, int(frame_idx), seek_method)
+                      for cap, video_file, frame_idx in zip(caps, video_files, first_frames))
+    if workers > 0:
+        frame_pairs = threaded_frames(caps[0], caps[1], pairs=pairs, positions=positions)
+    else:
+        frame_pairs = sequential_frames(caps[0], caps[1], pairs=pairs, positions=positions)
+    composer = YUVFrameComposer(layout, info_text) if frame_format == 'yuv420p' else FrameComposer(layout, info_text)
+    combined_frames = compose_frames(frame_pairs, composer, workers=workers)
+    video_writer = open_writer(chunk_file, fps, layout['out_size'], backend=encoder, **(encoder_options or {}))
+    frames = 0
+    try:
+        for img in itertools.islice(combined_frames, frame_count):
+            video_writer.write(img)
+            frames += 1
+            if stop_event is not None and stop_event.is_set():
+                break
+    finally:
+        combined_frames.close()
+        frame_pairs.close()
+        video_writer.release()
+        for cap in caps:
+            cap.release()
+    return frames
+
+
+# Stop event of a chunk-parallel worker process, set by _init_chunk_worker.
+_chunk_stop_event = None
+
+
+def _init_chunk_worker(stop_event):
+    """
+    Initializer of the chunk-parallel worker processes: SIGINT is left to the parent, which stops the chunks with
+    stop_event (see combine_chunks_parallel).
+    """
+    global _chunk_stop_event
+    child_signals()
+    _chunk_stop_event = stop_event
+
+
+def _encode_chunk_job(*args, **kwargs):
+    return encode_chunk(*args, stop_event=_chunk_stop_event, **kwargs)
+
+
+def combine_chunks_parallel(video_files, layout, output_path, fps, start_frames, total_frames, processes,
+                            frame_schedule=None, seek_method='grab', workers=0, encoder='opencv',
+                            encoder_options=None, keep_chunks=False, info_text=None, frame_format='bgr',
+                            progress=None, stop=None):
+    """
+    Chunk-parallel encoding of one combined video: the aligned output frame range is split into contiguous chunks,
+    one per process, each process seeks both source videos to its chunk start (with seek_method 'seek', the landing
+    frames are confirmed by their pts, see frame_pipeline.seek_video), then combines and encodes its own chunk
+    file (encode_chunk). The chunks are concatenated losslessly at the end (video_chunks.concat_chunks, needs ffmpeg).
+    The chunk files are written to the chunk folder of the output (video_chunks.chunk_dir_for).
+    The worker processes ignore SIGINT. On a stop request (stop, progress) the running chunks end after their current
+    frame, chunks not started yet are cancelled, and the chunks from the start up to the first incomplete one (the
+    contiguous part of the frame range) are concatenated.
+
+    :param video_files:    Tuple of paths (Mordor .mov, Gondor .mov).
+    :param layout:         Dict, layout of the combined frame, see frame_layout.compute_layout.
+    :param output_path:    Path to the combined video file.
+    :param fps:            Numeric value, frame rate of the output video.
+    :param start_frames:   Tuple (Mordor, Gondor) of the starting frames, for frames read in lockstep.
+    :param total_frames:   Int, (expected) number of output frames. The last chunk is read until the end of either
+                           video in lockstep mode, so a header frame count that is off only shifts the chunk borders.
+    :param processes:      Int, number of chunks and worker processes.
+    :param frame_schedule: (N, 2) int array, pair table for the output frames (see combine_frames), or None for
+                           lockstep reading. Defaults to None.
+    :param seek_method:    Str, see frame_pipeline.seek_to_frame. Defaults to 'grab'.
+    :param workers:        Int, number of composition worker threads per process. Defaults to 0.
+    :param encoder:        Str, encoder backend, see video_writers.open_writer. Defaults to 'opencv'.
+    :param encoder_options: Dict of encoder options, see video_writers.open_writer. Defaults to None.
+    :param keep_chunks:    Boolean flag, if True, chunk files are kept after concatenation. Defaults to False.
+    :param info_text:      Str, text for the info strip, see FrameComposer. Defaults to None.
+    :param frame_format:   Str, pixel format of the composition path, see encode_chunk. Defaults to 'bgr'.
+    :param progress:       Callable progress(frames), called with the number of frames in finished chunks as chunks
+                           finish. If it returns True, combining stops. Defaults to None.
+    :param stop:           run_control.StopOnSignals, combining stops once it is stopped. Defaults to None.
+    :return: frames:       Int, number of frames in the combined video.
+    :return: stopped:      Boolean, True if combining was stopped (progress, stop).
+    """
+    chunk_dir = chunk_dir_for(output_path)
+    os.makedirs(chunk_dir, exist_ok=True)
+    borders = np.linspace(0, total_frames, processes + 1).round().astype(int)
+    chunk_stop = multiprocessing.Event()
+    stopped = False
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_chunk_worker,
+                             initargs=(chunk_stop,)) as pool:
+        futures, expected_frames = {}, {}
+        for chunk_idx, (first, stop_frame) in enumerate(zip(borders[:-1], borders[1:])):
+            last_chunk = chunk_idx == processes - 1
+            if first == stop_frame and (frame_schedule is not None or not last_chunk):
+                continue
+            if frame_schedule is None:
+                first_frames = (start_frames[0] + first, start_frames[1] + first)
+                job = {'frame_count': None if last_chunk else int(stop_frame - first)}
+            else:
+                first_frames = tuple(frame_schedule[first])
+                job = {'pairs': frame_schedule[first:stop_frame]}
+            # the last lockstep chunk is read until the end of either video
+            expected_frames[chunk_idx] = None if frame_schedule is None and last_chunk else int(stop_frame - first)
+            futures[chunk_idx] = pool.submit(_encode_chunk_job, video_files, layout, chunk_path(chunk_dir, chunk_idx),
+                                             fps, first_frames, seek_method=seek_method, workers=workers,
+                                             encoder=encoder, encoder_options=encoder_options, info_text=info_text,
+                                             frame_format=frame_format, **job)
+        # wait for the chunks, checking for stop requests in between
+        pending, finished_frames = set(futures.values()), 0
+        while pending:
+            done, pending = wait(pending, timeout=CHUNK_POLL_SECS, return_when=FIRST_COMPLETED)
+            finished = [future.result() for future in done if not future.cancelled()]
+            if finished:
+                finished_frames += sum(finished)
+                if progress is not None and progress(finished_frames):
+                    stopped = True
+            if stop is not None and stop.stopped:
+                stopped = True
+            if stopped and not chunk_stop.is_set():
+                chunk_stop.set()
+                for future in pending:
+                    future.cancel()
+        chunk_frames = {chunk_idx: future.result() for chunk_idx, future in futures.items() if not future.cancelled()}
+    print('Chunk frame counts:', list(chunk_frames.values()))
+    # when stopped, only the chunks up to the first incomplete one make a contiguous frame range
+    used_chunks = []
+    for chunk_idx in futures:
+        if chunk_idx not in chunk_frames:
+            break
+        used_chunks.append(chunk_idx)
+        expected = expected_frames[chunk_idx]
+        if stopped and expected is not None and chunk_frames[chunk_idx] < expected:
+            break
+    chunk_files = [chunk_path(chunk_dir, chunk_idx) for chunk_idx in used_chunks if chunk_frames[chunk_idx] > 0]
+    if chunk_files:
+        print('Concatenating', len(chunk_files), 'chunks into', output_path)
+        concat_chunks(chunk_files, output_path)
+    else:
+        print('No frames written, no combined video.')
+    if not keep_chunks:
+        for chunk_idx in chunk_frames:
+            if os.path.exists(chunk_path(chunk_dir, chunk_idx)):
+                os.remove(chunk_path(chunk_dir, chunk_idx))
+        if not os.listdir(chunk_dir):
+            os.rmdir(chunk_dir)
+    return sum(chunk_frames[chunk_idx] for chunk_idx in used_chunks), stopped
+
+
+def checked_seek_method(video_files, frame_indices, seek_method, frame_format='bgr', size=None):
+    """
+    Checks seek_method on both videos with frame_pipeline.verify_seek (the frame landed on is compared against the
+    sequentially decoded reference frame).
+
+    :param video_files:    Tuple of paths (Mordor .mov, Gondor .mov).
+    :param frame_indices:  Tuple (Mordor, Gondor) of the frames to land on.
+    :param seek_method:    Str, see frame_pipeline.seek_to_frame.
+    :param frame_format:   Str, frame format of the decoders, see frame_yuv.open_capture. Defaults to 'bgr'.
+    :param size:           Tuple (width, height) of the video frames, needed for 'yuv420p'. Defaults to None.
+    :return: seek_method:  Str, seek_method if it lands on the right frames in both videos, 'grab' otherwise.
+    """
+    if seek_method == 'grab':
+        return seek_method
+    for video_file, frame_idx, label in zip(video_files, frame_indices, ('Mordor', 'Gondor')):
+        if not verify_seek(video_file, int(frame_idx), seek_method,
+                           open_cap=lambda path: open_capture(path, frame_format, size)):
+            print('WARNING!', label, 'video: seeking does not land on the right frame, using "grab" instead.')
+            return 'grab'
+    return seek_method
+
+
+def plan_combination(input_dir, pair_no, session='freeConv', start_frame=VIDEO_START_FRAME, slow_frame_count=False,
+                     video_files=None, times_files=None, alignment=None):
+    """
+    Planning stage of combine_frames, without decoding any video: finds the video and timestamp files, probes the
+    video containers (see video_probe.py), extracts the timestamps and lines up the videos. The returned plan can be
+    saved out and fed back into combine_frames, see combine_plan.py.
+
+    :param input_dir:        Path to folder containing the video and timestamp files for given pair and session.
+    :param pair_no:          Numeric value, pair number.
+    :param session:          Str, session name. Defaults to 'freeConv'.
+    :param start_frame:      Numeric value, the frame number we start the frame combinations from, see combine_frames.
+                             Defaults to VIDEO_START_FRAME.
+    :param slow_frame_count: Boolean flag for exact frame counts, see combine_frames. Defaults to False.
+    :param video_files:      Tuple of paths (Mordor .mov, Gondor .mov), see combine_frames. Defaults to None.
+    :param times_files:      Tuple of paths (Mordor .mat, Gondor .mat), see combine_frames. Defaults to None.
+    :param alignment:        Str, 'start' or 'accurate', see combine_frames. Defaults to None, meaning 'accurate' for BG
+                             sessions and 'start' for all others.
+    :return: plan:           Dictionary with the following "key: value" pairs:
+        pair_no, session, start_frame, alignment: The planning parameters (alignment resolved)
+        video_files, times_files: Lists of paths (Mordor, Gondor)
+        inputs: List of [absolute path, size, modification time (ns)] of the video and timestamp files
+        fps, width, height: Video properties (the same for both videos)
+        frame_counts: List of the frame counts (Mordor, Gondor)
+        start_diff_s: Float, Mordor - Gondor capture time difference at start_frame, in seconds
+        realigned: Boolean, True if start_diff_s was beyond the tolerance and the videos were lined up again
+        start_frame_m, start_frame_g: Int, starting frames of the combined video
+        frame_schedule: (N, 2) int array, pair table of the output frames ('accurate' alignment), or None (lockstep)
+        output_frames: Int, expected number of output frames
+        absolute_start, shared_start, rel_start: Floats, start times of the combined video, see combine_frames
     """
 
     # PARAMS
@@ -225,19 +617,20 @@ def combine_frames(input_dir, pair_no, session='freeConv', start_frame=10, slow_
     # For a sampling rate of 30 Hz (1 frame per 33.3 ms), maximal distance across truly corresponding frames should
     # be only 16.7 ms, so 20 ms is a liberal tolerance value
     capture_time_tol = CAPTURE_TIME_TOL_S
-    # Expected video frame resolution, current version only works properly with these values,
-    # good for freeConv videos but not for 1280 x 720 BG videos
-    expected_h = VIDEO_H
-    expected_w = VIDEO_W
-
-    # Define output movie filename.
-    output_path = os.path.join(input_dir, 'pair' + str(pair_no) + '_' + session + '_combined_video.mp4')
+    # BG sessions have always been lined up on the shared time axis (formerly in combine_videos_BG.py)
+    if alignment is None:
+        alignment = 'accurate' if session.startswith('BG') else 'start'
+    if alignment not in ('start', 'accurate'):
+        raise ValueError('Input arg alignment should be one of "start", "accurate"!')
 
     # Find video files.
-    video_mordor = glob.glob(f'{input_dir}/**/pair{pair_no}_Mordor_behav/pair{pair_no}_Mordor_{session}.mov',
-                             recursive=True)[0]
-    video_gondor = glob.glob(f'{input_dir}/**/pair{pair_no}_Gondor_behav/pair{pair_no}_Gondor_{session}.mov',
-                             recursive=True)[0]
+    if video_files is None:
+        video_mordor = glob.glob(f'{input_dir}/**/pair{pair_no}_Mordor_behav/pair{pair_no}_Mordor_{session}.mov',
+                                 recursive=True)[0]
+        video_gondor = glob.glob(f'{input_dir}/**/pair{pair_no}_Gondor_behav/pair{pair_no}_Gondor_{session}.mov',
+                                 recursive=True)[0]
+    else:
+        video_mordor, video_gondor = video_files
 
     if video_mordor and video_gondor:
         print('\nFound video files:')
@@ -247,28 +640,13 @@ def combine_frames(input_dir, pair_no, session='freeConv', start_frame=10, slow_
         print('\nFound no video files!')
         sys.exit()
 
-    # Open video files with opencv.
-    cap_mordor = cv2.VideoCapture(video_mordor)
-    cap_gondor = cv2.VideoCapture(video_gondor)
-    print('\nOpened video files...')
-
-    # Fetch and print basic video properties.
-    video_m_fps = cap_mordor.get(cv2.CAP_PROP_FPS)
-    video_m_h = cap_mordor.get(cv2.CAP_PROP_FRAME_HEIGHT)
-    video_m_w = cap_mordor.get(cv2.CAP_PROP_FRAME_WIDTH)
-    video_g_fps = cap_gondor.get(cv2.CAP_PROP_FPS)
-    video_g_h = cap_gondor.get(cv2.CAP_PROP_FRAME_HEIGHT)
-    video_g_w = cap_gondor.get(cv2.CAP_PROP_FRAME_WIDTH)
-
-    # If the slow_frame_count flag is set, count the frames of the videos with the slow but accurate method.
-    # The method below takes too much time, only use it for troubleshooting, if there is stg fishy about frame numbers.
-    if slow_frame_count:
-        video_m_fc = count_frames_accurate(video_mordor)
-        video_g_fc = count_frames_accurate(video_gondor)
-    # Else we just go with what cv2 reports
-    else:
-        video_m_fc = cap_mordor.get(cv2.CAP_PROP_FRAME_COUNT)
-        video_g_fc = cap_gondor.get(cv2.CAP_PROP_FRAME_COUNT)
+    # Fetch and print basic video properties (cached, see video_probe.py).
+    # If the slow_frame_count flag is set, exact frame counts are determined from the container packet index,
+    # else we just go with what cv2 reports from the header.
+    probe_m = probe_video(video_mordor, exact_count=slow_frame_count)
+    probe_g = probe_video(video_gondor, exact_count=slow_frame_count)
+    video_m_fps, video_m_h, video_m_w, video_m_fc = (probe_m[k] for k in ('fps', 'height', 'width', 'frame_count'))
+    video_g_fps, video_g_h, video_g_w, video_g_fc = (probe_g[k] for k in ('fps', 'height', 'width', 'frame_count'))
 
     print('\nMordor video properties:')
     print('fps: ' + str(video_m_fps) + '; height: ' + str(video_m_h) +
@@ -277,31 +655,42 @@ def combine_frames(input_dir, pair_no, session='freeConv', start_frame=10, slow_
     print('fps: ' + str(video_g_fps) + '; height: ' + str(video_g_h) +
           '; width: ' + str(video_g_w) + '; frame count: ' + str(video_g_fc))
 
-    # Sanity checks for resolution and for matching fps.
+    # Sanity checks for matching resolution and fps.
     if video_m_fps != video_g_fps or video_m_h != video_g_h or video_m_w != video_g_w:
         raise ValueError('Video properties do not match!')
-    if video_m_h != expected_h or video_m_w != expected_w:
-        raise ValueError(' '.join(['Unexpected frame size! Should be', str(VIDEO_W), 'x', str(VIDEO_H),
-                                   'for both videos!']))
 
     # extract timestamps
-    timestamps = extract_video_times_mat(input_dir, pair_no, session)
+    timestamps = extract_video_times_mat(input_dir, pair_no, session, times_files=times_files)
     capt_times_m = timestamps['frame_times_m']
     capt_times_g = timestamps['frame_times_g']
     shared_start_time = timestamps['start_time_m']
+    # cross-check frame counts against the number of frame capture timestamps
+    check_frame_count(probe_m, capt_times_m, 'Mordor')
+    check_frame_count(probe_g, capt_times_g, 'Gondor')
     # check if the "start_frame"th timestamps line up nicely or not
-    if np.abs(capt_times_m[start_frame] - capt_times_g[start_frame]) > capture_time_tol:
+    start_diff = capt_times_m[start_frame] - capt_times_g[start_frame]
+    if np.abs(start_diff) > capture_time_tol:
         print('\nTiming difference at 10th video frame too large across Mordor and Gondor!')
-        print('Difference is ', np.abs(capt_times_m[start_frame] - capt_times_g[start_frame]),
+        print('Difference is ', np.abs(start_diff),
               '(positive value means Mordor capture timestamp is larger, that is, happened later)')
         print('WARNING')
         print('Will attempt to line up truly corresponding frames from the two videos.',
               '\nThere is absolutely no guarantee that this works though.')
-        # call alignment repair function
-        start_frame_m, start_frame_g = frames_alignment(capt_times_m, capt_times_g, start_frame)
+        # call alignment repair function (the 'accurate' method below lines up all frames anyway)
+        if alignment == 'start':
+            start_frame_m, start_frame_g = frames_alignment(capt_times_m, capt_times_g, start_frame)
     else:
         start_frame_m = start_frame
         start_frame_g = start_frame
+    # with 'accurate' alignment, output frames follow the shared time axis: the pair table from the start tick on is
+    # the frame schedule, source frames are duplicated or skipped as needed. Otherwise frames are read in lockstep.
+    frame_schedule = None
+    if alignment == 'accurate':
+        paired_frame_indices, start_frame_m, start_frame_g, _ = frame_alignment_accurate(timestamps,
+                                                                                         target_fps=video_m_fps,
+                                                                                         start_frame=start_frame)
+        frame_schedule = paired_frame_indices[start_frame:]
+        print('Paired frame indices: ', len(paired_frame_indices), '; scheduled output frames:', len(frame_schedule))
     # get video start timestamps
     abs_video_start_m = capt_times_m[start_frame_m]
     abs_video_start_g = capt_times_g[start_frame_g]
@@ -310,67 +699,667 @@ def combine_frames(input_dir, pair_no, session='freeConv', start_frame=10, slow_
     print('\nAbsolute, shared and relative starts for combined video:')
     print((abs_video_start, shared_start_time, relative_start))
 
-    # args for the video output
-    fps_out = video_m_fps
-    size_out = (int(video_m_w), int(video_m_h))
+    # expected number of output frames, from the pair table or from the header frame counts
+    if frame_schedule is not None:
+        output_frames = len(frame_schedule)
+    else:
+        output_frames = min(video_m_fc - start_frame_m, video_g_fc - start_frame_g)
+
+    return {'pair_no': int(pair_no), 'session': session, 'start_frame': int(start_frame), 'alignment': alignment,
+            'video_files': [video_mordor, video_gondor], 'times_files': list(timestamps['times_files']),
+            'inputs': [file_key(path) for path in [video_mordor, video_gondor] + list(timestamps['times_files'])],
+            'fps': float(video_m_fps), 'width': int(video_m_w), 'height': int(video_m_h),
+            'frame_counts': [int(video_m_fc), int(video_g_fc)], 'start_diff_s': float(start_diff),
+            'realigned': bool(np.abs(start_diff) > capture_time_tol),
+            'start_frame_m': int(start_frame_m), 'start_frame_g': int(start_frame_g),
+            'frame_schedule': None if frame_schedule is None else np.asarray(frame_schedule, dtype=np.int64),
+            'output_frames': int(output_frames), 'absolute_start': float(abs_video_start),
+            'shared_start': float(shared_start_time), 'rel_start': float(relative_start)}
 
-    # prepare writer object
-    # fourcc = cv2.VideoWriter.fourcc('M', 'J', 'P', 'G')  # not preferred format
-    fourcc = cv2.VideoWriter.fourcc('m', 'p', '4', 'v')
-    video_writer = cv2.VideoWriter(output_path, fourcc, fps_out, size_out)
-    print('\nOpened and prepared video writer...')
+
+def _reject_options(path_name, used):
+    """
+    Raises ValueError if any of the given options is used, as the combination path path_name does not support them.
+
+    :param path_name:  Str, the combination path (input arg), for the error message.
+    :param used:       Dict of "option name: True if used" pairs.
+    """
+    names = [name for name, is_used in used.items() if is_used]
+    if names:
+        raise ValueError(path_name + ' cannot be combined with ' + ', '.join(names) + '!')
+
+
+def _frame_index_function(start_frames, frame_schedule=None, frame_step=1):
+    """
+    Returns a function mapping an output frame index to its (Mordor, Gondor) source frame indices: from the frame
+    schedule (pair table), or every frame_step-th frame in lockstep from start_frames.
+    """
+    def frame_indices(frame_idx):
+        if frame_schedule is None:
+            return start_frames[0] + frame_idx * frame_step, start_frames[1] + frame_idx * frame_step
+        return frame_schedule[frame_idx]
+    return frame_indices
+
+
+def _write_provenance(run, frame_indices, frames):
+    """
+    Writes the provenance table of the first frames output frames in one go (paths without a Python frame loop).
+    """
+    if run['provenance_file'] is None:
+        return
+    provenance_writer = ProvenanceWriter(run['provenance_file'], frame_indices, *run['capt_times'])
+    provenance_writer.write_frames(frames)
+    provenance_writer.release()
+
+
+def _close_metrics(metrics, profile=False, stages=True):
+    """
+    Closes the run metrics (summary record, see run_metrics.py) and prints the summary, and the per-stage histogram of
+    frame times if profile is set (stages=False: the run has no per-stage timings).
+    """
+    if metrics is None:
+        return
+    summary = metrics.close()
+    print('Frames / sec:', summary['fps'], '; peak RSS (MiB):', summary['peak_rss_mb'])
+    if profile and stages:
+        print('\nPer-stage frame times (number of frames per bin):')
+        print(metrics.histogram())
+    elif profile:
+        print('\nPer-stage frame times are not available with engine="ffmpeg" (decoding, composition and encoding run '
+              'in one ffmpeg process), only the throughput above.')
+
+
+def _combine_ffmpeg(plan, layout, run, frame_step=1, encoder_options=None, progress=None, metrics_file=None,
+                    profile=False):
+    """
+    ffmpeg engine path of combine_frames: the whole combined video is made by one ffmpeg subprocess (see
+    ffmpeg_engine.py). Sets run['stats']['frames_written'].
+
+    :param plan:            Dict, alignment plan, see plan_combination.
+    :param layout:          Dict, layout of the combined frame, see frame_layout.compute_layout.
+    :param run:             Dict, outputs and labels of the run, see combine_frames.
+    :param frame_step:      Int, every frame_step-th frame is used (proxy only). Defaults to 1.
+    :param encoder_options: Dict of encoder options, see ffmpeg_engine.combine_ffmpeg. Defaults to None.
+    :param progress:        Callable progress(frames_written, total_frames), see combine_frames. Defaults to None.
+    :param metrics_file:    Path to a JSON lines metrics file, see combine_frames. Defaults to None.
+    :param profile:         Boolean flag, see combine_frames. Defaults to False.
+    :return: frames:        Int, number of frames written.
+    """
+    start_frames = (plan['start_frame_m'], plan['start_frame_g'])
+    if plan['frame_schedule'] is not None:
+        start_frames = schedule_start_frames(plan['frame_schedule'])
+        if start_frames is None:
+            raise ValueError('The pair table of the accurate alignment duplicates or skips source frames, '
+                             'this cannot be done with engine="ffmpeg"! Use engine="python" or alignment="start".')
+    frame_count = -(-plan['output_frames'] // frame_step)
+    print('\nffmpeg engine:', frame_count, 'output frames.')
+    metrics = None
+    if metrics_file is not None or profile:
+        metrics = RunMetrics(metrics_file, total_frames=frame_count, labels=run['labels'])
+
+    def ffmpeg_progress(frames):
+        if metrics is not None:
+            metrics.tick(frames)
+        return progress is not None and progress(frames, frame_count)
+
+    try:
+        with StopOnSignals() as stop:
+            frames, stopped = combine_ffmpeg(plan['video_files'], layout, run['output_path'], plan['fps'] / frame_step,
+                                             start_frames, frame_count=frame_count, frame_step=frame_step,
+                                             info_text=run['info_text'], encoder_options=encoder_options,
+                                             progress=lambda frames: ffmpeg_progress(frames) or stop.stopped)
+        print('Output video contains', frames, 'frames.')
+        run['stats']['frames_written'] = frames
+        _write_provenance(run, _frame_index_function(start_frames, frame_step=frame_step), frames)
+    finally:
+        _close_metrics(metrics, profile, stages=False)
+    if stop.stopped:
+        raise KeyboardInterrupt('Combining stopped by ' + stop.signal_name + ' after ' + str(frames) +
+                                ' frames, output finalised.')
+    return frames
+
+
+def _combine_chunked_parallel(plan, layout, run, frame_schedule, total_frames, fps_out, processes, seek_method='seek',
+                              workers=0, encoder='opencv', encoder_options=None, keep_chunks=False,
+                              frame_format='bgr', progress=None):
+    """
+    Chunk-parallel path of combine_frames: contiguous chunks of the aligned frame range are combined and encoded in
+    worker processes, see combine_chunks_parallel. Sets run['stats']['frames_written'].
+
+    :param plan:            Dict, alignment plan, see plan_combination.
+    :param layout:          Dict, layout of the combined frame, see frame_layout.compute_layout.
+    :param run:             Dict, outputs and labels of the run, see combine_frames.
+    :param frame_schedule:  (N, 2) int array, pair table of the output frames (decimated for proxy only), or None for
+                            lockstep reading.
+    :param total_frames:    Int, (expected) number of output frames.
+    :param fps_out:         Numeric value, frame rate of the output video.
+    :param processes:       Int, number of chunks and worker processes.
+    :param seek_method:     Str, see combine_chunks_parallel. Defaults to 'seek'.
+    :param workers:         Int, number of composition threads per process. Defaults to 0.
+    :param encoder:         Str, encoder backend, see video_writers.open_writer. Defaults to 'opencv'.
+    :param encoder_options: Dict of encoder options, see video_writers.open_writer. Defaults to None.
+    :param keep_chunks:     Boolean flag, if True, chunk files are kept after concatenation. Defaults to False.
+    :param frame_format:    Str, pixel format of the composition path, see encode_chunk. Defaults to 'bgr'.
+    :param progress:        Callable progress(frames_written, total_frames), called as chunks finish, see
+                            combine_frames. Defaults to None.
+    :return: frames:        Int, number of frames written.
+    """
+    video_files = plan['video_files']
+    start_frames = (plan['start_frame_m'], plan['start_frame_g'])
+    print('\nChunk-parallel mode:', processes, 'processes for', total_frames, 'output frames.')
+    # each process seeks both videos to its chunk start, the landing frames are confirmed by their pts (ffprobe,
+    # cached here once for all processes)
+    if seek_method == 'seek' and any(probe_frame_pts(video_file) is None for video_file in video_files):
+        print('WARNING! No frame timestamps (needs ffprobe), chunk starts cannot be confirmed, using "grab" '
+              'instead.')
+        seek_method = 'grab'
+    if seek_method == 'grab':
+        print('WARNING! Seek method "grab": every chunk process decodes all source frames before its chunk start.')
+    with StopOnSignals() as stop:
+        frames, stopped = combine_chunks_parallel(
+            video_files, layout, run['output_path'], fps_out, start_frames, total_frames, processes,
+            frame_schedule=frame_schedule, seek_method=seek_method, workers=workers, encoder=encoder,
+            encoder_options=encoder_options, keep_chunks=keep_chunks, info_text=run['info_text'],
+            frame_format=frame_format, stop=stop,
+            progress=None if progress is None else lambda frames: progress(frames, total_frames))
+    print('Output video contains', frames, 'frames.')
+    run['stats']['frames_written'] = frames
+    _write_provenance(run, _frame_index_function(start_frames, frame_schedule), frames)
+    if stop.stopped:
+        raise KeyboardInterrupt('Combining stopped by ' + stop.signal_name + ' after ' + str(frames) +
+                                ' frames, output finalised.')
+    return frames
+
+
+def _combine_loop(plan, layout, run, frame_schedule, total_frames, fps_out, workers=0, seek_method='grab',
+                  verify_seek_method=False, encoder='opencv', encoder_options=None, segments=None,
+                  segments_only=False, chunk_frames=None, keep_chunks=False, progress=None, preview=False,
+                  metrics_file=None, profile=False, proxy=None, proxy_size=PROXY_SIZE, proxy_step=1,
+                  frame_format='bgr', compose_processes=0):
+    """
+    Python frame loop path of combine_frames: frames are decoded, composed and written (to the combined video, the
+    proxy video, the segments, in chunks) in one pass, sequentially, with threads (workers) or with processes
+    (compose_processes). Sets run['stats']['frames_written'].
+
+    :param plan:            Dict, alignment plan, see plan_combination.
+    :param layout:          Dict, layout of the combined frame, see frame_layout.compute_layout.
+    :param run:             Dict, outputs and labels of the run, see combine_frames.
+    :param frame_schedule:  (N, 2) int array, pair table of the output frames (decimated for proxy only), or None for
+                            lockstep reading.
+    :param total_frames:    Int, (expected) number of output frames.
+    :param fps_out:         Numeric value, frame rate of the output video.
+    :param proxy_step:      Int, every proxy_step-th frame goes to the proxy video (proxy 'also'). Defaults to 1.
+    See combine_frames for all other args.
+    :return: frames:        Int, number of frames written.
+    """
+    video_mordor, video_gondor = plan['video_files']
+    video_size = (plan['width'], plan['height'])
+    start_frame_m, start_frame_g = plan['start_frame_m'], plan['start_frame_g']
+    output_path, size_out = run['output_path'], layout['out_size']
+    frame_indices = _frame_index_function((start_frame_m, start_frame_g), frame_schedule)
+
+    # prepare writer object, with the requested encoder backend (see video_writers.py)
+    writers = []
+    # in chunked mode, output frames already written in complete chunks by an earlier run are skipped
+    resume_frame = 0
+    if chunk_frames is not None:
+        chunk_dir = chunk_dir_for(output_path)
+        chunk_params = {'sources': plan['inputs'][:2],
+                        'alignment': plan['alignment'], 'start_frame': plan['start_frame'],
+                        'start_frame_m': int(start_frame_m), 'start_frame_g': int(start_frame_g),
+                        'scheduled_frames': None if frame_schedule is None else len(frame_schedule),
+                        'fps': fps_out, 'size': size_out, 'encoder': encoder,
+                        'encoder_options': {key: value for key, value in (encoder_options or {}).items()
+                                            if value is not None},
+                        'chunk_frames': chunk_frames}
+        manifest = resume_manifest(chunk_dir, chunk_params)
+        if manifest['complete'] and not os.path.exists(output_path):
+            print('Combined video of the completed checkpoint manifest is missing, starting over.')
+            manifest['chunks'], manifest['complete'] = [], False
+        if manifest['complete']:
+            print('\nCombined video is already complete:', output_path)
+            return 0
+        chunked_writer = ChunkedWriter(chunk_dir, manifest, fps_out, size_out, chunk_frames, frame_indices,
+                                       backend=encoder, **(encoder_options or {}))
+        resume_frame = chunked_writer.frame_idx
+        writers.append(chunked_writer)
+    elif not segments_only:
+        writers.append(open_writer(output_path, fps_out, size_out, backend=encoder, **(encoder_options or {})))
+    # proxy alongside the full video, downscaled from the combined frames
+    if proxy == 'also':
+        writers.append(ProxyWriter(open_writer(run['proxy_path'], plan['fps'] / proxy_step, proxy_size,
+                                               backend=encoder, **(encoder_options or {})),
+                                   proxy_size, proxy_step))
+    # segments are fed from the same frame stream, each segment file is opened when its first frame comes
+    if segments is not None:
+        segment_writer = SegmentWriter(output_path[:-len('.mp4')], fps_out, size_out, segments, backend=encoder,
+                                       **(encoder_options or {}))
+        print('\nSegments:', ', '.join(str(number) + ': output frames ' + str(first) + '-' + str(stop - 1)
+                                       for number, first, stop, _ in segment_writer.segments))
+        writers.append(segment_writer)
+    video_writer = writers[0] if len(writers) == 1 else TeeWriter(writers)
+    # provenance records of the output frames, in step with the video writer (frames of a resumed run included)
+    provenance_writer = None
+    if run['provenance_file'] is not None:
+        provenance_writer = ProvenanceWriter(run['provenance_file'], frame_indices, *run['capt_times'],
+                                             first_frame=resume_frame)
+    print('\nOpened and prepared video writer (' + encoder + ' backend)...')
 
 
     ##################################
     # connect frames
     ##################################
 
-    # counters, flags
-    release_flag = False
-    frame_counter_m = 0
-    frame_counter_g = 0
-    frame_counter_out = 0
-    # read frames until before hitting the starting frames for both videos
-    while frame_counter_m < start_frame_m:
-        ret_m, frame_m = cap_mordor.read()
-        frame_counter_m += 1
-    while frame_counter_g < start_frame_g:
-        ret_g, frame_g = cap_gondor.read()
-        frame_counter_g += 1
-
-    # main loop for connecting frames for joint output video
-    while not release_flag:
-        # check for user interrupt
-        if cv2.waitKey(1) & 0xFF == ord('q'):
-            release_flag = True
-
-        # read next frames
-        ret_m, frame_m = cap_mordor.read()
-        ret_g, frame_g = cap_gondor.read()
-        # if there are frames
-        if ret_m and ret_g:
-            # join and write current frames
-            img = frame_connect(frame_m, frame_g)
-            video_writer.write(img)
-            # user feedback
-            if frame_counter_out % 1000 == 0:
-                print('Written ' + str(frame_counter_out) + ' frames...')
-            # adjust counters
-            frame_counter_m += 1
-            frame_counter_g += 1
-            frame_counter_out += 1
-        # if either video is it at its end, abort
+    # counters
+    frame_counter_out = resume_frame
+    # source frames for the first output frame (later than the starting frames when resuming)
+    remaining_schedule = None
+    if frame_schedule is not None:
+        remaining_schedule = frame_schedule[resume_frame:]
+        seek_frame_m, seek_frame_g = remaining_schedule[0] if len(remaining_schedule) else (start_frame_m,
+                                                                                            start_frame_g)
+    else:
+        seek_frame_m, seek_frame_g = start_frame_m + resume_frame, start_frame_g + resume_frame
+    # position both videos at their starting frames, without decoding the frames before
+    if verify_seek_method:
+        seek_method = checked_seek_method((video_mordor, video_gondor), (seek_frame_m, seek_frame_g), seek_method,
+                                          frame_format, video_size)
+    if frame_format == 'yuv420p':
+        composer = YUVFrameComposer(layout, run['info_text'])
+    else:
+        composer = FrameComposer(layout, run['info_text'])
+    # per-stage timing proxies for the captures, the composer and the writer (see run_metrics.py)
+    metrics = None
+    if metrics_file is not None or profile:
+        metrics = RunMetrics(metrics_file, total_frames=total_frames, labels=run['labels'])
+        video_writer = metrics.wrap(video_writer, {'write': 'encode'})
+
+    try:
+        caps, frame_pairs = [], None
+        if compose_processes > 0:
+            # decoding and composition in reader and worker processes, frames in shared memory (see frame_shm.py)
+            print('\nShared memory mode: reader processes for both videos,', compose_processes,
+                  'composition processes.')
+            combined_frames = shm_composed_frames((video_mordor, video_gondor), composer, video_size,
+                                                  frame_format=frame_format, pairs=remaining_schedule,
+                                                  positions=(seek_frame_m, seek_frame_g), seek_method=seek_method,
+                                                  processes=compose_processes)
         else:
-            release_flag = True
+            # open video files, with opencv (bgr) or with ffmpeg decoders (yuv420p, see frame_yuv.py)
+            cap_mordor = open_capture(video_mordor, frame_format, video_size)
+            cap_gondor = open_capture(video_gondor, frame_format, video_size)
+            print('\nOpened video files...')
+            frame_counter_m = seek_video(cap_mordor, video_mordor, seek_frame_m, seek_method)
+            frame_counter_g = seek_video(cap_gondor, video_gondor, seek_frame_g, seek_method)
+            if metrics is not None:
+                cap_mordor = metrics.wrap(cap_mordor, {'read': 'decode_m', 'grab': 'decode_m'})
+                cap_gondor = metrics.wrap(cap_gondor, {'read': 'decode_g', 'grab': 'decode_g'})
+                composer = metrics.wrap(composer, {'compose': 'compose'})
+            caps = [cap_mordor, cap_gondor]
+
+            # frame source and composition stages, threaded if workers are requested (see frame_pipeline.py)
+            positions = (frame_counter_m, frame_counter_g)
+            if workers > 0:
+                print('\nPipelined mode: reader threads for both videos,', workers, 'composition workers.')
+                frame_pairs = threaded_frames(cap_mordor, cap_gondor, pairs=remaining_schedule, positions=positions)
+            else:
+                frame_pairs = sequential_frames(cap_mordor, cap_gondor, pairs=remaining_schedule, positions=positions)
+            combined_frames = compose_frames(frame_pairs, composer, workers=workers)
+
+        # main loop for connecting frames for joint output video, ends when either video is at its end,
+        # or on a stop request (signal, progress callback, preview window)
+        interrupted = False
+        frame_preview = FramePreview() if preview else None
+        try:
+            with StopOnSignals() as stop:
+                for img in combined_frames:
+                    # write current joined frames, in order
+                    video_writer.write(img)
+                    if provenance_writer is not None:
+                        provenance_writer.write()
+                    # user feedback
+                    if frame_counter_out % 1000 == 0:
+                        print('Written ' + str(frame_counter_out) + ' frames...')
+                    # adjust counter
+                    frame_counter_out += 1
+                    if metrics is not None:
+                        metrics.tick(frame_counter_out)
+                    # check for stop requests
+                    if progress is not None and progress(frame_counter_out, total_frames):
+                        interrupted = True
+                    if frame_preview is not None and frame_preview.show(img):
+                        interrupted = True
+                    if interrupted or stop.stopped:
+                        interrupted = True
+                        break
+        finally:
+            # stop worker and reader threads (or processes), if any
+            combined_frames.close()
+            if frame_pairs is not None:
+                frame_pairs.close()
+            for cap in caps:
+                cap.release()
+            if frame_preview is not None:
+                frame_preview.close()
+            if provenance_writer is not None:
+                provenance_writer.release()
+
+        # clean up, once the while loop (=video writing) is over
+        print('Done, closing shop')
+        print('Output video contains', frame_counter_out - 1, 'frames.')
+        run['stats']['frames_written'] = frame_counter_out - resume_frame
+        if chunk_frames is not None and not interrupted:
+            chunked_writer.finish(output_path, keep_chunks=keep_chunks)
+        video_writer.release()
+        print('Closed video writer, all done and done.')
+    finally:
+        _close_metrics(metrics, profile)
+    if stop.stopped:
+        raise KeyboardInterrupt('Combining stopped by ' + stop.signal_name + ' after ' + str(frame_counter_out) +
+                                ' frames, output finalised.')
+    return frame_counter_out - resume_frame
+
+
+def combine_frames(input_dir, pair_no, session='freeConv', start_frame=10, slow_frame_count=False, workers=0,
+                   output_dir=None, video_files=None, times_files=None, out_size=None, alignment=None,
+                   seek_method=None, verify_seek_method=False, encoder='opencv', encoder_options=None,
+                   segments=None, segments_only=False, chunk_frames=None, keep_chunks=False, processes=0,
+                   progress=None, preview=False, metrics_file=None, profile=False,
+                   proxy=None, proxy_size=PROXY_SIZE, proxy_fps=PROXY_FPS, geometry='full', info_strip=0,
+                   engine='python', frame_format='bgr', compose_processes=0, plan=None, provenance=True,
+                   run_stats=None):
+    """
+    Main function that loads timestamps, videos and loops through their corresponding frames, combining them.
 
-    # clean up, once the while loop (=video writing) is over
-    print('Done, closing shop')
-    print('Output video contains', frame_counter_out - 1, 'frames.')
-    video_writer.release()
-    cv2.destroyAllWindows()
-    print('Closed video writer, all done and done.')
+    :param input_dir:        Path to folder containing the video and timestamp files for given pair and session.
+                             glob-ed recursively for relevant files.
+    :param pair_no:          Numeric value, pair number.
+    :param session:          Str, session name, one of ['BG1', 'BG2', 'BG3', ..., 'BG9', 'freeConv', 'playback'].
+                             Defaults to 'freeConv'.
+    :param start_frame:      Numeric value, the frame number we start the frame combinations from. Initial frames have
+                             jittery frame capture times, so - by default - we only start video combinations
+                             from this frame on. Defaults to 10.
+    :param slow_frame_count: Boolean flag for exact frame counts from the container packet index (see video_probe.py,
+                             cached after the first run), instead of the header frame count reported by cv2.
+                             Defaults to False.
+    :param workers:          Int, number of composition worker threads. If > 0, frames are combined in pipelined mode:
+                             each video is decoded in its own reader thread and frames are composed in a thread pool,
+                             while writing stays in order (see frame_pipeline.py). The output is identical to the
+                             sequential mode. Defaults to 0 (sequential mode).
+    :param output_dir:       Path to folder for the combined video. Defaults to None, meaning input_dir.
+    :param video_files:      Tuple of paths (Mordor .mov, Gondor .mov). If supplied, input_dir is not globbed for the
+                             videos. Defaults to None.
+    :param times_files:      Tuple of paths (Mordor .mat, Gondor .mat), passed on to extract_video_times_mat.
+                             Defaults to None.
+    :param out_size:         Tuple (width, height), resolution of the combined video. Defaults to None, meaning the
+                             resolution of the source videos (see frame_layout.py).
+    :param alignment:        Str, method for lining up the videos. 'start': if the 'start_frame'th frames are not
+                             aligned well enough, corresponding start frames are found with frames_alignment, then
+                             frames are combined in lockstep. 'accurate': all frames are paired on the shared time
+                             axis with frame_alignment_accurate, and the pair table drives the writing (frames are
+                             duplicated or skipped as needed, so there is no drift). Defaults to None, meaning
+                             'accurate' for BG sessions and 'start' for all others.
+    :param seek_method:      Str, method for positioning the videos at their starting frames, 'grab' (skipped frames
+                             are not decoded to images) or 'seek' (keyframe seek, then grab forward, with the landing
+                             frame confirmed by its pts from ffprobe, see frame_pipeline.seek_video). Defaults to None,
+                             meaning 'grab', or 'seek' in chunk-parallel mode (processes), where with 'grab' every chunk
+                             would decode all source frames before its start, and with frame_format='yuv420p'.
+    :param verify_seek_method: Boolean flag, if True, the landed starting frames are checked against sequentially
+                             decoded reference frames first, falling back to 'grab' on mismatch. Not used in
+                             chunk-parallel mode, where each process confirms its chunk starts by their pts.
+                             Defaults to False.
+    :param encoder:          Str, encoder backend for the combined video, 'opencv' (cv2.VideoWriter, mp4v) or 'ffmpeg'
+                             (frames piped to an ffmpeg subprocess). See video_writers.py. Defaults to 'opencv'.
+    :param encoder_options:  Dict of options for the ffmpeg backend: codec, preset, crf, threads (see
+                             video_writers.FFmpegWriter). Defaults to None (backend defaults).
+    :param segments:         Path to a segments file (see video_writers.parse_segments_file), or a list of
+                             (segment number, start (secs), end (secs)) tuples. Segments are written from the same
+                             frame stream as the combined video, with the same encoder. Segment times are relative to
+                             the start of the combined video. Defaults to None (no segments).
+    :param segments_only:    Boolean flag, if True, only the segments are written, not the full combined video.
+                             Defaults to False.
+    :param chunk_frames:     Int, if set, the combined video is written in resumable, chunked mode: chunks of
+                             chunk_frames frames are checkpointed in a manifest, a restarted run with the same inputs and
+                             parameters resumes from the last complete chunk, and the chunks are concatenated losslessly
+                             at the end (see video_chunks.py, needs ffmpeg). Cannot be combined with segments.
+                             Defaults to None (one output file, written in one go).
+    :param keep_chunks:      Boolean flag, if True, chunk files are kept after concatenation. Defaults to False.
+    :param processes:        Int, if > 1, chunk-parallel mode: the aligned output frame range is split into 'processes'
+                             contiguous chunks, each combined and encoded by its own worker process (seeking both
+                             source videos to its chunk start), then the chunks are concatenated losslessly (see
+                             combine_chunks_parallel, needs ffmpeg). Cannot be combined with segments or chunk_frames.
+                             Defaults to 0 (single process).
+    :param progress:         Callable progress(frames_written, total_frames), called after each written output frame
+                             (chunk-parallel mode: as chunks finish). total_frames is the expected number of output
+                             frames (from the pair table or the header frame counts). If it returns True, combining
+                             stops after that frame, as on SIGINT. Defaults to None.
+    :param preview:          Boolean flag, if True, combined frames are shown in a window while combining, and pressing
+                             'q' stops (see frame_preview.py). Defaults to False (headless).
+    :param metrics_file:     Path to a JSON lines file ('-' for stdout) for per-stage timing, throughput, ETA and peak
+                             RSS records (see run_metrics.py). With engine='ffmpeg', throughput and ETA only. Cannot be
+                             combined with processes. Defaults to None (no metrics).
+    :param profile:          Boolean flag, if True, a per-stage histogram of frame times is printed at the end (not
+                             available with engine='ffmpeg', only the throughput is printed). Cannot be combined with
+                             processes. Defaults to False.
+    :param proxy:            Str, low-resolution proxy video mode. 'also': a proxy video is written alongside the full
+                             combined video, from the same frame stream. 'only': only the proxy video is written, with
+                             frames composed directly at the proxy size, and skipped source frames are not decoded (see
+                             frame_pipeline.source_frames). Defaults to None (no proxy).
+    :param proxy_size:       Tuple (width, height), resolution of the proxy video. Defaults to PROXY_SIZE.
+    :param proxy_fps:        Numeric value, frame rate of the proxy video. Every n-th output frame is used, n is the
+                             source frame rate / proxy_fps, rounded (at least 1). Defaults to PROXY_FPS.
+    :param geometry:         Str, output frame geometry, 'full' (out_size, black below the panels) or 'compact' (panel
+                             rows only, e.g. 1920 * 676 for 1080p, far fewer pixels to encode). See frame_layout.py.
+                             The proxy video has the same geometry. Defaults to 'full'.
+    :param info_strip:       Int, height (pixels) of an info strip below the panels, showing pair, session and panel
+                             labels. Defaults to 0 (no info strip).
+    :param engine:           Str, combination engine. 'python': frames are decoded, composed (FrameComposer) and
+                             encoded in the frame loop below. 'ffmpeg': the starting frames and the layout are
+                             translated into one ffmpeg filtergraph and the combined video is made by a single ffmpeg
+                             subprocess (see ffmpeg_engine.py). The ffmpeg engine always encodes with ffmpeg
+                             (encoder_options apply), needs lockstep reading (pair tables only if they are lockstep),
+                             and cannot be combined with segments, chunk_frames, processes, proxy='also' or preview.
+                             workers and seek_method are not used. Defaults to 'python'.
+    :param frame_format:     Str, pixel format of the Python composition path. 'bgr': frames are decoded to BGR by cv2
+                             and composed by FrameComposer. 'yuv420p': frames are decoded by ffmpeg, composed per plane
+                             by frame_yuv.YUVFrameComposer and piped to the ffmpeg encoder as yuv420p, without the two
+                             colour conversions and with half the bytes per frame (see frame_yuv.py). Needs
+                             encoder='ffmpeg' and even frame sizes, and cannot be combined with proxy='also' or
+                             preview. With 'yuv420p', 'seek' restarts the ffmpeg decoders with an input-side seek
+                             (see frame_yuv.FFmpegReader), and is the default seek_method. Not used by
+                             engine='ffmpeg'. Defaults to 'bgr'.
+    :param compose_processes: Int, if > 0, process-based composition: each video is decoded by its own reader process
+                             into a shared memory ring of preallocated frame slots, compose_processes worker processes
+                             compose the slots in place into an output ring, and the frames are written in order from
+                             there, without pickling frames (see frame_shm.py). Memory use is fixed up front. workers
+                             is not used, and per-stage metrics only cover encoding. Cannot be combined with processes.
+                             Defaults to 0 (threads only, see workers).
+    :param plan:             Dict from plan_combination, or path to a plan file (see combine_plan.py), e.g. from an
+                             earlier dry run (--plan). The planning stage (timestamps, probing, alignment) is skipped,
+                             and input_dir, video_files, times_files and slow_frame_count are not used. ValueError is
+                             raised if the plan is for another pair, session, start_frame or alignment, or if its input
+                             files changed. Defaults to None (planning stage runs).
+    :param provenance:       Boolean flag, if True, the provenance table of the combined video (Mordor and Gondor
+                             frame indices and capture times of each output frame) is written alongside it, from the
+                             frame loop (see frame_provenance.py). Not written with segments_only, as there is no
+                             combined video then. Defaults to True.
+    :param run_stats:        Dict, if supplied, it is filled in with statistics of the run: 'frames_written', the
+                             number of output frames actually written by this run (frames of a resumed run's earlier
+                             chunks not included). Defaults to None.
+
+    :return: abs_video_start:   Unix timestamp in seconds, frame capture time for the vide frame we start from.
+    :return: shared_start_time: Unix timestamp in seconds, shared start time for session in synchronized, cross-lab time.
+    :return: relative_start:    Numeric value, difference between abs_video_start and shared_start_time in seconds.
+    :return: output_path:       Str, path to the saved-out combined video (mp4) file, None if segments_only is set,
+                                the proxy video if proxy is 'only'.
+
+    File output!
+    The combined video is saved out to an mp4 file at:
+    [OUTPUT_DIR]/pair[PAIR_NO]_[SESSION]_combined_video.mp4
+    Segments (if requested) are saved out to mp4 files at:
+    [OUTPUT_DIR]/pair[PAIR_NO]_[SESSION]_combined_video_seg[SEGMENT_NO].mp4
+    The provenance table (if requested) is saved out to a npy file at:
+    [OUTPUT_DIR]/pair[PAIR_NO]_[SESSION]_combined_video_frames.npy
+
+    Notes:
+    - SIGINT / SIGTERM stop combining after the current frame, then the writers are released (so the output written so
+      far is a valid video) and KeyboardInterrupt is raised. Stopping via progress or the preview returns normally.
+      In chunk-parallel mode, the worker processes ignore SIGINT: the running chunks end after their current frame,
+      chunks not started yet are cancelled, and the completed part from the start is concatenated.
+    - If the 'start_frame'th video frames are not aligned well enough across the two videos, an adjustment is made.
+      In this case, the latter of the 'start_frame'th frames are treated as the reference, and the corresponding frame
+      from the other video is identified based on the frame capture timestamps.
+      Then a further check is made for subsequent frames, and if there remain discrepancies, a simple matching is made
+      across all videoframes so that we combine the truly corresponding frames only.
+    - Works with any input video resolution (e.g. 1920 * 1080 freeConv and 1280 * 720 BG videos), as long as the two
+      videos match. The layout of the combined frame is computed by frame_layout.compute_layout.
+    """
+
+    if alignment not in (None, 'start', 'accurate'):
+        raise ValueError('Input arg alignment should be one of "start", "accurate"!')
+    if segments_only and segments is None:
+        raise ValueError('Input arg segments_only requires segments!')
+    if proxy not in (None, 'also', 'only'):
+        raise ValueError('Input arg proxy should be one of None, "also", "only"!')
+    if engine not in ENGINES:
+        raise ValueError('Input arg engine should be one of ' + ', '.join('"' + e + '"' for e in ENGINES) + '!')
+    if frame_format not in FRAME_FORMATS:
+        raise ValueError('Input arg frame_format should be one of ' + ', '.join('"' + f + '"' for f in FRAME_FORMATS) +
+                         '!')
+    # options of each combination path (_combine_ffmpeg, _combine_chunked_parallel, _combine_loop)
+    if engine == 'ffmpeg':
+        _reject_options('Input arg engine="ffmpeg"',
+                        {'segments': segments is not None, 'chunk_frames': chunk_frames is not None,
+                         'processes': processes > 1, 'compose_processes': compose_processes > 0,
+                         'proxy="also"': proxy == 'also', 'preview': preview})
+    elif processes > 1:
+        _reject_options('Input arg processes',
+                        {'segments': segments is not None, 'chunk_frames': chunk_frames is not None,
+                         'compose_processes': compose_processes > 0, 'proxy="also"': proxy == 'also',
+                         'preview': preview, 'metrics_file': metrics_file is not None, 'profile': profile})
+    elif chunk_frames is not None:
+        _reject_options('Input arg chunk_frames', {'segments': segments is not None, 'proxy="also"': proxy == 'also'})
+    if frame_format == 'yuv420p' and engine == 'python':
+        if encoder != 'ffmpeg':
+            raise ValueError('Input arg frame_format="yuv420p" needs encoder="ffmpeg"!')
+        _reject_options('Input arg frame_format="yuv420p"', {'proxy="also"': proxy == 'also', 'preview': preview})
+        # the writers take the composed yuv420p frames as they are
+        encoder_options = dict(encoder_options or {}, input_pix_fmt='yuv420p')
+    if seek_method is None:
+        # grabbing through the ffmpeg decoders pipes every skipped frame, seeking restarts them at the target
+        fast_seek = processes > 1 or (frame_format == 'yuv420p' and engine == 'python')
+        seek_method = 'seek' if fast_seek else 'grab'
+    if isinstance(segments, str):
+        segments = parse_segments_file(segments)
+    if run_stats is None:
+        run_stats = {}
+    run_stats['frames_written'] = 0
+
+    # Define output movie filename.
+    if output_dir is None:
+        output_dir = input_dir
+    output_path = os.path.join(output_dir, 'pair' + str(pair_no) + '_' + session + '_combined_video.mp4')
+    proxy_path = os.path.join(output_dir, 'pair' + str(pair_no) + '_' + session + '_combined_video_proxy.mp4')
+    if proxy == 'only':
+        output_path = proxy_path
+
+    # Alignment plan: from the timestamps and the container probes, or from an earlier dry run (see combine_plan.py)
+    if plan is None:
+        plan = plan_combination(input_dir, pair_no, session, start_frame=start_frame, slow_frame_count=slow_frame_count,
+                                video_files=video_files, times_files=times_files, alignment=alignment)
+    else:
+        if isinstance(plan, str):
+            plan = load_plan(plan)
+        check_plan(plan, pair_no, session, start_frame, alignment)
+        print('\nUsing the alignment plan of an earlier dry run for:')
+        print('\n'.join(plan['video_files']))
+    video_m_fps, video_m_w, video_m_h = plan['fps'], plan['width'], plan['height']
+    frame_schedule = plan['frame_schedule']
+    start_frame_m, start_frame_g = plan['start_frame_m'], plan['start_frame_g']
+    abs_video_start, shared_start_time, relative_start = plan['absolute_start'], plan['shared_start'], plan['rel_start']
+    # expected number of output frames, from the pair table or from the header frame counts
+    total_frames = plan['output_frames']
+
+    # Layout of the combined frame, from the source resolution and the requested output size
+    # (proxy only: composed at the proxy size right away, only the visible source columns are resampled)
+    layout = compute_layout((video_m_w, video_m_h), proxy_size if proxy == 'only' else out_size, geometry, info_strip)
+    print('\nCombined frame layout:', layout)
+
+    # proxy video frame rate: every proxy_step-th output frame
+    proxy_step = 1
+    if proxy is not None:
+        proxy_step = max(1, int(round(video_m_fps / proxy_fps)))
+        # proxy alongside a compact video: same aspect ratio as the full video, even height
+        if proxy == 'also' and geometry == 'compact':
+            proxy_h = int(round(layout['out_size'][1] * proxy_size[0] / layout['out_size'][0]))
+            proxy_size = (proxy_size[0], proxy_h + proxy_h % 2)
+        shown_size = layout['out_size'] if proxy == 'only' else proxy_size
+        print('\nProxy video (' + proxy + '):', shown_size, 'at', video_m_fps / proxy_step, 'fps (every', proxy_step,
+              'th frame).')
+
+    # outputs and labels of the run, shared by the combination paths
+    run = {'labels': {'pair': pair_no, 'session': session},
+           'info_text': 'pair ' + str(pair_no) + '  ' + session + '  |  left: Mordor  |  right: Gondor',
+           'output_path': output_path, 'proxy_path': proxy_path,
+           # the provenance table belongs to the combined video, not to segments only
+           'provenance_file': provenance_path(output_path) if provenance and not segments_only else None,
+           'capt_times': None, 'stats': run_stats}
+    # capture times for the provenance table, from the cache sidecars of the plan's .mat files (see video_times.py)
+    if run['provenance_file'] is not None:
+        run['capt_times'] = tuple(load_video_times(times_mat)['frame_times'] for times_mat in plan['times_files'])
+
+    # ffmpeg engine: the whole combined video is made by one ffmpeg subprocess (see ffmpeg_engine.py)
+    if engine == 'ffmpeg':
+        _combine_ffmpeg(plan, layout, run, frame_step=proxy_step if proxy == 'only' else 1,
+                        encoder_options=encoder_options, progress=progress, metrics_file=metrics_file, profile=profile)
+        return abs_video_start, shared_start_time, relative_start, output_path
 
-    return abs_video_start, shared_start_time, relative_start, output_path
+    # proxy only: the frame schedule is decimated, so that the skipped frames are not decoded
+    fps_out = video_m_fps
+    if proxy == 'only' and proxy_step > 1:
+        if frame_schedule is None:
+            frame_schedule = np.column_stack((np.arange(start_frame_m, start_frame_m + total_frames),
+                                              np.arange(start_frame_g, start_frame_g + total_frames)))
+        frame_schedule = frame_schedule[::proxy_step]
+        total_frames = len(frame_schedule)
+        fps_out = video_m_fps / proxy_step
+
+    # chunk-parallel mode: contiguous chunks of the aligned frame range are combined and encoded in worker processes
+    if processes > 1:
+        _combine_chunked_parallel(plan, layout, run, frame_schedule, total_frames, fps_out, processes,
+                                  seek_method=seek_method, workers=workers, encoder=encoder,
+                                  encoder_options=encoder_options, keep_chunks=keep_chunks, frame_format=frame_format,
+                                  progress=progress)
+        return abs_video_start, shared_start_time, relative_start, output_path
+
+    # Python frame loop, sequential, threaded or with composition processes
+    _combine_loop(plan, layout, run, frame_schedule, total_frames, fps_out, workers=workers, seek_method=seek_method,
+                  verify_seek_method=verify_seek_method, encoder=encoder, encoder_options=encoder_options,
+                  segments=segments, segments_only=segments_only, chunk_frames=chunk_frames, keep_chunks=keep_chunks,
+                  progress=progress, preview=preview, metrics_file=metrics_file, profile=profile, proxy=proxy,
+                  proxy_size=proxy_size, proxy_step=proxy_step, frame_format=frame_format,
+                  compose_processes=compose_processes)
+    return abs_video_start, shared_start_time, relative_start, None if segments_only else output_path
+
+
+def save_start_times(output_dir, pair_no, session, abs_video_start, shared_start_time, relative_start):
+    """
+    Saves out the timestamps returned by combine_frames to a npz and to a mat file.
+
+    :param output_dir:        Path to folder for the output files.
+    :param pair_no:           Numeric value, pair number.
+    :param session:           Str, session name.
+    :param abs_video_start:   Unix timestamp in seconds, frame capture time for the first combined video frame.
+    :param shared_start_time: Unix timestamp in seconds, shared start time for session.
+    :param relative_start:    Numeric value, difference between abs_video_start and shared_start_time in seconds.
+    :return: output_file:     Str, path to the output files, without extension.
+    """
+    output_file = os.path.join(output_dir, 'pair' + str(pair_no) + '_' + session + '_combined_video_start')
+    np.savez(output_file, absolute_start=abs_video_start, shared_start=shared_start_time, rel_start=relative_start)
+    sio.savemat(output_file + '.mat', {'absolute_start': abs_video_start,
+                                       'shared_start': shared_start_time,
+                                       'rel_start': relative_start})
+    return output_file
 
 
 if __name__ == '__main__':
@@ -378,15 +1367,123 @@ if __name__ == '__main__':
     parser.add_argument('input_dir', help='Path to the dir containing audio and corresponding .mat files')
     parser.add_argument('pair_no', type=int, help='Pair number (between 1-999)')
     parser.add_argument('session', type=str, default='freeConv',
-                        help='Name of the recording session (BG1, ... BG9, freeConv, playback). '
-                             'Only supports freeConv at the moment. Defaults to freeConv.')
+                        help='Name of the recording session (BG1, ... BG9, freeConv, playback).')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='Number of composition worker threads. If > 0, videos are decoded in separate reader '
+                             'threads and frames are composed in parallel (pipelined mode). Defaults to 0 (sequential).')
+    parser.add_argument('--slow_frame_count', action='store_true',
+                        help='Use exact frame counts from the container packet index instead of the header counts. '
+                             'Cached next to the videos, so only the first run pays for it.')
+    parser.add_argument('--seek', type=str, default=None, choices=['grab', 'seek'],
+                        help='Method for positioning the videos at their starting frames. Defaults to grab, or to '
+                             'seek with --processes or --frame_format yuv420p.')
+    parser.add_argument('--verify_seek', action='store_true',
+                        help='Check the landed starting frames against decoded reference frames before combining.')
+    parser.add_argument('--encoder', type=str, default='opencv', choices=ENCODER_BACKENDS,
+                        help='Encoder backend for the combined video. Defaults to opencv (mp4v).')
+    parser.add_argument('--codec', type=str, default=None,
+                        help='Video codec for the ffmpeg encoder backend. Defaults to libx264.')
+    parser.add_argument('--preset', type=str, default=None,
+                        help='Encoder preset for the ffmpeg encoder backend (libx264/libx265). Defaults to veryfast.')
+    parser.add_argument('--crf', type=float, default=None,
+                        help='Constant rate factor for the ffmpeg encoder backend (libx264/libx265). Defaults to 23.')
+    parser.add_argument('--encoder_threads', type=int, default=None,
+                        help='Encoder thread count for the ffmpeg encoder backend. Defaults to 0 (ffmpeg decides).')
+    parser.add_argument('--output_size', type=int, nargs=2, default=None, metavar=('W', 'H'),
+                        help='Resolution of the combined video. Defaults to the resolution of the source videos.')
+    parser.add_argument('--segments', type=str, default=None,
+                        help='Path to a segments file (e.g. segmentation_points_5parts.txt). Segments of the combined '
+                             'video are written in the same pass.')
+    parser.add_argument('--segments_only', action='store_true',
+                        help='Only write the segments (see --segments), not the full combined video.')
+    parser.add_argument('--chunk_frames', type=int, default=None,
+                        help='Resumable mode: write the combined video in checkpointed chunks of this many frames '
+                             '(e.g. 9000 for 5 min at 30 fps), resuming from the last complete chunk on restart.')
+    parser.add_argument('--keep_chunks', action='store_true',
+                        help='Keep the chunk files of --chunk_frames or --processes mode after concatenating them.')
+    parser.add_argument('--processes', type=int, default=0,
+                        help='Chunk-parallel mode: combine and encode this many contiguous chunks of the video in '
+                             'parallel worker processes, then concatenate them. Defaults to 0 (single process).')
+    parser.add_argument('--preview', action='store_true',
+                        help='Show the combined frames in a window while combining, press q in the window to stop.')
+    parser.add_argument('--metrics', type=str, default=None,
+                        help='Path to a JSON lines file (- for stdout) for progress and per-stage timing records.')
+    parser.add_argument('--proxy', type=str, default=None, choices=['also', 'only'],
+                        help='Write a low-resolution proxy video alongside (also) or instead of (only) the full one.')
+    parser.add_argument('--proxy_size', type=int, nargs=2, default=PROXY_SIZE, metavar=('W', 'H'),
+                        help='Resolution of the proxy video. Defaults to 640 360.')
+    parser.add_argument('--proxy_fps', type=float, default=PROXY_FPS,
+                        help='Frame rate of the proxy video. Defaults to 15.')
+    parser.add_argument('--geometry', type=str, default='full', choices=GEOMETRIES,
+                        help='Output frame geometry: full (output size, black below the panels) or compact (panel '
+                             'rows only). Defaults to full.')
+    parser.add_argument('--info_strip', type=int, default=0,
+                        help='Height of an info strip below the panels, in pixels. Defaults to 0 (none).')
+    parser.add_argument('--audio', action='store_true',
+                        help='Combine the repaired mono audio recordings into a stereo track and mux it into the '
+                             'combined video.')
+    parser.add_argument('--silent_time', type=float, default=0,
+                        help='Padding with silence at the beginning of the combined audio (--audio), in secs.')
+    parser.add_argument('--engine', type=str, default='python', choices=ENGINES,
+                        help='Combination engine: python frame loop (default) or a single ffmpeg filtergraph.')
+    parser.add_argument('--frame_format', type=str, default='bgr', choices=FRAME_FORMATS,
+                        help='Pixel format of the Python composition path: bgr (default) or yuv420p (no BGR '
+                             'conversions, needs --encoder ffmpeg).')
+    parser.add_argument('--compose_processes', type=int, default=0,
+                        help='Number of composition processes, with frames in shared memory rings. Defaults to 0 '
+                             '(threads only, see --workers).')
+    parser.add_argument('--plan', action='store_true',
+                        help='Dry run: compute and save out the alignment plan only, without touching the videos.')
+    parser.add_argument('--from_plan', type=str, default=None,
+                        help='Path to a plan file from an earlier --plan run, skipping the planning stage.')
+    parser.add_argument('--no_provenance', action='store_true',
+                        help='Do not write the per-output-frame provenance table next to the combined video.')
+    parser.add_argument('--profile', action='store_true',
+                        help='Print a per-stage histogram of frame times at the end of the run.')
     args = parser.parse_args()
 
-    abs_video_start_t, shared_start_t, relative_start_t, _ = combine_frames(args.input_dir, args.pair_no, args.session)
-    output_file = os.path.join(args.input_dir,
-                               'pair' + str(args.pair_no) + '_' + args.session + '_combined_video_start')
-    np.savez(output_file, absolute_start=abs_video_start_t, shared_start=shared_start_t, rel_start=relative_start_t)
-    sio.savemat(output_file + '.mat', {'absolute_start': abs_video_start_t,
-                                       'shared_start': shared_start_t,
-                                       'rel_start': relative_start_t})
+    if args.plan:
+        combine_plan = plan_combination(args.input_dir, args.pair_no, args.session,
+                                        slow_frame_count=args.slow_frame_count)
+        write_plan_table([plan_row(combine_plan)])
+        print('\nPlan saved out to', save_plan(combine_plan, plan_path(args.input_dir, args.pair_no, args.session)))
+        sys.exit()
+
+    combine_options = {'slow_frame_count': args.slow_frame_count,
+                       'workers': args.workers,
+                       'out_size': args.output_size,
+                       'seek_method': args.seek,
+                       'verify_seek_method': args.verify_seek,
+                       'encoder': args.encoder,
+                       'encoder_options': {'codec': args.codec, 'preset': args.preset, 'crf': args.crf,
+                                           'threads': args.encoder_threads},
+                       'segments': args.segments,
+                       'segments_only': args.segments_only,
+                       'chunk_frames': args.chunk_frames,
+                       'keep_chunks': args.keep_chunks,
+                       'processes': args.processes,
+                       'preview': args.preview,
+                       'metrics_file': args.metrics,
+                       'profile': args.profile,
+                       'proxy': args.proxy,
+                       'proxy_size': args.proxy_size,
+                       'proxy_fps': args.proxy_fps,
+                       'geometry': args.geometry,
+                       'info_strip': args.info_strip,
+                       'engine': args.engine,
+                       'frame_format': args.frame_format,
+                       'compose_processes': args.compose_processes,
+                       'plan': args.from_plan,
+                       'provenance': not args.no_provenance}
+    try:
+        abs_video_start_t, shared_start_t, relative_start_t, video_path = combine_frames(args.input_dir, args.pair_no,
+                                                                                         args.session,
+                                                                                         **combine_options)
+    except KeyboardInterrupt as exc:
+        print('\n' + str(exc))
+        sys.exit(130)
+    save_start_times(args.input_dir, args.pair_no, args.session, abs_video_start_t, shared_start_t, relative_start_t)
+    if args.audio:
+        combine_and_mux(args.input_dir, args.pair_no, relative_start_t, video_path, session=args.session,
+                        silent_time=args.silent_time, mux=video_path is not None)
     print('\nAu revoir, adios, ha det bra, cheerios!')
@@ -0,0 +1,167 @@
+"""
+CommGame project tools for subsequent video rater task.
+
+Pure-ffmpeg combination engine for combine_videos.py (engine='ffmpeg'): instead of decoding both videos to BGR numpy
+frames, composing them in Python (FrameComposer) and piping them back to an encoder, the alignment and the layout are
+translated into one ffmpeg filter_complex, and the whole combined video is made by a single ffmpeg subprocess. Frames
+stay in the decoder's pixel format (yuv420p) and never cross the Python boundary.
+
+The filtergraph (build_filtergraph), for each source video:
+    trim=start_frame=S          Drop the frames before the aligned starting frame (S is start_frame_m or start_frame_g)
+    [framestep=N]               Keep every N-th frame (proxy frame rates)
+    setpts=N/(FPS*TB)           Constant frame rate timestamps from the frame index, so that the two sources are
+                                paired frame by frame, as in lockstep reading
+    crop=W:H:X:0                Visible source columns (layout['crop_x'])
+    scale=PW:PH                 Panel size (layout['panel_size']), area averaging when downscaling
+then:
+    hstack=inputs=2:shortest=1  Panels side-by-side, ends with the shorter video
+    pad=OW:OH:0:0:black         Black rows below the panels (layout['out_size'])
+    [overlay=0:Y]               Info strip, if any: the strip is drawn with frame_layout.draw_info_strip (the same
+                                text as in the Python engine, and ffmpeg builds often lack drawtext) and overlaid from
+                                a looped image input
+
+Only lockstep reading (frame i of the combined video from frames start_frame_m + i and start_frame_g + i) can be
+expressed with trim, so pair tables (alignment='accurate') are supported only if they happen to be lockstep
+(schedule_start_frames). Frames are resampled by swscale instead of cv2.resize, and there is no BGR round trip, so
+the output differs from the Python engine by a few intensity levels, not more (see tests/test_ffmpeg_engine.py and
+benchmarks/bench_engines.py for equivalence checks, the latter also for a speed comparison).
+
+"""
+
+import os
+import shutil
+import subprocess
+import tempfile
+
+import cv2
+import numpy as np
+
+from frame_layout import draw_info_strip
+from video_writers import ffmpeg_encoder_args
+
+
+# swscale flags for the cv2 interpolation flags of the layout.
+SCALE_FLAGS = {cv2.INTER_AREA: 'area', cv2.INTER_LINEAR: 'bilinear'}
+
+
+def schedule_start_frames(frame_schedule):
+    """
+    Returns the (Mordor, Gondor) starting frames of a pair table if it reads both videos in lockstep (no duplicated
+    or skipped source frames), else None.
+
+    :param frame_schedule: (N, 2) int array, (Mordor, Gondor) source frame indices for each output frame.
+    :return: start_frames: Tuple of ints (Mordor, Gondor), or None.
+    """
+    frame_schedule = np.asarray(frame_schedule)
+    if not len(frame_schedule):
+        return None
+    steps = np.arange(len(frame_schedule))[:, np.newaxis]
+    if not np.array_equal(frame_schedule - frame_schedule[0], np.hstack((steps, steps))):
+        return None
+    return int(frame_schedule[0][0]), int(frame_schedule[0][1])
+
+
+def build_filtergraph(layout, start_frames, fps, frame_step=1, info_strip_input=None):
+    """
+    Builds the filter_complex of the combined video, see the module docstring.
+
+    :param layout:            Dict, layout of the combined frame, see frame_layout.compute_layout.
+    :param start_frames:      Tuple (Mordor, Gondor) of the starting frames (inputs 0 and 1 of the ffmpeg command).
+    :param fps:               Numeric value, frame rate of the combined video.
+    :param frame_step:        Int, every frame_step-th source frame is used, from the starting frames. Defaults to 1.
+    :param info_strip_input:  Int, index of the ffmpeg input with the info strip image. Defaults to None (no strip).
+    :return: filtergraph:     Str, filter_complex with the output pad labelled [out].
+    """
+    src_h = layout['src_size'][1]
+    crop_x0, crop_x1 = layout['crop_x']
+    panel_w, panel_h = layout['panel_size']
+    out_w, out_h = layout['out_size']
+    scale_flags = SCALE_FLAGS.get(layout['interpolation'], 'bicubic')
+    chains = []
+    for input_idx, (label, start_frame) in enumerate(zip(('m', 'g'), start_frames)):
+        filters = ['trim=start_frame=' + str(int(start_frame))]
+        if frame_step > 1:
+            filters.append('framestep=' + str(int(frame_step)))
+        filters += ['setpts=N/(' + repr(float(fps)) + '*TB)',
+                    'crop=' + str(crop_x1 - crop_x0) + ':' + str(src_h) + ':' + str(crop_x0) + ':0',
+                    'scale=' + str(panel_w) + ':' + str(panel_h) + ':flags=' + scale_flags]
+        chains.append('[' + str(input_idx) + ':v]' + ','.join(filters) + '[' + label + ']')
+    stacked = '[m][g]hstack=inputs=2:shortest=1,pad=' + str(out_w) + ':' + str(out_h) + ':0:0:black'
+    if info_strip_input is None:
+        chains.append(stacked + '[out]')
+    else:
+        chains.append(stacked + '[stacked]')
+        chains.append('[stacked][' + str(int(info_strip_input)) + ':v]overlay=0:' + str(layout['info_strip'][0]) +
+                      ':shortest=1[out]')
+    return ';'.join(chains)
+
+
+def combine_ffmpeg(video_files, layout, output_path, fps, start_frames, frame_count=None, frame_step=1,
+                   info_text=None, encoder_options=None, progress=None, ffmpeg=None):
+    """
+    Makes the combined video with one ffmpeg subprocess (see the module docstring).
+
+    :param video_files:      Tuple of paths (Mordor .mov, Gondor .mov).
+    :param layout:           Dict, layout of the combined frame, see frame_layout.compute_layout.
+    :param output_path:      Path to the combined video file.
+    :param fps:              Numeric value, frame rate of the combined video.
+    :param start_frames:     Tuple (Mordor, Gondor) of the starting frames.
+    :param frame_count:      Int, number of output frames. Defaults to None, meaning until the end of either video.
+    :param frame_step:       Int, every frame_step-th source frame is used (proxy frame rates). Defaults to 1.
+    :param info_text:        Str, text for the info strip of the layout, see frame_layout.draw_info_strip.
+                             Defaults to None.
+    :param encoder_options:  Dict of encoder options (codec, preset, crf, threads), see
+                             video_writers.ffmpeg_encoder_args. Defaults to None (FFMPEG_DEFAULTS).
+    :param progress:         Callable progress(frames_written), called on each ffmpeg progress report (about twice a
+                             second). If it returns True, ffmpeg is stopped (SIGTERM, the output is finalised).
+                             Defaults to None.
+    :param ffmpeg:           Path to the ffmpeg executable. Defaults to None, meaning 'ffmpeg' on the PATH.
+    :return: frames:         Int, number of frames written.
+    :return: stopped:        Boolean, True if ffmpeg was stopped by progress.
+    """
+    if ffmpeg is None:
+        ffmpeg = shutil.which('ffmpeg')
+        if ffmpeg is None:
+            raise RuntimeError('Cannot find ffmpeg on the PATH, needed for the ffmpeg engine!')
+    info_y, info_h = layout.get('info_strip', (layout['panel_size'][1], 0))
+    strip_file = None
+    cmd = [ffmpeg, '-y', '-nostdin', '-loglevel', 'error', '-nostats', '-progress', 'pipe:1',
+           '-i', video_files[0], '-i', video_files[1]]
+    if info_h > 0 and info_text:
+        # the strip is rendered the same way as on the canvas of combine_videos.FrameComposer
+        strip = draw_info_strip(np.zeros((info_y + info_h, layout['out_size'][0], 3), np.uint8), layout,
+                                info_text)[info_y:]
+        fd, strip_file = tempfile.mkstemp(suffix='.png')
+        os.close(fd)
+        cv2.imwrite(strip_file, strip)
+        cmd += ['-loop', '1', '-framerate', str(fps), '-i', strip_file]
+    filtergraph = build_filtergraph(layout, start_frames, fps, frame_step, info_strip_input=2 if strip_file else None)
+    cmd += ['-filter_complex', filtergraph, '-map', '[out]', '-an', '-r', str(fps)]
+    if frame_count is not None:
+        cmd += ['-frames:v', str(int(frame_count))]
+    cmd += ffmpeg_encoder_args(**{key: value for key, value in (encoder_options or {}).items()
+                                  if key in ('codec', 'preset', 'crf', 'threads')}) + [output_path]
+    print('\nffmpeg filtergraph:', filtergraph)
+
+    frames, stopped = 0, False
+    # own session: terminal signals go to the caller only, which stops ffmpeg through progress
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True, start_new_session=True)
+    try:
+        # key=value progress lines, one block per report
+        for line in process.stdout:
+            key, _, value = line.strip().partition('=')
+            if key == 'frame':
+                frames = int(value)
+            elif key == 'progress' and progress is not None and not stopped and progress(frames):
+                stopped = True
+                process.terminate()
+        if process.wait() != 0 and not stopped:
+            raise RuntimeError('ffmpeg exited with code ' + str(process.returncode) + ' while writing ' +
+                               output_path + '! Command: ' + ' '.join(cmd))
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        if strip_file is not None:
+            os.remove(strip_file)
+    return frames, stopped
@@ -0,0 +1,110 @@
+"""
+CommGame project tools for subsequent video rater task.
+
+Layout engine for the combined videos. Computes where and how the Mordor and Gondor frames are placed on the combined
+frame, from the resolution of the source videos and the requested output resolution.
+
+The layout is the one of the original frame_connect (1920 * 1080 sources and output), generalized:
+- The upper 5/8 of the output frame holds two panels side-by-side, each half as wide as the output frame.
+- Source frames are scaled so that their height matches the panel height, then their central columns fill the panel,
+  that is, the left and right sides of the source frames are cut (10-10% for 16:9 sources and output).
+- The rest of the output frame is black.
+
+Output geometries (GEOMETRIES):
+- 'full':     The output frame has the requested (or source) resolution, the rows below the panels are black
+              (1920 * 1080 output with 1080p sources, 37% of which is black).
+- 'compact':  The output frame only holds the panel rows (1920 * 676 with 1080p sources: 675 rows, rounded up to an even
+              height for yuv420p encoding), so far fewer pixels are allocated, copied and encoded per frame. Panels are
+              sized exactly as in the 'full' geometry.
+Both geometries can have an info strip (static text, e.g. pair and session) of a given height right below the panels.
+
+Source frames are cropped to the visible columns before scaling, so only the visible part is resampled, and nothing is
+upscaled and then cropped. By default the output resolution is the source resolution (1920 * 1080 for freeConv,
+1280 * 720 for BG sessions), which is always the cheapest path: 720p sessions are not upscaled to 1080p
+(2.25x fewer pixels to compose and encode).
+
+"""
+
+import cv2
+
+
+# Panel height relative to the output frame height (675 rows of 1080).
+PANEL_HEIGHT_RATIO = 5 / 8
+# Output frame geometries, see the module docstring.
+GEOMETRIES = ('full', 'compact')
+
+
+def compute_layout(src_size, out_size=None, geometry='full', info_strip=0):
+    """
+    Computes the layout of the combined frame.
+
+    :param src_size:    Tuple (width, height), resolution of the source videos (both videos must have the same).
+    :param out_size:    Tuple (width, height), requested resolution of the combined video in the 'full' geometry
+                        (panels are sized from it in both geometries). Defaults to None, meaning the source resolution
+                        (native output).
+    :param geometry:    Str, output frame geometry, one of GEOMETRIES. Defaults to 'full'.
+    :param info_strip:  Int, height of the info strip below the panels, in pixels. Defaults to 0 (no info strip).
+    :return: layout:    Dictionary with the following "key: value" pairs:
+        src_size: Tuple (width, height) of source frames
+        out_size: Tuple (width, height) of the combined frame
+        panel_size: Tuple (width, height) of the area of one source frame on the combined frame
+        panel_x: Tuple of the first columns of the left (Mordor) and right (Gondor) panels on the combined frame
+        crop_x: Tuple (first, last + 1) of the source frame columns that are visible on the combined frame
+        scale: Float, scaling factor from source to combined frame
+        interpolation: Cv2 interpolation flag for resizing (INTER_AREA for downscaling, INTER_LINEAR for upscaling)
+        geometry: Str, output frame geometry
+        info_strip: Tuple (first row, height) of the info strip on the combined frame, height is 0 without a strip
+    """
+    if geometry not in GEOMETRIES:
+        raise ValueError('Output geometry should be one of ' + str(GEOMETRIES) + '!')
+    src_w, src_h = (int(v) for v in src_size)
+    if out_size is None:
+        out_w, out_h = src_w, src_h
+    else:
+        out_w, out_h = (int(v) for v in out_size)
+    if min(src_w, src_h, out_w, out_h) <= 0 or info_strip < 0:
+        raise ValueError('Invalid frame size! Source: ' + str(src_size) + '; output: ' + str(out_size) +
+                         '; info strip: ' + str(info_strip))
+
+    panel_w = out_w // 2
+    panel_h = int(round(out_h * PANEL_HEIGHT_RATIO))
+    scale = panel_h / src_h
+    # source columns covering the panel width, centered
+    crop_w = int(round(panel_w / scale))
+    if crop_w > src_w:
+        raise ValueError(' '.join(['Source frames (', str(src_w), 'x', str(src_h), ') are too narrow for output size',
+                                   str(out_w), 'x', str(out_h), '!']))
+    crop_x0 = (src_w - crop_w) // 2
+
+    if geometry == 'compact':
+        # panel rows and info strip only, even height for yuv420p encoding
+        out_h = panel_h + info_strip
+        out_h += out_h % 2
+    elif panel_h + info_strip > out_h:
+        raise ValueError('Info strip of ' + str(info_strip) + ' rows does not fit below the panels!')
+
+    return {'src_size': (src_w, src_h),
+            'out_size': (out_w, out_h),
+            'panel_size': (panel_w, panel_h),
+            'panel_x': (0, panel_w),
+            'crop_x': (crop_x0, crop_x0 + crop_w),
+            'scale': scale,
+            'interpolation': cv2.INTER_AREA if scale <= 1 else cv2.INTER_LINEAR,
+            'geometry': geometry,
+            'info_strip': (panel_h, int(info_strip))}
+
+
+def draw_info_strip(frame, layout, info_text):
+    """
+    Draws info_text (white) on the info strip of a combined frame, in place. Does nothing without an info strip.
+
+    :param frame:      Cv2 frame, combined frame (or any frame with the rows of the info strip).
+    :param layout:     Dict, layout of the combined frame, see compute_layout.
+    :param info_text:  Str, text to draw.
+    :return: frame:    The same frame.
+    """
+    info_y, info_h = layout.get('info_strip', (layout['panel_size'][1], 0))
+    if info_h > 0 and info_text:
+        cv2.putText(frame, info_text, (info_h // 4, info_y + int(info_h * 0.7)), cv2.FONT_HERSHEY_SIMPLEX,
+                    info_h / 50, (255, 255, 255), max(1, info_h // 25), cv2.LINE_AA)
+    return frame
@@ -0,0 +1,95 @@
+"""
+CommGame project tools for subsequent video rater task.
+
+Frame pairing engine for finding corresponding frames across the Mordor and Gondor video recordings, based on
+frame capture timestamps (frameCaptTime var in the .mat files).
+
+For each query timestamp, the frame with the closest capture timestamp is selected. Instead of computing the
+difference to every frame capture timestamp for every query (O(queries * frames)), the monotonic capture timestamp
+array is searched with np.searchsorted, and only the two neighbouring frames are compared (O(queries * log(frames))).
+The result is identical to the brute-force approach:
+    diffs = np.abs(frame_times - query)
+    idx = np.where(diffs == np.min(diffs))[0][0]
+including tie-breaking (the lower index wins).
+
+Used by combine_videos.py (frames_alignment) and combine_videos_BG.py (frame_alignment_accurate).
+
+"""
+
+import numpy as np
+
+
+# Number of query timestamps handled at once by the brute-force fallback, keeps memory use bounded.
+BRUTE_FORCE_CHUNK = 256
+
+
+def _nearest_brute_force(frame_times, query_times):
+    """
+    Fallback for non-monotonic frame capture timestamps. Compares each query timestamp to all frame capture timestamps,
+    in chunks of queries.
+
+    :param frame_times:  1D numpy array of frame capture timestamps.
+    :param query_times:  1D numpy array of query timestamps.
+    :return: indices:    1D numpy int array, index of the closest frame for each query timestamp.
+    """
+    indices = np.empty(query_times.size, dtype=np.int64)
+    for chunk_start in range(0, query_times.size, BRUTE_FORCE_CHUNK):
+        chunk = query_times[chunk_start:chunk_start + BRUTE_FORCE_CHUNK]
+        diffs = np.abs(frame_times[np.newaxis, :] - chunk[:, np.newaxis])
+        indices[chunk_start:chunk_start + chunk.size] = np.argmin(diffs, axis=1)
+    return indices
+
+
+def nearest_frame_indices(frame_times, query_times):
+    """
+    Finds the frame with the closest capture timestamp for each query timestamp.
+
+    :param frame_times:  1D array of frame capture timestamps (e.g. frame_times_m from extract_video_times_mat),
+                         expected to be monotonically non-decreasing. Non-monotonic input is handled by a (slow)
+                         brute-force fallback.
+    :param query_times:  Scalar or 1D array of query timestamps, in the same units as frame_times.
+    :return: indices:    Numpy int array with the same shape as query_times (int for scalar query_times),
+                         index of the closest frame for each query timestamp. In case of ties, the lower index is
+                         returned.
+    """
+    frame_times = np.asarray(frame_times, dtype=np.float64).ravel()
+    query_times = np.asarray(query_times, dtype=np.float64)
+    scalar_query = query_times.ndim == 0
+    queries = query_times.ravel()
+
+    if frame_times.size == 0:
+        raise ValueError('No frame capture timestamps to search!')
+
+    if frame_times.size == 1:
+        indices = np.zeros(queries.size, dtype=np.int64)
+    elif np.any(np.diff(frame_times) < 0):
+        print('WARNING! Frame capture timestamps are not monotonic, falling back to brute-force frame pairing.')
+        indices = _nearest_brute_force(frame_times, queries)
+    else:
+        # candidate neighbours: the last frame before and the first frame at or after each query
+        right = np.clip(np.searchsorted(frame_times, queries, side='left'), 1, frame_times.size - 1)
+        left = right - 1
+        use_left = np.abs(queries - frame_times[left]) <= np.abs(frame_times[right] - queries)
+        indices = np.where(use_left, left, right)
+        # repeated timestamps: return the first frame with the chosen timestamp, as the brute-force version does
+        indices = np.searchsorted(frame_times, frame_times[indices], side='left').astype(np.int64)
+
+    if scalar_query:
+        return int(indices[0])
+    return indices.reshape(query_times.shape)
+
+
+def pair_frame_indices(frame_times_m, frame_times_g, shared_times):
+    """
+    Pairs Mordor and Gondor frames to a common time axis: for each timestamp in shared_times, the closest frame
+    is selected from both recordings.
+
+    :param frame_times_m:   1D array of frame capture timestamps, Mordor lab recording.
+    :param frame_times_g:   1D array of frame capture timestamps, Gondor lab recording.
+    :param shared_times:    1D array of timestamps on the common time axis (e.g. np.arange at the target fps).
+    :return: paired_frame_indices: Numpy int array with shape (len(shared_times), 2). The first column contains Mordor,
+                                   the second column Gondor frame indices.
+    """
+    idx_m = nearest_frame_indices(frame_times_m, np.atleast_1d(shared_times))
+    idx_g = nearest_frame_indices(frame_times_g, np.atleast_1d(shared_times))
+    return np.column_stack((idx_m, idx_g))
@@ -0,0 +1,343 @@
+"""
+CommGame project tools for subsequent video rater task.
+
+Frame pipeline helpers for combine_videos.py. The frame combination loop is built from chained generators:
+    frame source (pairs of Mordor and Gondor frames) -> composition -> writing (in combine_frames)
+
+Before the loop, both videos are positioned at their start frames with seek_to_frame, without decoding (colour
+converting) the skipped frames ('grab' method) or by seeking ('seek' method), see SEEK_METHODS.
+
+There is a sequential and a pipelined (threaded) version of each stage:
+- sequential_frames / threaded_frames:  Yield pairs of decoded frames. The threaded version decodes each source video
+                                         in its own reader thread, into a bounded queue. Frames are either read in
+                                         lockstep, or according to a frame schedule (pair table, see source_frames).
+- compose_frames:                       Yields combined frames, in order. With workers > 0, composition runs in a thread
+                                         pool, with a bounded number of frames (and preallocated output frames)
+                                         in flight.
+
+Decoding (cv2.VideoCapture.read) and resizing (cv2.resize) release the GIL, so threads are enough for decode, compose
+and encode to overlap. Queues are bounded (back-pressure), so memory use does not grow with video length. The order
+of output frames is always the same as in the sequential version, so the written video is identical.
+
+"""
+
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from video_probe import probe_frame_pts
+
+
+# Default size of the per-source decoded frame queues in threaded mode.
+READER_QUEUE_SIZE = 8
+# Polling interval (secs) for reader threads blocked on a full queue, so that they notice a stop request.
+READER_POLL_S = 0.1
+# Marker put on the queue by a reader thread once its video is exhausted.
+_END_OF_STREAM = None
+# Positioning methods for seek_to_frame:
+# - 'grab': step through the preceding frames with grab() (no retrieval / colour conversion). Always exact.
+# - 'seek': seek with CAP_PROP_POS_FRAMES (the backend jumps to the preceding keyframe and decodes forward),
+#           then grab forward if the backend landed earlier. Start-up cost does not scale with the frame index.
+#           With frame timestamps (video_probe.probe_frame_pts), the landing frame is confirmed by its pts.
+SEEK_METHODS = ('grab', 'seek')
+# With frame timestamps, seeking aims this many frames before the target, then further back if it overshot.
+SEEK_MARGINS = (2, 30, 300)
+# Number of decoded frames kept per source in scheduled mode, for duplicated frames.
+RING_BUFFER_SIZE = 4
+
+
+def _grab_frames(cap, count):
+    """
+    Advances cap by count frames with grab(). Returns the number of frames actually grabbed.
+    """
+    grabbed = 0
+    while grabbed < count and cap.grab():
+        grabbed += 1
+    return grabbed
+
+
+def _pts_frame_index(frame_pts, pts):
+    """
+    Returns the index of the frame with presentation timestamp pts (secs) in frame_pts, None if there is none within
+    half a frame interval.
+    """
+    idx = int(np.clip(np.searchsorted(frame_pts, pts), 1, len(frame_pts) - 1)) if len(frame_pts) > 1 else 0
+    if idx > 0 and abs(frame_pts[idx - 1] - pts) < abs(frame_pts[idx] - pts):
+        idx -= 1
+    interval = np.diff(frame_pts[max(0, idx - 1):idx + 2])
+    tolerance = interval.min() / 2 if interval.size else 0.001
+    return idx if abs(frame_pts[idx] - pts) < tolerance else None
+
+
+def _seek_checked(cap, frame_idx, frame_pts):
+    """
+    'seek' method with the landing frame confirmed by its pts: seeks to a frame before frame_idx, grabs it, looks its
+    pts (CAP_PROP_POS_MSEC) up in frame_pts and grabs forward to frame_idx. Returns the index of the frame the next
+    read() returns, or None if no landing frame could be confirmed.
+    """
+    target = frame_idx - 1
+    for margin in SEEK_MARGINS:
+        landing = max(0, target - margin)
+        if not cap.set(cv2.CAP_PROP_POS_FRAMES, landing) or not cap.grab():
+            continue
+        position = _pts_frame_index(frame_pts, cap.get(cv2.CAP_PROP_POS_MSEC) / 1000)
+        if position is not None and position <= target:
+            return position + 1 + _grab_frames(cap, target - position)
+        if landing == 0:
+            break
+    return None
+
+
+def seek_to_frame(cap, frame_idx, method='grab', frame_pts=None):
+    """
+    Positions a freshly opened video capture so that the next read() returns frame frame_idx (0-based).
+
+    :param cap:        Cv2 VideoCapture object, at its first frame.
+    :param frame_idx:  Int, index of the frame to land on.
+    :param method:     Str, one of SEEK_METHODS. Defaults to 'grab'.
+    :param frame_pts:  Numpy array of the frame pts of the video ('frame_pts' of video_probe.probe_frame_pts), for
+                       confirming the landing frame of 'seek'. Defaults to None, meaning the frame position reported
+                       by the backend is trusted (it assumes a constant frame rate).
+    :return: position: Int, index of the frame the next read() returns. Smaller than frame_idx only if the video
+                       has fewer frames.
+    """
+    frame_idx = int(frame_idx)
+    if method not in SEEK_METHODS:
+        raise ValueError('Seek method should be one of ' + str(SEEK_METHODS) + '!')
+    if frame_idx <= 0:
+        return 0
+
+    if method == 'seek' and frame_pts is not None:
+        position = _seek_checked(cap, frame_idx, frame_pts)
+        if position is not None:
+            return position
+    elif method == 'seek':
+        if cap.set(cv2.CAP_PROP_POS_FRAMES, frame_idx):
+            position = int(cap.get(cv2.CAP_PROP_POS_FRAMES))
+            if position == frame_idx:
+                return position
+            if 0 <= position < frame_idx:
+                # landed earlier (e.g. on a keyframe), step forward
+                return position + _grab_frames(cap, frame_idx - position)
+    if method == 'seek':
+        # seeking failed or overshot, rewind and fall back to grabbing
+        print('WARNING! Seeking to frame', frame_idx, 'failed, falling back to grabbing frames.')
+        cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+
+    return _grab_frames(cap, frame_idx)
+
+
+def seek_video(cap, video_file, frame_idx, method='grab'):
+    """
+    seek_to_frame for a capture of video_file, with the frame timestamps of the video (video_probe.probe_frame_pts,
+    cached) for confirming the landing frame of 'seek', if ffprobe is available.
+    """
+    pts = probe_frame_pts(video_file) if method == 'seek' and int(frame_idx) > 0 else None
+    return seek_to_frame(cap, frame_idx, method, frame_pts=None if pts is None else pts['frame_pts'])
+
+
+def verify_seek(video_file, frame_idx, method='seek', open_cap=cv2.VideoCapture):
+    """
+    Checks that seek_to_frame lands on the right frame: the frame read after positioning a fresh capture with method
+    is compared against the frame_idx-th frame decoded sequentially (the reference, the frames before it are only
+    grabbed).
+
+    :param video_file: Path to video file.
+    :param frame_idx:  Int, index of the frame to land on.
+    :param method:     Str, one of SEEK_METHODS. Defaults to 'seek'.
+    :param open_cap:   Callable opening a video capture for video_file (e.g. frame_yuv.FFmpegReader for yuv420p
+                       frames). Defaults to cv2.VideoCapture.
+    :return: match:    Boolean, True if the two frames are identical.
+    """
+    reference_cap = open_cap(video_file)
+    ret_ref, reference = False, None
+    if _grab_frames(reference_cap, int(frame_idx)) == int(frame_idx):
+        ret_ref, reference = reference_cap.read()
+    reference_cap.release()
+
+    seek_cap = open_cap(video_file)
+    seek_video(seek_cap, video_file, frame_idx, method)
+    ret_seek, landed = seek_cap.read()
+    seek_cap.release()
+
+    if not (ret_ref and ret_seek):
+        return ret_ref == ret_seek
+    return landed.shape == reference.shape and bool(np.array_equal(landed, reference))
+
+
+def source_frames(cap, frame_indices=None, position=0, ring_size=RING_BUFFER_SIZE):
+    """
+    Yields frames of one video, either all frames in order, or the frames listed in frame_indices (scheduled mode).
+
+    In scheduled mode the video is still streamed through once, without random seeks: frames that are not needed are
+    skipped with grab() (no retrieval / colour conversion), and the last ring_size decoded frames are kept in a ring
+    buffer, so that repeated indices (duplicated frames) are served without decoding again. Memory use is constant,
+    regardless of video length.
+
+    :param cap:            Cv2 VideoCapture object, positioned at frame position.
+    :param frame_indices:  Iterable of non-decreasing frame indices to yield (e.g. a column of paired_frame_indices
+                           from frame_alignment_accurate). Defaults to None, meaning all frames from position on.
+    :param position:       Int, index of the frame the next cap.read() returns. Defaults to 0.
+    :param ring_size:      Int, number of decoded frames kept for repeated indices. Defaults to RING_BUFFER_SIZE.
+    :return: Generator of frames, ends when the video ends.
+    """
+    if frame_indices is None:
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                return
+            yield frame
+
+    ring = deque(maxlen=ring_size)
+    for frame_idx in frame_indices:
+        frame_idx = int(frame_idx)
+        # duplicated frame, already decoded
+        cached = next((frame for idx, frame in ring if idx == frame_idx), None)
+        if cached is not None:
+            yield cached
+            continue
+        if frame_idx < position:
+            raise ValueError(' '.join(['Frame schedule goes back to frame', str(frame_idx), 'from', str(position),
+                                       '- further than the ring buffer of', str(ring_size), 'frames!']))
+        # skip frames not needed for the output
+        position += _grab_frames(cap, frame_idx - position)
+        ret, frame = cap.read()
+        if position != frame_idx or not ret:
+            return
+        position += 1
+        ring.append((frame_idx, frame))
+        yield frame
+
+
+def _pair_sources(cap_mordor, cap_gondor, pairs, positions):
+    """
+    Per-source frame generators for sequential_frames / threaded_frames.
+    """
+    indices_m = indices_g = None
+    if pairs is not None:
+        pairs = np.asarray(pairs)
+        indices_m, indices_g = pairs[:, 0], pairs[:, 1]
+    return (source_frames(cap_mordor, indices_m, positions[0]),
+            source_frames(cap_gondor, indices_g, positions[1]))
+
+
+def sequential_frames(cap_mordor, cap_gondor, pairs=None, positions=(0, 0)):
+    """
+    Reads corresponding frames from the two video captures, until either video (or the frame schedule) ends.
+
+    :param cap_mordor:  Cv2 VideoCapture object, Mordor lab video, already positioned at the first frame to read.
+    :param cap_gondor:  Cv2 VideoCapture object, Gondor lab video, already positioned at the first frame to read.
+    :param pairs:       Frame schedule, (output frames, 2) array of Mordor and Gondor frame indices, non-decreasing in
+                        both columns. Defaults to None, meaning that frames are read in lockstep.
+    :param positions:   Tuple of ints, index of the frame the next read() returns, for Mordor and Gondor. Only used
+                        with pairs. Defaults to (0, 0).
+    :return: Generator of (frame_m, frame_g) tuples.
+    """
+    frames_m, frames_g = _pair_sources(cap_mordor, cap_gondor, pairs, positions)
+    for frame_m, frame_g in zip(frames_m, frames_g):
+        yield frame_m, frame_g
+
+
+def _reader(frames, frame_queue, stop_event, errors):
+    """
+    Reader thread target: puts frames from the frames generator into frame_queue, until the generator ends or
+    stop_event is set. Exceptions are appended to errors and end the stream.
+    """
+    while not stop_event.is_set():
+        try:
+            frame = next(frames, _END_OF_STREAM)
+        except Exception as exc:
+            errors.append(exc)
+            frame = _END_OF_STREAM
+        # blocking put with timeout, so that a stop request is noticed even if the queue is full
+        while not stop_event.is_set():
+            try:
+                frame_queue.put(frame, timeout=READER_POLL_S)
+                break
+            except queue.Full:
+                continue
+        if frame is _END_OF_STREAM:
+            return
+
+
+def threaded_frames(cap_mordor, cap_gondor, queue_size=READER_QUEUE_SIZE, pairs=None, positions=(0, 0)):
+    """
+    Same as sequential_frames, but each video is decoded in its own reader thread into a bounded queue.
+
+    :param cap_mordor:  Cv2 VideoCapture object, Mordor lab video, already positioned at the first frame to read.
+    :param cap_gondor:  Cv2 VideoCapture object, Gondor lab video, already positioned at the first frame to read.
+    :param queue_size:  Int, maximum number of decoded frames waiting in each queue. Defaults to READER_QUEUE_SIZE.
+    :param pairs:       Frame schedule, see sequential_frames. Defaults to None (lockstep).
+    :param positions:   Tuple of ints, see sequential_frames. Defaults to (0, 0).
+    :return: Generator of (frame_m, frame_g) tuples.
+    """
+    stop_event = threading.Event()
+    queue_m = queue.Queue(maxsize=queue_size)
+    queue_g = queue.Queue(maxsize=queue_size)
+    errors = []
+    frames_m, frames_g = _pair_sources(cap_mordor, cap_gondor, pairs, positions)
+    readers = [threading.Thread(target=_reader, args=(frames_m, queue_m, stop_event, errors), daemon=True),
+               threading.Thread(target=_reader, args=(frames_g, queue_g, stop_event, errors), daemon=True)]
+    for reader in readers:
+        reader.start()
+    try:
+        while True:
+            frame_m = queue_m.get()
+            frame_g = queue_g.get()
+            if frame_m is _END_OF_STREAM or frame_g is _END_OF_STREAM:
+                if errors:
+                    raise errors[0]
+                return
+            yield frame_m, frame_g
+    finally:
+        # stop readers (also if the consumer stopped early) and wait for them, captures are not thread-safe
+        stop_event.set()
+        for reader in readers:
+            reader.join()
+
+
+def compose_frames(frame_pairs, composer, workers=0, max_in_flight=None):
+    """
+    Combines each pair of frames with composer, yielding the results in input order.
+
+    A yielded frame is only valid until the next frame is requested: output frames (canvases) are reused. In sequential
+    mode the composer's own canvas is reused, in pipelined mode a fixed set of max_in_flight + 1 canvases is recycled.
+
+    :param frame_pairs:    Iterable of (frame_m, frame_g) tuples, e.g. from sequential_frames or threaded_frames.
+    :param composer:       Object with compose(frame_m, frame_g, out=None) and new_canvas() methods
+                           (e.g. combine_videos.FrameComposer).
+    :param workers:        Int, number of composition threads. 0 means composition runs inline, in the calling thread.
+                           Defaults to 0.
+    :param max_in_flight:  Int, maximum number of frames submitted to the pool but not yet yielded. Defaults to
+                           2 * workers.
+    :return: Generator of combined frames.
+    """
+    if workers <= 0:
+        for frame_m, frame_g in frame_pairs:
+            yield composer.compose(frame_m, frame_g)
+        return
+
+    if max_in_flight is None:
+        max_in_flight = 2 * workers
+    # canvases for the frames in flight plus the one held by the consumer
+    free_canvases = [composer.new_canvas() for _ in range(max_in_flight + 1)]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+
+        def release_oldest():
+            # wait for the oldest frame, hand it to the consumer, recycle its canvas once the consumer is done with it
+            canvas = pending.popleft().result()
+            yield canvas
+            free_canvases.append(canvas)
+
+        for frame_m, frame_g in frame_pairs:
+            pending.append(pool.submit(composer.compose, frame_m, frame_g, free_canvases.pop()))
+            # back-pressure: wait for the oldest frame before submitting more
+            if len(pending) >= max_in_flight:
+                yield from release_oldest()
+        while pending:
+            yield from release_oldest()
@@ -0,0 +1,42 @@
+"""
+CommGame project tools for subsequent video rater task.
+
+Opt-in interactive preview of the combined frames (combine_videos.py --preview). This is the only module with HighGUI
+calls (cv2.imshow, cv2.waitKey, cv2.destroyAllWindows), the combining itself runs headless.
+
+"""
+
+import cv2
+
+
+# Name of the preview window.
+PREVIEW_WINDOW = 'combined video'
+# Width of the preview window, in pixels (frames are downscaled for display).
+PREVIEW_WIDTH = 960
+
+
+class FramePreview:
+    """
+    Shows combined frames in a window, pressing 'q' in the window requests a stop.
+    """
+
+    def __init__(self, window_name=PREVIEW_WINDOW, width=PREVIEW_WIDTH):
+        self.window_name, self.width = window_name, width
+        cv2.namedWindow(window_name, cv2.WINDOW_AUTOSIZE)
+
+    def show(self, frame):
+        """
+        Shows a frame and polls the keyboard.
+
+        :param frame:   Cv2 frame (BGR).
+        :return: quit:  Boolean, True if 'q' was pressed.
+        """
+        height, width = frame.shape[:2]
+        if width > self.width:
+            frame = cv2.resize(frame, (self.width, int(round(height * self.width / width))),
+                               interpolation=cv2.INTER_AREA)
+        cv2.imshow(self.window_name, frame)
+        return cv2.waitKey(1) & 0xFF == ord('q')
+
+    def close(self):
+        cv2.destroyAllWindows()
@@ -0,0 +1,128 @@
+"""
+CommGame project tools for subsequent video rater task.
+
+Per-output-frame provenance table of a combined video (combine_videos.py): for each output frame, the Mordor and
+Gondor source frames shown on it and their capture times (frameCaptTime), so that any output frame (or a rater slider
+sample, at output frame = time * fps) can be mapped back to the source frames without reloading the .mat files or
+re-running the alignment.
+
+The table is a .npy file of PROVENANCE_DTYPE records, one per output frame, in output frame order:
+    output_frame:  Output frame index (0-based)
+    frame_m:       Mordor source frame index
+    frame_g:       Gondor source frame index
+    capt_time_m:   Capture time of the Mordor frame (UNIX, secs), NaN if there is no timestamp for it
+    capt_time_g:   Capture time of the Gondor frame (UNIX, secs), NaN if there is no timestamp for it
+    offset_s:      Residual offset capt_time_m - capt_time_g, in secs (positive: the Mordor frame is later)
+It is written incrementally while combining (ProvenanceWriter, with the writer interface of video_writers.py), in
+blocks of PROVENANCE_FLUSH_FRAMES records, with the header updated after each block, so the file is a valid table of
+the frames written so far (up to the last block) even if combining is stopped. Load it memory-mapped with
+load_provenance: table[i] is a constant-time lookup.
+
+"""
+
+import os
+import struct
+
+import numpy as np
+
+
+# Record of one output frame, see the module docstring.
+PROVENANCE_DTYPE = np.dtype([('output_frame', '<u4'), ('frame_m', '<u4'), ('frame_g', '<u4'),
+                             ('capt_time_m', '<f8'), ('capt_time_g', '<f8'), ('offset_s', '<f8')])
+# Records are built and written in blocks of this many frames, then the .npy header (frame count) is updated.
+PROVENANCE_FLUSH_FRAMES = 1000
+# .npy format 1.0 header: magic string and version, header length, then the header dict padded with spaces to a fixed
+# length (a multiple of 64), so that it can be rewritten in place with any frame count
+_NPY_PREFIX = b'\x93NUMPY\x01\x00'
+_HEADER_DICT = "{'descr': " + repr(np.lib.format.dtype_to_descr(PROVENANCE_DTYPE)) + ", 'fortran_order': False, " \
+               "'shape': (%d,), }"
+_HEADER_LEN = 64 * -(-(len(_NPY_PREFIX) + 2 + len(_HEADER_DICT % 2 ** 32) + 1) // 64)
+
+
+def provenance_path(output_path):
+    """
+    Path of the provenance table of a combined video: [VIDEO without .mp4]_frames.npy.
+    """
+    return os.path.splitext(output_path)[0] + '_frames.npy'
+
+
+def _npy_header(count):
+    header = (_HEADER_DICT % count).ljust(_HEADER_LEN - len(_NPY_PREFIX) - 3) + '\n'
+    return _NPY_PREFIX + struct.pack('<H', len(header)) + header.encode('latin1')
+
+
+def load_provenance(path):
+    """
+    Loads a provenance table memory-mapped (read-only structured array, see PROVENANCE_DTYPE).
+    """
+    return np.load(path, mmap_mode='r')
+
+
+class ProvenanceWriter:
+    """
+    Writes the provenance table of a combined video, one record per write() call (the frame itself is not used), see
+    the module docstring. Records are buffered as a count only, and built and written in blocks.
+    """
+
+    def __init__(self, path, frame_indices, capt_times_m, capt_times_g, first_frame=0):
+        """
+        :param path:           Path to the provenance table (.npy), see provenance_path.
+        :param frame_indices:  Function mapping an output frame index to the (Mordor, Gondor) source frame indices.
+        :param capt_times_m:   Numpy array of Mordor frame capture timestamps (frameCaptTime).
+        :param capt_times_g:   Numpy array of Gondor frame capture timestamps (frameCaptTime).
+        :param first_frame:    Int, index of the first output frame passed to write(). Records of the frames before
+                               (e.g. written by an earlier, resumed run) are written right away. Defaults to 0.
+        """
+        self.path, self.frame_indices = path, frame_indices
+        self.capt_times = (np.asarray(capt_times_m, dtype=np.float64), np.asarray(capt_times_g, dtype=np.float64))
+        self.file = open(path, 'wb')
+        self.file.write(_npy_header(0))
+        # frames passed so far, and frames with records in the file
+        self.frame_idx = self.frames_flushed = 0
+        if first_frame > 0:
+            self.write_frames(first_frame)
+
+    def _records(self, first, stop):
+        records = np.zeros(stop - first, PROVENANCE_DTYPE)
+        records['output_frame'] = np.arange(first, stop)
+        indices = np.array([self.frame_indices(frame_idx) for frame_idx in range(first, stop)],
+                           dtype=np.int64).reshape(-1, 2)
+        for column, (field, times) in enumerate(zip(('m', 'g'), self.capt_times)):
+            records['frame_' + field] = indices[:, column]
+            valid = indices[:, column] < times.size
+            records['capt_time_' + field] = np.nan
+            records['capt_time_' + field][valid] = times[indices[valid, column]]
+        records['offset_s'] = records['capt_time_m'] - records['capt_time_g']
+        return records
+
+    def _flush(self):
+        """
+        Writes the records of the buffered frames, then updates the header.
+        """
+        if self.frame_idx == self.frames_flushed:
+            return
+        self.file.write(self._records(self.frames_flushed, self.frame_idx).tobytes())
+        self.frames_flushed = self.frame_idx
+        self.file.flush()
+        position = self.file.tell()
+        self.file.seek(0)
+        self.file.write(_npy_header(self.frames_flushed))
+        self.file.seek(position)
+
+    def write_frames(self, count):
+        """
+        Writes the records of the next count output frames at once (e.g. for videos encoded outside the frame loop).
+        """
+        self.frame_idx += count
+        self._flush()
+
+    def write(self, frame=None):
+        self.frame_idx += 1
+        if self.frame_idx - self.frames_flushed >= PROVENANCE_FLUSH_FRAMES:
+            self._flush()
+
+    def release(self):
+        if self.file.closed:
+            return
+        self._flush()
+        self.file.close()
@@ -0,0 +1,318 @@
+"""
+CommGame project tools for subsequent video rater task.
+
+Process-based composition for combine_videos.py (compose_processes > 0), with frames in shared memory.
+
+Threads (frame_pipeline.py) overlap decoding, composition and encoding, but the Python parts of composition still
+contend for the GIL, and passing frames between processes by pickling would cost more than it saves (6 MB per 1080p
+BGR frame). Here frames never leave shared memory:
+
+    reader process (Mordor) --> source ring M --+
+                                                +--> compose worker processes --> output ring --> writer (caller)
+    reader process (Gondor) --> source ring G --+
+
+- FrameRing:  A multiprocessing.shared_memory block of preallocated frame slots. All rings are allocated up front, so
+              memory use is fixed for the whole run (shm_composed_frames prints it).
+- Reader processes decode their video directly into free source slots (cv2.VideoCapture.read into the slot, or
+  frame_yuv.FFmpegReader for yuv420p frames), either in lockstep or according to a frame schedule, and pass on the slot
+  indices in order. Only duplicated frames of a schedule are copied (slot to slot).
+- Compose worker processes compose a pair of source slots into an output slot, in place (composer.compose with
+  out=slot), then release the source slots.
+- The caller (shm_composed_frames) pairs source slots, hands out output slots, and yields the composed output slots
+  in order. Only slot indices travel through the queues.
+
+Slot lifecycle, per ring: free -> written (reader / worker) -> queued -> consumed -> free. Source slots are freed by
+the worker once composed, output slots by the caller once the next frame is requested. The number of frames in flight
+is bounded by the ring sizes (back-pressure), as with the queues of frame_pipeline.
+
+"""
+
+import multiprocessing as mp
+import queue
+from collections import deque
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from frame_pipeline import seek_video
+from frame_yuv import open_capture, frame_shape
+from run_control import child_signals
+
+
+# Polling interval (secs) for processes blocked on a queue, so that they notice a stop request or a dead process.
+POLL_S = 0.1
+# Marker put on a full-slot queue by a reader process once its video (or schedule) is exhausted.
+_END_OF_STREAM = None
+
+
+def _attach_shm(name):
+    """
+    Attaches an existing shared memory block without registering it with the resource tracker of this process (the
+    creating process owns and unlinks it).
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13: attaching registers the block, unregister it again
+        from multiprocessing import resource_tracker
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+
+class FrameRing:
+    """
+    Preallocated frame slots in one shared memory block, see the module docstring. ring[slot] is a numpy view of the
+    slot, no copies.
+    """
+
+    def __init__(self, slots, shape, name=None):
+        """
+        :param slots:  Int, number of frame slots.
+        :param shape:  Tuple, shape of one frame (uint8).
+        :param name:   Str, name of an existing block to attach to (see spec). Defaults to None, meaning a new block
+                       is created (and owned) by this process.
+        """
+        self.slots, self.shape = int(slots), tuple(int(v) for v in shape)
+        self.owner = name is None
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=self.slots * int(np.prod(self.shape)))
+        else:
+            self.shm = _attach_shm(name)
+        self.frames = np.ndarray((self.slots,) + self.shape, np.uint8, buffer=self.shm.buf)
+
+    @property
+    def spec(self):
+        """
+        Picklable (name, slots, shape), for attaching in another process: FrameRing(*spec[1:], name=spec[0]).
+        """
+        return self.shm.name, self.slots, self.shape
+
+    @classmethod
+    def attach(cls, spec):
+        name, slots, shape = spec
+        return cls(slots, shape, name=name)
+
+    @property
+    def nbytes(self):
+        return self.frames.nbytes
+
+    def __getitem__(self, slot):
+        return self.frames[slot]
+
+    def close(self):
+        """
+        Detaches from the block, and frees it if owned.
+        """
+        if self.frames is None:
+            return
+        self.frames = None
+        try:
+            self.shm.close()
+        except BufferError:
+            # a caller still holds a frame view, the mapping goes away with the last view
+            pass
+        if self.owner:
+            self.shm.unlink()
+
+
+def _get(slot_queue, stop_event=None, processes=(), parent=None):
+    """
+    Blocking get from slot_queue that returns None once stop_event is set or the parent process is gone, and raises if
+    one of processes died.
+    """
+    while True:
+        try:
+            return slot_queue.get(timeout=POLL_S)
+        except queue.Empty:
+            if stop_event is not None and stop_event.is_set():
+                return None
+            if parent is not None and not parent.is_alive():
+                return None
+            for process in processes:
+                if process.exitcode not in (None, 0):
+                    raise RuntimeError('Frame process ' + process.name + ' died with exit code ' +
+                                       str(process.exitcode) + '!')
+
+
+def _reader_process(video_file, frame_format, size, first_frame, frame_indices, seek_method, ring_spec, free_slots,
+                    full_slots, stop_event):
+    """
+    Reader process target: decodes frames into free slots of its source ring and queues the slot indices, in order,
+    then _END_OF_STREAM. Exceptions are queued in place of a slot index.
+    """
+    child_signals()
+    ring = FrameRing.attach(ring_spec)
+    cap = open_capture(video_file, frame_format, size)
+    parent = mp.parent_process()
+    try:
+        position = seek_video(cap, video_file, first_frame, seek_method)
+        last_idx = last_slot = None
+        frame_idx = position - 1
+        indices = iter(frame_indices) if frame_indices is not None else None
+        while True:
+            frame_idx = frame_idx + 1 if indices is None else int(next(indices, -1))
+            if frame_idx < 0:
+                break
+            slot = _get(free_slots, stop_event, parent=parent)
+            if slot is None:
+                break
+            if frame_idx == last_idx:
+                # duplicated frame of the schedule, the last slot still holds it (only this process writes the ring)
+                np.copyto(ring[slot], ring[last_slot])
+            else:
+                if frame_idx < position:
+                    raise ValueError('Frame schedule goes back to frame ' + str(frame_idx) + ' from ' + str(position) +
+                                     '!')
+                # skip frames not needed for the output
+                while position < frame_idx and cap.grab():
+                    position += 1
+                ret, frame = cap.read(ring[slot]) if position == frame_idx else (False, None)
+                if not ret:
+                    free_slots.put(slot)
+                    break
+                if not np.may_share_memory(frame, ring[slot]):
+                    # the backend allocated a new frame instead of decoding into the slot
+                    np.copyto(ring[slot], frame)
+                position += 1
+            last_idx, last_slot = frame_idx, slot
+            full_slots.put(slot)
+    except Exception as exc:
+        full_slots.put(exc)
+    finally:
+        full_slots.put(_END_OF_STREAM)
+        cap.release()
+        ring.close()
+
+
+def _compose_process(composer, ring_specs, tasks, done, free_slots_m, free_slots_g):
+    """
+    Compose worker process target: composes (seq, slot_m, slot_g, slot_out) tasks into the output ring, frees the
+    source slots and queues (seq, slot_out). A None task (or the end of the parent process) ends the worker. Exceptions
+    are queued as results.
+    """
+    child_signals()
+    ring_m, ring_g, ring_out = (FrameRing.attach(spec) for spec in ring_specs)
+    parent = mp.parent_process()
+    try:
+        while True:
+            task = _get(tasks, parent=parent)
+            if task is None:
+                return
+            seq, slot_m, slot_g, slot_out = task
+            composer.compose(ring_m[slot_m], ring_g[slot_g], out=ring_out[slot_out])
+            free_slots_m.put(slot_m)
+            free_slots_g.put(slot_g)
+            done.put((seq, slot_out))
+    except Exception as exc:
+        done.put(exc)
+    finally:
+        for ring in (ring_m, ring_g, ring_out):
+            ring.close()
+
+
+def shm_composed_frames(video_files, composer, src_size, frame_format='bgr', pairs=None, positions=(0, 0),
+                        seek_method='grab', processes=2, ring_slots=None):
+    """
+    Decodes and composes frames in separate processes through shared memory rings (see the module docstring), yielding
+    the combined frames in order. Counterpart of frame_pipeline.compose_frames(threaded_frames(...)) with processes.
+
+    A yielded frame is a view of an output slot, only valid until the next frame is requested.
+
+    :param video_files:   Tuple of paths (Mordor .mov, Gondor .mov).
+    :param composer:      Picklable object with compose(frame_m, frame_g, out) and new_canvas() methods (e.g.
+                          combine_videos.FrameComposer or frame_yuv.YUVFrameComposer), copied to each worker.
+    :param src_size:      Tuple (width, height) of the source frames.
+    :param frame_format:  Str, frame format of the sources and the composer, see frame_yuv.FRAME_FORMATS. Defaults to
+                          'bgr'.
+    :param pairs:         Frame schedule, (output frames, 2) array of Mordor and Gondor frame indices, see
+                          frame_pipeline.sequential_frames. Defaults to None, meaning that frames are read in lockstep.
+    :param positions:     Tuple of ints, first frames (Mordor, Gondor) for lockstep reading, the readers seek to them.
+                          Not used with pairs. Defaults to (0, 0).
+    :param seek_method:   Str, see frame_pipeline.seek_video. Defaults to 'grab'.
+    :param processes:     Int, number of compose worker processes. Defaults to 2.
+    :param ring_slots:    Int, number of slots of each ring. Defaults to None, meaning 2 * processes + 2.
+    :return: Generator of combined frames.
+    """
+    if ring_slots is None:
+        ring_slots = 2 * processes + 2
+    canvas = composer.new_canvas()
+    rings = [FrameRing(ring_slots, frame_shape(src_size, frame_format)),
+             FrameRing(ring_slots, frame_shape(src_size, frame_format)),
+             FrameRing(ring_slots, canvas.shape)]
+    ring_out = rings[2]
+    print('Shared memory frame rings:', round(sum(ring.nbytes for ring in rings) / 1024 ** 2), 'MiB in',
+          3 * ring_slots, 'slots.')
+    # output slots keep the black part and the info strip, compose only overwrites the panels
+    for slot in range(ring_slots):
+        ring_out[slot][...] = canvas
+
+    ctx = mp.get_context()
+    stop_event = ctx.Event()
+    free_slots = [ctx.Queue(), ctx.Queue()]
+    full_slots = [ctx.Queue(), ctx.Queue()]
+    tasks, done = ctx.Queue(), ctx.Queue()
+    for free in free_slots:
+        for slot in range(ring_slots):
+            free.put(slot)
+    if pairs is not None:
+        pairs = np.asarray(pairs)
+    frame_processes = []
+    for src_idx, video_file in enumerate(video_files):
+        frame_indices = None if pairs is None else pairs[:, src_idx]
+        first_frame = positions[src_idx] if pairs is None else (int(pairs[0, src_idx]) if len(pairs) else 0)
+        frame_processes.append(ctx.Process(target=_reader_process, name='reader' + str(src_idx), daemon=True,
+                                           args=(video_file, frame_format, src_size, first_frame, frame_indices,
+                                                 seek_method, rings[src_idx].spec, free_slots[src_idx],
+                                                 full_slots[src_idx], stop_event)))
+    for worker_idx in range(processes):
+        frame_processes.append(ctx.Process(target=_compose_process, name='composer' + str(worker_idx), daemon=True,
+                                           args=(composer, [ring.spec for ring in rings], tasks, done,
+                                                 free_slots[0], free_slots[1])))
+    for process in frame_processes:
+        process.start()
+
+    def checked(item):
+        if isinstance(item, BaseException):
+            raise item
+        return item
+
+    free_out = deque(range(ring_slots))
+    composed = {}
+    seq_dispatched = seq_yielded = 0
+    ended = pairs is not None and not len(pairs)
+    try:
+        while True:
+            # hand out pairs of source slots as long as there is a free output slot
+            while not ended and free_out:
+                slot_m = checked(_get(full_slots[0], processes=frame_processes))
+                slot_g = checked(_get(full_slots[1], processes=frame_processes)) if slot_m is not None else None
+                if slot_m is None or slot_g is None:
+                    ended = True
+                    break
+                tasks.put((seq_dispatched, slot_m, slot_g, free_out.popleft()))
+                seq_dispatched += 1
+            if seq_yielded == seq_dispatched:
+                return
+            # next frame in order
+            while seq_yielded not in composed:
+                seq, slot_out = checked(_get(done, processes=frame_processes))
+                composed[seq] = slot_out
+            slot_out = composed.pop(seq_yielded)
+            yield ring_out[slot_out]
+            free_out.append(slot_out)
+            seq_yielded += 1
+    finally:
+        stop_event.set()
+        for _ in range(processes):
+            tasks.put(None)
+        for process in frame_processes:
+            process.join(timeout=5 * POLL_S)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+        for slot_queue in free_slots + full_slots + [tasks, done]:
+            slot_queue.cancel_join_thread()
+            slot_queue.close()
+        for ring in rings:
+            ring.close()
@@ -0,0 +1,259 @@
+"""
+CommGame project tools for subsequent video rater task.
+
+Planar YUV 4:2:0 composition path for combine_videos.py (frame_format='yuv420p').
+
+In the default (BGR) path, cv2.VideoCapture.read converts each decoded yuv420p frame to BGR, FrameComposer resizes in
+BGR, and the writer converts back to yuv420p before encoding: two full colour conversions per source frame, and
+twice the bytes of the planar format (3 bytes per pixel instead of 1.5) in every copy and resize. In the YUV path the
+frames stay planar yuv420p end to end:
+- FFmpegReader:      Decodes a video with an ffmpeg subprocess into raw yuv420p frames, with the cv2.VideoCapture
+                     methods used by frame_pipeline (read, grab, get / set of CAP_PROP_POS_FRAMES, release). Setting
+                     the position restarts ffmpeg with an input-side seek (-ss before -i, from the keyframe before the
+                     target), so the frames before it are not decoded. The seek time is taken from the pts of the
+                     landing frame (video_probe.probe_frame_pts, ffprobe), so that ffmpeg's accurate seeking returns
+                     exactly that frame first, also with the jittered frame times of the recordings. Without ffprobe,
+                     a constant frame rate is assumed.
+- YUVFrameComposer:  FrameComposer for yuv420p frames: the visible columns of each plane are resized into the planes
+                     of a reusable yuv420p canvas (the chroma planes at half resolution).
+- The combined frames go to the ffmpeg writer backend with input_pix_fmt='yuv420p' (video_writers.FFmpegWriter), so
+  ffmpeg encodes them without a conversion.
+
+yuv420p frames are 2D uint8 arrays of (height * 3 / 2) * width, with the Y plane followed by the U and V planes, the
+layout of cv2.COLOR_BGR2YUV_I420. Frame widths and heights must be even. Values are in video range (black is Y=16,
+U=V=128), as decoded from the source videos and as cv2 converts BGR frames.
+
+"""
+
+import shutil
+import subprocess
+
+import cv2
+import numpy as np
+
+from frame_layout import draw_info_strip
+from video_probe import probe_video, probe_frame_pts
+
+
+# Frame formats of the composition path, see combine_videos.combine_frames.
+FRAME_FORMATS = ('bgr', 'yuv420p')
+# FFmpegReader seeks to this many frames before the target frame, then drops them with an exact (counted) trim.
+SEEK_MARGIN_FRAMES = 2
+
+
+def yuv420p_planes(frame, width, height):
+    """
+    Returns (Y, U, V) plane views of a yuv420p frame (no copies).
+
+    :param frame:   2D uint8 array, (height * 3 / 2) * width, C-contiguous.
+    :param width:   Int, frame width (even).
+    :param height:  Int, frame height (even).
+    :return: planes: Tuple of 2D arrays, Y (height * width), U and V (height / 2 * width / 2).
+    """
+    flat = frame.reshape(-1)
+    luma, chroma = width * height, (width // 2) * (height // 2)
+    return (flat[:luma].reshape(height, width),
+            flat[luma:luma + chroma].reshape(height // 2, width // 2),
+            flat[luma + chroma:luma + 2 * chroma].reshape(height // 2, width // 2))
+
+
+class FFmpegReader:
+    """
+    Video reader decoding a video into raw yuv420p frames with an ffmpeg subprocess, see the module docstring.
+    Every decoded frame is returned (no frame rate conversion), as with cv2.VideoCapture.
+    """
+
+    def __init__(self, video_file, size, fps=None, ffmpeg=None):
+        """
+        :param video_file:  Path to the video file.
+        :param size:        Tuple (width, height) of the video frames (even), e.g. from video_probe.probe_video.
+        :param fps:         Numeric value, frame rate of the video, for seeking without frame timestamps (ffprobe).
+                            Defaults to None, meaning the frame rate from video_probe.probe_video (cached).
+        :param ffmpeg:      Path to the ffmpeg executable. Defaults to None, meaning 'ffmpeg' on the PATH.
+        """
+        if ffmpeg is None:
+            ffmpeg = shutil.which('ffmpeg')
+            if ffmpeg is None:
+                raise RuntimeError('Cannot find ffmpeg on the PATH, needed for yuv420p decoding!')
+        self.video_file, self.ffmpeg = video_file, ffmpeg
+        self.fps = float(fps) if fps else probe_video(video_file)['fps']
+        # frame pts relative to the stream start, and the stream start in the file, None without ffprobe
+        self.frame_pts = probe_frame_pts(video_file)
+        self.width, self.height = (int(v) for v in size)
+        if self.width % 2 or self.height % 2:
+            raise ValueError('yuv420p frames need an even width and height, got ' + str(tuple(size)) + '!')
+        self.frame_shape = frame_shape(size, 'yuv420p')
+        self.scratch = np.empty(self.frame_shape, np.uint8)
+        self.process = None
+        self.position = 0
+        self._start(0)
+
+    def _start(self, frame_idx):
+        """
+        (Re)starts the decoder so that the next read() returns frame frame_idx.
+        """
+        self.release()
+        cmd = [self.ffmpeg, '-nostdin', '-loglevel', 'error']
+        # input-side seek to SEEK_MARGIN_FRAMES before frame_idx, decoding starts from the keyframe before it and the
+        # first frame returned is the landing frame
+        landing_idx = max(0, int(frame_idx) - SEEK_MARGIN_FRAMES)
+        if landing_idx > 0:
+            cmd += ['-ss', '%.6f' % self._seek_time(landing_idx)]
+        cmd += ['-i', self.video_file, '-map', '0:v:0']
+        if frame_idx > landing_idx:
+            # the frames between the landing frame and frame_idx are decoded but not converted or piped
+            cmd += ['-vf', 'trim=start_frame=' + str(int(frame_idx) - landing_idx)]
+        cmd += ['-fps_mode', 'passthrough', '-f', 'rawvideo', '-pix_fmt', 'yuv420p', 'pipe:1']
+        self.process = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+        self.position = int(frame_idx)
+
+    def _seek_time(self, frame_idx):
+        """
+        Input seek time (-ss, secs from the start of the file) that lands on frame frame_idx: halfway between the pts
+        of the frame and of the one before, or half a frame early at a constant frame rate without frame timestamps.
+        """
+        if self.frame_pts is None or frame_idx >= len(self.frame_pts['frame_pts']):
+            return (frame_idx - 0.5) / self.fps
+        frame_pts = self.frame_pts['frame_pts']
+        return (frame_pts[frame_idx - 1] + frame_pts[frame_idx]) / 2 + self.frame_pts['stream_offset']
+
+    def _read_into(self, frame):
+        if self.process is None:
+            return False
+        view = memoryview(frame).cast('B')
+        if self.process.stdout.readinto(view) != view.nbytes:
+            return False
+        self.position += 1
+        return True
+
+    def isOpened(self):
+        return self.process is not None
+
+    def read(self, image=None):
+        # into image if supplied (as cv2.VideoCapture.read), else a new array per frame, frames may be held by the
+        # frame pipeline (queues, ring buffers)
+        frame = np.empty(self.frame_shape, np.uint8) if image is None else image
+        if not self._read_into(frame):
+            return False, None
+        return True, frame
+
+    def grab(self):
+        return self._read_into(self.scratch)
+
+    def get(self, prop_id):
+        if prop_id == cv2.CAP_PROP_POS_FRAMES:
+            return float(self.position)
+        if prop_id == cv2.CAP_PROP_POS_MSEC:
+            # pts of the last frame returned, relative to the stream start, as cv2 reports it
+            if self.frame_pts is not None and 0 < self.position <= len(self.frame_pts['frame_pts']):
+                return 1000 * float(self.frame_pts['frame_pts'][self.position - 1])
+            return 1000 * (self.position - 1) / self.fps
+        if prop_id == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self.width)
+        if prop_id == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self.height)
+        return 0.0
+
+    def set(self, prop_id, value):
+        # positioning by restarting the decoder with an input-side seek (see _start and frame_pipeline.seek_to_frame)
+        if prop_id != cv2.CAP_PROP_POS_FRAMES or value < 0:
+            return False
+        self._start(int(value))
+        return True
+
+    def release(self):
+        if self.process is None:
+            return
+        self.process.stdout.close()
+        if self.process.poll() is None:
+            self.process.terminate()
+        self.process.wait()
+        self.process = None
+
+
+def frame_shape(size, frame_format='bgr'):
+    """
+    Returns the array shape of decoded frames of a video with the given size (width, height), in frame_format.
+    """
+    width, height = (int(v) for v in size)
+    if frame_format == 'yuv420p':
+        return height * 3 // 2, width
+    return height, width, 3
+
+
+def open_capture(video_file, frame_format='bgr', size=None):
+    """
+    Opens a video for the frame pipeline: a cv2.VideoCapture for 'bgr' frames, an FFmpegReader for 'yuv420p'
+    frames.
+
+    :param video_file:    Path to the video file.
+    :param frame_format:  Str, one of FRAME_FORMATS. Defaults to 'bgr'.
+    :param size:          Tuple (width, height) of the video frames, needed for 'yuv420p'. Defaults to None.
+    :return: cap:         Video capture object.
+    """
+    if frame_format == 'bgr':
+        return cv2.VideoCapture(video_file)
+    if frame_format == 'yuv420p':
+        return FFmpegReader(video_file, size)
+    raise ValueError('Frame format should be one of ' + str(FRAME_FORMATS) + '!')
+
+
+class YUVFrameComposer:
+    """
+    Combines two yuv420p frames onto one yuv420p output frame, according to a layout from frame_layout.compute_layout,
+    with the same interface as combine_videos.FrameComposer (compose and new_canvas). Each plane is cropped to the
+    visible columns and resized directly into the corresponding plane of the canvas, the chroma planes with the
+    layout halved. The black part of the canvas and the info strip (if any) are converted from BGR once per canvas.
+
+    SOURCE FRAME RESOLUTION IS NOT CHECKED, IT MUST MATCH layout['src_size']!
+    """
+
+    def __init__(self, layout, info_text=None):
+        """
+        :param layout:     Dict, output of frame_layout.compute_layout, with even source and output sizes.
+        :param info_text:  Str, static text for the info strip of the layout. Defaults to None.
+        """
+        for key in ('src_size', 'out_size'):
+            if layout[key][0] % 2 or layout[key][1] % 2:
+                raise ValueError('yuv420p frames need an even width and height, got ' + key + ' ' +
+                                 str(tuple(layout[key])) + '!')
+        self.layout = layout
+        self.info_text = info_text
+        self.src_w, self.src_h = layout['src_size']
+        self.out_w, self.out_h = layout['out_size']
+        self.interpolation = layout['interpolation']
+        panel_w, panel_h = layout['panel_size']
+        crop_x0, crop_x1 = layout['crop_x']
+        # per plane: (source column slice, output row count, output column slices of the two panels)
+        self.plane_layouts = [(slice(crop_x0, crop_x1), panel_h,
+                               [slice(x, x + panel_w) for x in layout['panel_x']])]
+        chroma_h = min((panel_h + 1) // 2, self.out_h // 2)
+        chroma_cols = [slice(x // 2, min((x + panel_w + 1) // 2, self.out_w // 2)) for x in layout['panel_x']]
+        self.plane_layouts += [(slice(crop_x0 // 2, (crop_x1 + 1) // 2), chroma_h, chroma_cols)] * 2
+        self.canvas = self.new_canvas()
+
+    def new_canvas(self):
+        """
+        Returns a black yuv420p output frame, with the info text on the info strip, if any.
+        """
+        canvas = draw_info_strip(np.zeros((self.out_h, self.out_w, 3), np.uint8), self.layout, self.info_text)
+        return cv2.cvtColor(canvas, cv2.COLOR_BGR2YUV_I420)
+
+    def compose(self, frame_left, frame_right, out=None):
+        """
+        :param frame_left:    yuv420p frame, to be used on the left side of the combined frame.
+        :param frame_right:   yuv420p frame, to be used on the right side of the combined frame.
+        :param out:           Output frame to write into, from new_canvas(). Only the panel region is overwritten.
+                              Defaults to None, meaning the composer's own canvas.
+        :return: out:         The combined yuv420p frame (the composer's canvas, if out was not supplied).
+        """
+        if out is None:
+            out = self.canvas
+        out_planes = yuv420p_planes(out, self.out_w, self.out_h)
+        for panel_idx, frame in enumerate((frame_left, frame_right)):
+            src_planes = yuv420p_planes(frame, self.src_w, self.src_h)
+            for src_plane, out_plane, (src_cols, rows, out_cols) in zip(src_planes, out_planes, self.plane_layouts):
+                dst = out_plane[0:rows, out_cols[panel_idx]]
+                cv2.resize(src_plane[:, src_cols], (dst.shape[1], dst.shape[0]), dst=dst,
+                           interpolation=self.interpolation)
+        return out
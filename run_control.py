@@ -0,0 +1,71 @@
+"""
+CommGame project tools for subsequent video rater task.
+
+Cancellation of long combining runs (combine_videos.py) by signals, without any GUI calls in the frame loop.
+
+StopOnSignals installs SIGINT / SIGTERM handlers for the duration of a run. The first signal only sets a stop flag,
+which the frame loop checks once per frame (a cheap flag test, instead of a cv2.waitKey call), so the loop ends after
+the current frame and the video writers are finalised cleanly (the output up to that frame is a valid video). A second
+signal raises KeyboardInterrupt right away, for a run that does not react. The previous handlers are restored at exit.
+
+Signal handlers can only be installed from the main thread; elsewhere StopOnSignals is a no-op (the flag can still be
+set with request_stop).
+
+Worker processes (frame_shm.py, chunk-parallel mode in combine_videos.py) call child_signals at start: SIGINT (sent to
+the whole process group on Ctrl+C) is ignored there, the parent handles it and stops its workers itself.
+
+"""
+
+import signal
+import threading
+
+
+# Signals handled by StopOnSignals.
+STOP_SIGNALS = (signal.SIGINT, signal.SIGTERM)
+
+
+class StopOnSignals:
+    """
+    Context manager setting a stop flag on SIGINT / SIGTERM, see the module docstring.
+    """
+
+    def __init__(self, signals=STOP_SIGNALS):
+        self.signals = signals
+        self.stop_event = threading.Event()
+        self.signal_name = None
+        self._previous = {}
+
+    def _handler(self, signum, frame):
+        if self.stop_event.is_set():
+            raise KeyboardInterrupt('Second ' + signal.Signals(signum).name + ', stopping immediately.')
+        self.signal_name = signal.Signals(signum).name
+        print('\nReceived', self.signal_name + ', stopping after the current frame (send again to stop immediately).')
+        self.stop_event.set()
+
+    @property
+    def stopped(self):
+        return self.stop_event.is_set()
+
+    def request_stop(self):
+        self.stop_event.set()
+
+    def __enter__(self):
+        if threading.current_thread() is threading.main_thread():
+            for signum in self.signals:
+                self._previous[signum] = signal.signal(signum, self._handler)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        for signum, handler in self._previous.items():
+            signal.signal(signum, handler)
+        self._previous = {}
+        return False
+
+
+def child_signals():
+    """
+    Resets the signal handlers inherited from the parent (StopOnSignals, under fork) in a worker process: SIGINT is
+    ignored, as the parent stops its workers itself, SIGTERM terminates.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
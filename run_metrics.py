@@ -0,0 +1,190 @@
+"""
+CommGame project tools for subsequent video rater task.
+
+Instrumentation for combine_videos.combine_frames: per-stage timing, throughput, ETA and peak memory.
+
+Stages (STAGES):
+- decode_m, decode_g:  Reading (and skipping) frames of the Mordor and Gondor videos (VideoCapture read / grab).
+- compose:             Combining a pair of frames (FrameComposer.compose).
+- encode:              Writing a combined frame (writer.write).
+The stage objects are wrapped in timing proxies (RunMetrics.wrap), so the pipeline code itself is not changed, and
+timing works the same in sequential and pipelined (threaded) mode. In pipelined mode the stages overlap, so their
+times add up to more than the wall-clock time; the stage with the highest total is the bottleneck.
+
+Metrics are emitted as JSON lines, to a file or to stdout:
+- {"event": "progress", ...}  Every METRICS_INTERVAL_S seconds: frames written, expected total, elapsed time,
+                               frames / sec over the interval (rolling), ETA, peak RSS and the mean time of each stage
+                               over the interval.
+- {"event": "summary", ...}   At the end of the run: overall frames / sec, peak RSS and per-stage statistics
+                               (count, total, mean, median, 95th percentile, max).
+With profiling on, a per-stage histogram of the frame times is printed at the end (see histogram).
+
+"""
+
+import json
+import sys
+import time
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+# Pipeline stages, in pipeline order.
+STAGES = ('decode_m', 'decode_g', 'compose', 'encode')
+# Interval of the progress records, in seconds.
+METRICS_INTERVAL_S = 5.0
+# Bin edges of the profile histograms, in milliseconds.
+HISTOGRAM_BINS_MS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, np.inf)
+
+
+def peak_rss_mb():
+    """
+    Returns the peak resident set size of the process in MiB, or None if it is not available.
+    """
+    if resource is None:
+        return None
+    # ru_maxrss is in KiB on Linux, in bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / (1024 * 1024) if sys.platform == 'darwin' else maxrss / 1024
+
+
+class _TimedProxy:
+    """
+    Proxy object timing the listed methods of the wrapped object, other attributes are passed through.
+    """
+
+    def __init__(self, obj, methods, metrics):
+        self._obj, self._methods, self._metrics = obj, methods, metrics
+
+    def __getattr__(self, name):
+        attr = getattr(self._obj, name)
+        stage = self._methods.get(name)
+        if stage is None:
+            return attr
+        durations = self._metrics.durations[stage]
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return attr(*args, **kwargs)
+            finally:
+                durations.append(time.perf_counter() - start)
+
+        return timed
+
+
+class RunMetrics:
+    """
+    Collects per-stage timings of one combine_frames run and emits progress and summary records, see the module
+    docstring.
+    """
+
+    def __init__(self, metrics_file=None, total_frames=None, interval=METRICS_INTERVAL_S, labels=None):
+        """
+        :param metrics_file:  Path to the JSON lines output file, '-' for stdout. Defaults to None (no records, e.g.
+                              for profiling only).
+        :param total_frames:  Int, expected number of output frames, for the ETA. Defaults to None.
+        :param interval:      Numeric value, seconds between progress records. Defaults to METRICS_INTERVAL_S.
+        :param labels:        Dict of extra "key: value" pairs added to each record (e.g. pair and session).
+                              Defaults to None.
+        """
+        self.total_frames, self.interval = total_frames, interval
+        self.labels = dict(labels or {})
+        # one list per stage, list.append is thread-safe
+        self.durations = {stage: [] for stage in STAGES}
+        if metrics_file is None:
+            self.output = None
+        elif metrics_file == '-':
+            self.output = sys.stdout
+        else:
+            self.output = open(metrics_file, 'a')
+        self.start_time = self.last_time = time.perf_counter()
+        self.frames = self.last_frames = 0
+        self.last_counts = {stage: 0 for stage in STAGES}
+
+    def wrap(self, obj, methods):
+        """
+        Returns a proxy of obj that records the duration of each call of the listed methods.
+
+        :param obj:      Object to wrap (e.g. a VideoCapture, a FrameComposer or a video writer).
+        :param methods:  Dict of "method name: stage" pairs, e.g. {'read': 'decode_m', 'grab': 'decode_m'}.
+        :return: proxy:  Object with the same interface as obj.
+        """
+        return _TimedProxy(obj, methods, self)
+
+    def _emit(self, record):
+        if self.output is not None:
+            record.update(self.labels)
+            self.output.write(json.dumps(record) + '\n')
+            self.output.flush()
+
+    def tick(self, frames):
+        """
+        Call after each written output frame, frames is the number of frames written so far. Emits a progress record
+        every interval seconds.
+        """
+        self.frames = frames
+        now = time.perf_counter()
+        if now - self.last_time < self.interval:
+            return
+        fps = (frames - self.last_frames) / (now - self.last_time)
+        eta = None
+        if self.total_frames is not None and fps > 0:
+            eta = max(self.total_frames - frames, 0) / fps
+        stage_ms = {}
+        for stage, durations in self.durations.items():
+            recent = durations[self.last_counts[stage]:]
+            self.last_counts[stage] = len(durations)
+            stage_ms[stage] = 1000 * sum(recent) / len(recent) if recent else None
+        self._emit({'event': 'progress', 'frames': frames, 'total_frames': self.total_frames,
+                    'elapsed_s': now - self.start_time, 'fps': fps, 'eta_s': eta, 'peak_rss_mb': peak_rss_mb(),
+                    'stage_mean_ms': stage_ms})
+        self.last_time, self.last_frames = now, frames
+
+    def summary(self):
+        """
+        Returns a summary dict: frames, elapsed time, overall frames / sec, peak RSS and per-stage statistics
+        (count, total_s, mean_ms, median_ms, p95_ms, max_ms).
+        """
+        elapsed = time.perf_counter() - self.start_time
+        stages = {}
+        for stage, durations in self.durations.items():
+            if not durations:
+                continue
+            ms = 1000 * np.asarray(durations)
+            stages[stage] = {'count': len(ms), 'total_s': float(ms.sum()) / 1000, 'mean_ms': float(ms.mean()),
+                             'median_ms': float(np.median(ms)), 'p95_ms': float(np.percentile(ms, 95)),
+                             'max_ms': float(ms.max())}
+        return {'frames': self.frames, 'elapsed_s': elapsed, 'fps': self.frames / elapsed if elapsed > 0 else None,
+                'peak_rss_mb': peak_rss_mb(), 'stages': stages}
+
+    def histogram(self):
+        """
+        Returns a text table with the histogram of frame times for each stage (HISTOGRAM_BINS_MS bins).
+        """
+        edges = HISTOGRAM_BINS_MS
+        labels = ['<' + str(edge) + ' ms' if np.isfinite(edge) else '>=' + str(edges[-2]) + ' ms'
+                  for edge in edges[1:]]
+        lines = ['{:>10}'.format('') + ''.join('{:>11}'.format(label) for label in labels) + '{:>11}'.format('total s')]
+        for stage, durations in self.durations.items():
+            counts, _ = np.histogram(1000 * np.asarray(durations), bins=edges)
+            lines.append('{:>10}'.format(stage) + ''.join('{:>11}'.format(count) for count in counts) +
+                         '{:>11.2f}'.format(sum(durations)))
+        return '\n'.join(lines)
+
+    def close(self):
+        """
+        Emits the summary record and closes the metrics file. Returns the summary dict.
+        """
+        summary = self.summary()
+        record = {'event': 'summary'}
+        record.update(summary)
+        self._emit(record)
+        if self.output is not None and self.output is not sys.stdout:
+            self.output.close()
+        self.output = None
+        return summary
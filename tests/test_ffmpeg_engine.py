@@ -0,0 +1,83 @@
+"""
+CommGame project tools for subsequent video rater task.
+
+Tests for ffmpeg_engine.py: the lockstep check of pair tables (schedule_start_frames), the filtergraph built from a
+layout (build_filtergraph), and the equivalence of the two combination engines of combine_videos.py on a small
+synthetic pair (skipped without ffmpeg, see benchmarks/bench_engines.py for the full-size check).
+
+USAGE: python3 -m pytest tests
+
+"""
+
+import os
+import shutil
+import sys
+
+import numpy as np
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, 'benchmarks'))
+import combine_videos  # noqa: E402
+from ffmpeg_engine import build_filtergraph, schedule_start_frames  # noqa: E402
+from frame_layout import compute_layout  # noqa: E402
+from bench_engines import compare_outputs, PIXEL_TOLERANCE  # noqa: E402
+from synthetic_fixtures import make_pair  # noqa: E402
+
+
+def test_schedule_start_frames_lockstep():
+    steps = np.arange(5)
+    assert schedule_start_frames(np.column_stack((12 + steps, 7 + steps))) == (12, 7)
+
+
+def test_schedule_start_frames_not_lockstep():
+    # duplicated Gondor frame, then a skipped Mordor frame
+    assert schedule_start_frames([[12, 7], [13, 8], [14, 8]]) is None
+    assert schedule_start_frames([[12, 7], [14, 8], [15, 9]]) is None
+    assert schedule_start_frames(np.zeros((0, 2), int)) is None
+
+
+def test_build_filtergraph_downscale():
+    layout = compute_layout((1920, 1080))
+    assert build_filtergraph(layout, (12, 7), 30) == (
+        '[0:v]trim=start_frame=12,setpts=N/(30.0*TB),crop=1536:1080:192:0,scale=960:675:flags=area[m];'
+        '[1:v]trim=start_frame=7,setpts=N/(30.0*TB),crop=1536:1080:192:0,scale=960:675:flags=area[g];'
+        '[m][g]hstack=inputs=2:shortest=1,pad=1920:1080:0:0:black[out]')
+
+
+def test_build_filtergraph_upscale_frame_step():
+    layout = compute_layout((640, 360), out_size=(1920, 1080))
+    filtergraph = build_filtergraph(layout, (3, 0), 15, frame_step=2)
+    assert filtergraph.startswith('[0:v]trim=start_frame=3,framestep=2,setpts=N/(15.0*TB),crop=512:360:64:0,'
+                                  'scale=960:675:flags=bilinear[m];')
+    assert '[1:v]trim=start_frame=0,framestep=2,' in filtergraph
+
+
+def test_build_filtergraph_info_strip():
+    layout = compute_layout((1920, 1080), geometry='compact', info_strip=40)
+    filtergraph = build_filtergraph(layout, (12, 7), 30, info_strip_input=2)
+    assert filtergraph.endswith('[m][g]hstack=inputs=2:shortest=1,pad=1920:716:0:0:black[stacked];'
+                                '[stacked][2:v]overlay=0:675:shortest=1[out]')
+    # without a strip input, the strip rows stay black padding
+    assert build_filtergraph(layout, (12, 7), 30).endswith('pad=1920:716:0:0:black[out]')
+
+
+@pytest.mark.skipif(shutil.which('ffmpeg') is None, reason='needs ffmpeg on the PATH')
+def test_engines_equivalent(tmp_path):
+    width, height = 640, 360
+    data_dir = str(tmp_path / 'data')
+    # no jitter and no dropped frames: lockstep reading, the same starting frames for both engines
+    make_pair(data_dir, 1, width=width, height=height, duration=2.0, jitter=0.0, drop_rate=0.0, offsets=(0.0, 0.2))
+    outputs = {}
+    for engine in combine_videos.ENGINES:
+        output_dir = str(tmp_path / engine)
+        os.makedirs(output_dir)
+        outputs[engine] = combine_videos.combine_frames(data_dir, 1, alignment='start', output_dir=output_dir,
+                                                        encoder='ffmpeg', encoder_options={'crf': 12},
+                                                        engine=engine)[3]
+    layout = compute_layout((width, height))
+    count_py, count_ff, mismatches, _, diff_max = compare_outputs(outputs['python'], outputs['ffmpeg'], layout)
+    assert count_py == count_ff > 0
+    assert mismatches == 0
+    assert diff_max <= PIXEL_TOLERANCE
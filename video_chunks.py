@@ -0,0 +1,197 @@
+"""
+CommGame project tools for subsequent video rater task.
+
+Chunked, resumable writing of the combined video for combine_videos.py.
+
+In chunked mode the combined video is written as a series of fixed-length chunk files into a chunk folder next to the
+output ([OUTPUT]_chunks/chunk[NNNNN].mp4), together with a small checkpoint manifest ([OUTPUT]_chunks/manifest.json).
+A chunk is recorded in the manifest only once its file has been closed, with its first output frame, its length and
+the last Mordor and Gondor frame indices it contains. The manifest also holds the parameters of the run (source video
+keys, alignment, output and encoder settings), so a restarted run (after a crash, node preemption or user interrupt)
+resumes from the last complete chunk if nothing has changed, and starts over otherwise. A partially written chunk is
+simply rewritten on resume.
+
+Once all frames are written, the chunks are concatenated losslessly (ffmpeg concat demuxer with stream copy, no
+re-encoding) into the combined video. This step needs an ffmpeg executable on the PATH.
+
+"""
+
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+
+from atomic_files import write_atomic
+from video_writers import open_writer
+
+
+# Name of the checkpoint manifest in the chunk folder.
+CHUNK_MANIFEST = 'manifest.json'
+# Name pattern of the chunk files in the chunk folder.
+CHUNK_FILE_PATTERN = 'chunk{:05d}.mp4'
+
+
+def chunk_dir_for(output_path):
+    """
+    Returns the chunk folder belonging to an output video path ([OUTPUT]_chunks).
+    """
+    return os.path.splitext(output_path)[0] + '_chunks'
+
+
+def chunk_path(chunk_dir, chunk_idx):
+    """
+    Returns the path of chunk number chunk_idx (from 0) in chunk_dir.
+    """
+    return os.path.join(chunk_dir, CHUNK_FILE_PATTERN.format(chunk_idx))
+
+
+def load_manifest(chunk_dir):
+    """
+    Loads the checkpoint manifest from chunk_dir.
+
+    :param chunk_dir:    Path to the chunk folder.
+    :return: manifest:   Dict, the manifest, or None if there is none (or it cannot be read).
+    """
+    try:
+        with open(os.path.join(chunk_dir, CHUNK_MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_manifest(chunk_dir, manifest):
+    """
+    Saves the checkpoint manifest to chunk_dir. The file is replaced atomically, so an interrupted run never leaves a
+    partial manifest behind.
+    """
+    write_atomic(os.path.join(chunk_dir, CHUNK_MANIFEST), lambda f: json.dump(manifest, f, indent=1))
+
+
+def resume_manifest(chunk_dir, params):
+    """
+    Returns the manifest to continue with: the existing one in chunk_dir if it was written with the same parameters,
+    a new, empty one otherwise. The chunk folder is created if needed.
+
+    :param chunk_dir:    Path to the chunk folder.
+    :param params:       Dict of json-serializable run parameters, see combine_videos.combine_frames.
+    :return: manifest:   Dictionary with the following "key: value" pairs:
+        params: Dict, the run parameters
+        chunks: List of dicts for the completed chunks, with keys file, first_frame, frames, last_frame_m, last_frame_g
+        complete: Boolean, True if all chunks have been written and concatenated
+    """
+    os.makedirs(chunk_dir, exist_ok=True)
+    # round trip for comparable types (e.g. tuples become lists)
+    params = json.loads(json.dumps(params))
+    manifest = load_manifest(chunk_dir)
+    if manifest is not None and manifest.get('params') == params:
+        print('\nResuming from checkpoint manifest in', chunk_dir, '-', len(manifest['chunks']), 'complete chunks,',
+              completed_frames(manifest), 'frames.')
+        return manifest
+    if manifest is not None:
+        print('\nCheckpoint manifest in', chunk_dir, 'was written with different parameters, starting over.')
+    manifest = {'params': params, 'chunks': [], 'complete': False}
+    save_manifest(chunk_dir, manifest)
+    return manifest
+
+
+def completed_frames(manifest):
+    """
+    Returns the number of output frames in the completed chunks of a manifest.
+    """
+    return sum(chunk['frames'] for chunk in manifest['chunks'])
+
+
+def concat_chunks(chunk_files, output_path, ffmpeg=None):
+    """
+    Concatenates video chunks losslessly (ffmpeg concat demuxer, stream copy).
+
+    :param chunk_files:  List of paths to the chunk files, in order. All must have the same codec and resolution.
+    :param output_path:  Path to the output video file.
+    :param ffmpeg:       Path to the ffmpeg executable. Defaults to None, meaning 'ffmpeg' on the PATH.
+    """
+    if ffmpeg is None:
+        ffmpeg = shutil.which('ffmpeg')
+        if ffmpeg is None:
+            raise RuntimeError('Cannot find ffmpeg on the PATH, needed for concatenating chunks!')
+    fd, list_file = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(output_path)), suffix='.txt')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            for chunk_file in chunk_files:
+                f.write("file '" + os.path.abspath(chunk_file).replace("'", "'\\''") + "'\n")
+        cmd = [ffmpeg, '-y', '-loglevel', 'error', '-f', 'concat', '-safe', '0', '-i', list_file,
+               '-c', 'copy', output_path]
+        subprocess.run(cmd, check=True)
+    finally:
+        os.remove(list_file)
+
+
+class ChunkedWriter:
+    """
+    Video writer that writes fixed-length chunk files and checkpoints each completed chunk in the manifest, see the
+    module docstring. Writing continues after the frames of the completed chunks in the manifest.
+    """
+
+    def __init__(self, chunk_dir, manifest, fps, size, chunk_frames, frame_indices, backend='opencv', **options):
+        """
+        :param chunk_dir:      Path to the chunk folder.
+        :param manifest:       Dict, checkpoint manifest, see resume_manifest.
+        :param fps:            Numeric value, frame rate of the output video.
+        :param size:           Tuple (width, height) of the frames.
+        :param chunk_frames:   Int, number of frames per chunk.
+        :param frame_indices:  Function mapping an output frame index to the (Mordor, Gondor) source frame indices,
+                               recorded for the last frame of each chunk.
+        :param backend:        Str, encoder backend, see video_writers.open_writer. Defaults to 'opencv'.
+        :param options:        Encoder options, see video_writers.open_writer.
+        """
+        if chunk_frames <= 0:
+            raise ValueError('Input arg chunk_frames should be positive!')
+        self.chunk_dir, self.manifest = chunk_dir, manifest
+        self.fps, self.size, self.chunk_frames = fps, size, chunk_frames
+        self.frame_indices, self.backend, self.options = frame_indices, backend, options
+        self.frame_idx = completed_frames(manifest)
+        self.writer = None
+        self.chunk_start = self.frame_idx
+
+    def write(self, frame):
+        if self.writer is None:
+            self.chunk_start = self.frame_idx
+            self.writer = open_writer(chunk_path(self.chunk_dir, len(self.manifest['chunks'])), self.fps, self.size,
+                                      self.backend, **self.options)
+        self.writer.write(frame)
+        self.frame_idx += 1
+        if self.frame_idx - self.chunk_start == self.chunk_frames:
+            self._close_chunk()
+
+    def _close_chunk(self):
+        self.writer.release()
+        self.writer = None
+        last_m, last_g = self.frame_indices(self.frame_idx - 1)
+        self.manifest['chunks'].append({'file': CHUNK_FILE_PATTERN.format(len(self.manifest['chunks'])),
+                                        'first_frame': self.chunk_start,
+                                        'frames': self.frame_idx - self.chunk_start,
+                                        'last_frame_m': int(last_m),
+                                        'last_frame_g': int(last_g)})
+        save_manifest(self.chunk_dir, self.manifest)
+
+    def finish(self, output_path, keep_chunks=False):
+        """
+        Records the last (possibly shorter) chunk, then concatenates all chunks into output_path. Call only when all
+        frames have been written. Chunk files are removed afterwards, unless keep_chunks is set.
+        """
+        if self.writer is not None:
+            self._close_chunk()
+        chunk_files = [os.path.join(self.chunk_dir, chunk['file']) for chunk in self.manifest['chunks']]
+        print('Concatenating', len(chunk_files), 'chunks into', output_path)
+        concat_chunks(chunk_files, output_path)
+        self.manifest['complete'] = True
+        save_manifest(self.chunk_dir, self.manifest)
+        if not keep_chunks:
+            for chunk_file in chunk_files:
+                os.remove(chunk_file)
+
+    def release(self):
+        # a partial chunk is not recorded, it is rewritten on resume
+        if self.writer is not None:
+            self.writer.release()
+            self.writer = None
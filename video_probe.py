@@ -0,0 +1,235 @@
+"""
+CommGame project tools for subsequent video rater task.
+
+Video probing for combine_videos.py: basic video properties (fps, resolution) and frame counts, without decoding.
+
+Frame counts:
+- Header count:  What cv2 reports (CAP_PROP_FRAME_COUNT), from the container header. Instant, but might be off.
+- Exact count:   Number of video packets in the container. Read with ffprobe (packet-level demux, no decoding) if it is
+                 available, otherwise by stepping through the video with cv2 grab() calls (no frame retrieval, no
+                 colour conversion). Either is much faster than decoding every frame (count_frames_accurate in
+                 combine_videos.py).
+Exact counts can be cross-checked against the number of frame capture timestamps (frameCaptTime) from the .mat files.
+
+Frame presentation timestamps (probe_frame_pts): the pts of every video packet, read with ffprobe (packet-level demux,
+no decoding), in presentation order. Used for confirming that seeking landed on the right frame (see
+frame_pipeline.seek_to_frame and frame_yuv.FFmpegReader), as the recordings do not have an exact constant frame rate.
+
+Probe results are cached in a small json sidecar file next to the video ([VIDEO].probe.json), frame timestamps in a
+binary one ([VIDEO].pts.npz), keyed on the file size and modification time of the video, so repeated runs are instant.
+The caches are ignored (and rewritten) if the video changes. If the sidecars cannot be written (e.g. read-only data
+folder), probing still works, just without caching.
+
+"""
+
+import json
+import os
+import shutil
+import subprocess
+
+import cv2
+import numpy as np
+
+from atomic_files import write_atomic
+
+
+# Suffix of the probe cache sidecar files.
+PROBE_CACHE_SUFFIX = '.probe.json'
+# Suffix of the frame timestamp cache sidecar files.
+PTS_CACHE_SUFFIX = '.pts.npz'
+
+
+def count_frames_ffprobe(video_file):
+    """
+    Counts the video packets of the first video stream with ffprobe (demuxing only, no decoding).
+
+    :param video_file: Path to video file.
+    :return: total:    Frame count, or None if ffprobe is not available or fails.
+    """
+    ffprobe = shutil.which('ffprobe')
+    if ffprobe is None:
+        return None
+    cmd = [ffprobe, '-v', 'error', '-select_streams', 'v:0', '-count_packets',
+           '-show_entries', 'stream=nb_read_packets', '-of', 'csv=p=0', video_file]
+    try:
+        output = subprocess.run(cmd, capture_output=True, text=True, check=True).stdout
+        return int(output.strip().split(',')[0])
+    except (subprocess.CalledProcessError, ValueError, IndexError):
+        return None
+
+
+def count_frames_grab(video_file):
+    """
+    Counts frames by grabbing them one by one with cv2, without retrieving (converting) them.
+
+    :param video_file: Path to video file.
+    :return: total:    Frame count.
+    """
+    video = cv2.VideoCapture(video_file)
+    total = 0
+    while video.grab():
+        total += 1
+    video.release()
+    return total
+
+
+def _file_key(video_file):
+    stat = os.stat(video_file)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def _load_cache(video_file):
+    cache_file = video_file + PROBE_CACHE_SUFFIX
+    try:
+        with open(cache_file) as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    # invalidate if the video has changed since
+    key = _file_key(video_file)
+    if cached.get('size') != key['size'] or cached.get('mtime_ns') != key['mtime_ns']:
+        return None
+    return cached
+
+
+def _save_cache(video_file, probe):
+    cache_file = video_file + PROBE_CACHE_SUFFIX
+    try:
+        write_atomic(cache_file, lambda f: json.dump(probe, f, indent=1))
+    except OSError as exc:
+        print('Could not write probe cache file', cache_file, '-', exc)
+
+
+def probe_video(video_file, exact_count=False, use_cache=True):
+    """
+    Returns basic properties and frame count of a video, from the cache sidecar if it is up to date.
+
+    :param video_file:   Path to video file.
+    :param exact_count:  Boolean flag, if True, the exact frame count (packet count) is also determined, see
+                         count_frames_ffprobe and count_frames_grab. Defaults to False.
+    :param use_cache:    Boolean flag for reading / writing the cache sidecar. Defaults to True.
+    :return: probe:      Dictionary with the following "key: value" pairs:
+        size, mtime_ns: Int, file size and modification time of the video the probe belongs to
+        fps: Float, frame rate (from cv2)
+        width, height: Int, frame resolution (from cv2)
+        frame_count_header: Int, frame count as reported by cv2 (container header)
+        frame_count_exact: Int, exact frame count, or None if it was not requested (and is not cached)
+        frame_count_method: Str, method of the exact count ('ffprobe' or 'grab'), or None
+        frame_count: Int, the exact frame count if available, the header count otherwise
+    """
+    probe = _load_cache(video_file) if use_cache else None
+    if probe is None:
+        video = cv2.VideoCapture(video_file)
+        if not video.isOpened():
+            raise ValueError('Cannot open video file ' + video_file + '!')
+        probe = _file_key(video_file)
+        probe.update({'fps': video.get(cv2.CAP_PROP_FPS),
+                      'width': int(video.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                      'height': int(video.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+                      'frame_count_header': int(video.get(cv2.CAP_PROP_FRAME_COUNT)),
+                      'frame_count_exact': None,
+                      'frame_count_method': None})
+        video.release()
+        cache_dirty = True
+    else:
+        cache_dirty = False
+
+    if exact_count and probe['frame_count_exact'] is None:
+        total = count_frames_ffprobe(video_file)
+        method = 'ffprobe'
+        if total is None:
+            total = count_frames_grab(video_file)
+            method = 'grab'
+        probe['frame_count_exact'] = total
+        probe['frame_count_method'] = method
+        cache_dirty = True
+
+    if use_cache and cache_dirty:
+        _save_cache(video_file, probe)
+
+    probe['frame_count'] = probe['frame_count_exact'] if probe['frame_count_exact'] is not None \
+        else probe['frame_count_header']
+    return probe
+
+
+def check_frame_count(probe, frame_times, label=''):
+    """
+    Cross-checks the frame count of a video against the number of frame capture timestamps (frameCaptTime) and prints
+    a warning in case of a mismatch.
+
+    :param probe:        Dict, output of probe_video.
+    :param frame_times:  1D array of frame capture timestamps for the video (NaNs removed).
+    :param label:        Str, name of the video for the printed feedback (e.g. 'Mordor').
+    :return: match:      Boolean, True if the counts match.
+    """
+    kind = 'exact' if probe['frame_count_exact'] is not None else 'header'
+    match = probe['frame_count'] == len(frame_times)
+    if match:
+        print(label, 'frame count (' + kind + ') matches the number of frame capture timestamps:', len(frame_times))
+    else:
+        print('WARNING!', label, 'frame count (' + kind + '):', probe['frame_count'],
+              '; number of frame capture timestamps:', len(frame_times))
+    return match
+
+
+def _read_frame_pts(video_file):
+    """
+    Reads the packet pts of the first video stream with ffprobe, see probe_frame_pts. Returns None if ffprobe is not
+    available or fails.
+    """
+    ffprobe = shutil.which('ffprobe')
+    if ffprobe is None:
+        return None
+    cmd = [ffprobe, '-v', 'error', '-select_streams', 'v:0',
+           '-show_entries', 'packet=pts_time:stream=start_time:format=start_time', '-of', 'compact=p=1:nk=1',
+           video_file]
+    try:
+        output = subprocess.run(cmd, capture_output=True, text=True, check=True).stdout
+    except subprocess.CalledProcessError:
+        return None
+    pts, start_times = [], {}
+    for line in output.splitlines():
+        section, _, value = line.strip().partition('|')
+        value = value.split('|')[0]
+        if value in ('', 'N/A'):
+            continue
+        if section == 'packet':
+            pts.append(float(value))
+        elif section in ('stream', 'format'):
+            start_times[section] = float(value)
+    if not pts:
+        return None
+    stream_start = start_times.get('stream', min(pts))
+    return {'frame_pts': np.sort(np.asarray(pts)) - stream_start,
+            'stream_offset': stream_start - start_times.get('format', stream_start)}
+
+
+def probe_frame_pts(video_file, use_cache=True):
+    """
+    Returns the presentation timestamps of all frames of a video, from the cache sidecar if it is up to date.
+
+    :param video_file:   Path to video file.
+    :param use_cache:    Boolean flag for reading / writing the cache sidecar. Defaults to True.
+    :return: pts:        Dictionary with the following "key: value" pairs, or None if ffprobe is not available:
+        frame_pts: Numpy array of frame pts (secs), in frame order, relative to the start of the video stream (as
+                   cv2 reports CAP_PROP_POS_MSEC)
+        stream_offset: Float, start of the video stream relative to the start of the file (secs), to be added to
+                   frame_pts for ffmpeg input seeking (-ss)
+    """
+    cache_file = video_file + PTS_CACHE_SUFFIX
+    key = _file_key(video_file)
+    if use_cache:
+        try:
+            with np.load(cache_file) as cached:
+                if int(cached['size']) == key['size'] and int(cached['mtime_ns']) == key['mtime_ns']:
+                    return {'frame_pts': cached['frame_pts'], 'stream_offset': float(cached['stream_offset'])}
+        except (OSError, KeyError, ValueError):
+            pass
+    pts = _read_frame_pts(video_file)
+    if pts is not None and use_cache:
+        try:
+            write_atomic(cache_file, lambda f: np.savez(f, frame_pts=pts['frame_pts'],
+                                                        stream_offset=pts['stream_offset'], **key), mode='wb')
+        except OSError as exc:
+            print('Could not write frame timestamp cache file', cache_file, '-', exc)
+    return pts
@@ -0,0 +1,83 @@
+"""
+CommGame project tools for subsequent video rater task.
+
+Loading of the video timestamp .mat files (pair[N]_[LAB]_[SESSION]_times.mat or _videoTimes.mat) for
+combine_videos.extract_video_times_mat, with a cache.
+
+Only the needed variables are read from the .mat file (sharedStartTime, stopCaptureTime, frameCaptTime). The
+extracted, NaN-filtered values are cached in a compact binary sidecar file next to the .mat file
+([MAT].cache.npz), together with the path, size and modification time of the source .mat file. The cache is used only
+if these still match, so it is invalidated automatically when the .mat file changes. If the sidecar cannot be written
+(e.g. read-only data folder), loading still works, just without caching.
+
+"""
+
+import os
+
+import numpy as np
+from scipy import io as sio
+
+from atomic_files import write_atomic
+
+
+# Suffix of the cache sidecar files.
+TIMES_CACHE_SUFFIX = '.cache.npz'
+# Variables read from the .mat files.
+TIMES_MAT_VARIABLES = ['sharedStartTime', 'stopCaptureTime', 'frameCaptTime']
+
+
+def _source_key(times_mat):
+    stat = os.stat(times_mat)
+    return os.path.abspath(times_mat), stat.st_size, stat.st_mtime_ns
+
+
+def _load_cache(times_mat):
+    try:
+        with np.load(times_mat + TIMES_CACHE_SUFFIX) as cached:
+            source = (str(cached['source_path']), int(cached['source_size']), int(cached['source_mtime_ns']))
+            if source != _source_key(times_mat):
+                return None
+            return {'start_time': float(cached['start_time']),
+                    'stop_time': float(cached['stop_time']),
+                    'frame_times': cached['frame_times']}
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def _save_cache(times_mat, times):
+    cache_file = times_mat + TIMES_CACHE_SUFFIX
+    source_path, source_size, source_mtime_ns = _source_key(times_mat)
+    try:
+        write_atomic(cache_file, lambda f: np.savez(f, source_path=source_path, source_size=source_size,
+                                                    source_mtime_ns=source_mtime_ns, start_time=times['start_time'],
+                                                    stop_time=times['stop_time'], frame_times=times['frame_times']),
+                     mode='wb')
+    except OSError as exc:
+        print('Could not write timestamp cache file', cache_file, '-', exc)
+
+
+def load_video_times(times_mat, use_cache=True):
+    """
+    Loads the timestamps of one recording from its .mat file, or from the cache sidecar if it is up to date.
+
+    :param times_mat:  Path to the .mat file.
+    :param use_cache:  Boolean flag for reading / writing the cache sidecar. Defaults to True.
+    :return: times:    Dictionary with the following "key: value" pairs:
+        start_time: Float, sharedStartTime, timestamp of task (recording) start
+        stop_time: Float, stopCaptureTime, timestamp of task (recording) end
+        frame_times: Numpy array of frame capture timestamps (frameCaptTime), NaNs removed
+    """
+    if use_cache:
+        times = _load_cache(times_mat)
+        if times is not None:
+            return times
+
+    video_times = sio.loadmat(times_mat, variable_names=TIMES_MAT_VARIABLES)
+    frame_times = video_times['frameCaptTime'].flatten().astype(np.float64)
+    times = {'start_time': float(video_times['sharedStartTime'].flatten()[0]),
+             'stop_time': float(video_times['stopCaptureTime'].flatten()[0]),
+             'frame_times': frame_times[np.logical_not(np.isnan(frame_times))]}
+
+    if use_cache:
+        _save_cache(times_mat, times)
+    return times
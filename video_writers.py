@@ -0,0 +1,253 @@
+"""
+CommGame project tools for subsequent video rater task.
+
+Encoder backends for the combined video writer in combine_videos.py. All writers have the cv2.VideoWriter interface
+used in combine_frames: write(frame) with BGR uint8 frames, and release().
+
+Backends:
+- 'opencv':  cv2.VideoWriter with the mp4v (MPEG-4 part 2) codec. Default, no dependencies beyond opencv.
+- 'ffmpeg':  Raw BGR frames are piped into an ffmpeg subprocess, which encodes them with a configurable codec
+             (default libx264), preset, CRF and thread count. Needs an ffmpeg executable on the PATH (or supplied).
+             Much faster and / or smaller output than mp4v, depending on the preset and CRF, so CPU time can be
+             traded for file size per deployment.
+
+Segmentation (rater task videos): SegmentWriter writes frame-exact segments of the combined video, as defined in a
+segments file (e.g. segmentation_points_5parts.txt), directly from the frame stream. Overlapping segments are fed the
+same frames. TeeWriter passes frames on to several writers (e.g. the full video and the segments), so both are
+written in the same pass, without re-reading the full combined video (as the video_segmentation script does).
+
+Proxy videos: ProxyWriter downscales the frames and passes every n-th one on to a writer, for a small, low frame rate
+preview video written alongside the full one.
+
+"""
+
+import shutil
+import subprocess
+
+import cv2
+import numpy as np
+
+
+ENCODER_BACKENDS = ('opencv', 'ffmpeg')
+# Default options of the ffmpeg backend.
+FFMPEG_DEFAULTS = {'codec': 'libx264', 'preset': 'veryfast', 'crf': 23, 'threads': 0, 'pix_fmt': 'yuv420p'}
+
+
+def ffmpeg_encoder_args(codec=None, preset=None, crf=None, threads=None, pix_fmt=None):
+    """
+    Returns the ffmpeg output arguments for the encoder options (see FFmpegWriter), options set to None take their
+    FFMPEG_DEFAULTS value.
+    """
+    options = dict(FFMPEG_DEFAULTS)
+    options.update({key: value for key, value in (('codec', codec), ('preset', preset), ('crf', crf),
+                                                  ('threads', threads), ('pix_fmt', pix_fmt))
+                    if value is not None})
+    args = ['-c:v', options['codec']]
+    if options['preset'] != '':
+        args += ['-preset', str(options['preset'])]
+    if options['crf'] != '':
+        args += ['-crf', str(options['crf'])]
+    return args + ['-threads', str(options['threads']), '-pix_fmt', options['pix_fmt']]
+
+
+class FFmpegWriter:
+    """
+    Video writer piping raw frames to an ffmpeg subprocess.
+    """
+
+    def __init__(self, output_path, fps, size, codec=None, preset=None, crf=None, threads=None, pix_fmt=None,
+                 input_pix_fmt='bgr24', ffmpeg=None):
+        """
+        :param output_path:    Path to the output video file.
+        :param fps:            Numeric value, frame rate of the output video.
+        :param size:           Tuple (width, height) of the frames.
+        :param codec:          Str, ffmpeg video encoder name (e.g. 'libx264', 'libx265', 'mpeg4').
+                               Defaults to FFMPEG_DEFAULTS['codec'].
+        :param preset:         Str, encoder preset (libx264 / libx265 only, e.g. 'ultrafast' ... 'veryslow'), or ''
+                               for none. Defaults to FFMPEG_DEFAULTS['preset'].
+        :param crf:            Numeric value, constant rate factor (libx264 / libx265 only, lower is better quality
+                               and larger files), or '' for none. Defaults to FFMPEG_DEFAULTS['crf'].
+        :param threads:        Int, number of encoder threads, 0 lets ffmpeg decide. Defaults to
+                               FFMPEG_DEFAULTS['threads'].
+        :param pix_fmt:        Str, pixel format of the encoded video. Defaults to FFMPEG_DEFAULTS['pix_fmt'].
+        :param input_pix_fmt:  Str, pixel format of the frames passed to write(). Defaults to 'bgr24' (cv2 frames).
+        :param ffmpeg:         Path to the ffmpeg executable. Defaults to None, meaning 'ffmpeg' on the PATH.
+        """
+        if ffmpeg is None:
+            ffmpeg = shutil.which('ffmpeg')
+            if ffmpeg is None:
+                raise RuntimeError('Cannot find ffmpeg on the PATH, needed for the ffmpeg encoder backend!')
+        self.output_path = output_path
+        width, height = (int(v) for v in size)
+        cmd = [ffmpeg, '-y', '-loglevel', 'error',
+               '-f', 'rawvideo', '-pix_fmt', input_pix_fmt, '-s', str(width) + 'x' + str(height), '-r', str(fps),
+               '-i', '-',
+               '-an'] + ffmpeg_encoder_args(codec, preset, crf, threads, pix_fmt) + [output_path]
+        self.cmd = cmd
+        self.process = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+
+    def isOpened(self):
+        return self.process.poll() is None
+
+    def write(self, frame):
+        # no copy for contiguous frames (the usual case)
+        self.process.stdin.write(np.ascontiguousarray(frame).data)
+
+    def release(self):
+        if self.process.stdin.closed:
+            return
+        self.process.stdin.close()
+        if self.process.wait() != 0:
+            raise RuntimeError('ffmpeg exited with code ' + str(self.process.returncode) + ' while writing ' +
+                               self.output_path + '! Command: ' + ' '.join(self.cmd))
+
+
+def open_writer(output_path, fps, size, backend='opencv', **options):
+    """
+    Opens a video writer with the requested encoder backend.
+
+    :param output_path:  Path to the output video file.
+    :param fps:          Numeric value, frame rate of the output video.
+    :param size:         Tuple (width, height) of the frames.
+    :param backend:      Str, one of ENCODER_BACKENDS. Defaults to 'opencv'.
+    :param options:      Options for the ffmpeg backend (codec, preset, crf, threads, pix_fmt), see FFmpegWriter.
+                         Options set to None are ignored. The opencv backend takes no options.
+    :return: writer:     Object with write(frame) and release() methods.
+    """
+    options = {key: value for key, value in options.items() if value is not None}
+    if backend == 'opencv':
+        if options:
+            print('WARNING! Encoder options', options, 'are ignored by the opencv backend.')
+        # fourcc = cv2.VideoWriter.fourcc('M', 'J', 'P', 'G')  # not preferred format
+        fourcc = cv2.VideoWriter.fourcc('m', 'p', '4', 'v')
+        return cv2.VideoWriter(output_path, fourcc, fps, tuple(int(v) for v in size))
+    if backend == 'ffmpeg':
+        return FFmpegWriter(output_path, fps, size, **options)
+    raise ValueError('Encoder backend should be one of ' + str(ENCODER_BACKENDS) + '!')
+
+
+def _parse_time(time_str):
+    """
+    Converts 'HH:MM:SS', 'MM:SS' or 'SS' (seconds may be fractional) to seconds.
+    """
+    seconds = 0.0
+    for part in time_str.split(':'):
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+
+def parse_segments_file(segments_file):
+    """
+    Parses a segments file, with lines like "1 00:00:00 00:03:00" (segment number, start, end), the same format the
+    video_segmentation script reads.
+
+    :param segments_file: Path to the segments file.
+    :return: segments:    List of (segment number (str), start (secs), end (secs)) tuples.
+    """
+    segments = []
+    with open(segments_file) as f:
+        for line in f:
+            fields = line.split()
+            if not fields:
+                continue
+            if len(fields) != 3:
+                raise ValueError('Segment lines should have 3 fields (number, start, end), got: ' + line.strip())
+            start, end = _parse_time(fields[1]), _parse_time(fields[2])
+            if end <= start:
+                raise ValueError('Segment end should be after its start, got: ' + line.strip())
+            segments.append((fields[0], start, end))
+    return segments
+
+
+class SegmentWriter:
+    """
+    Writes segments of a frame stream to separate video files, with frame-exact boundaries. A segment from start to end
+    (in seconds) contains output frames round(start * fps) to round(end * fps) - 1. Writers are opened when their
+    segment starts and released when it ends, so only overlapping segments are open at the same time.
+    """
+
+    def __init__(self, output_prefix, fps, size, segments, backend='opencv', **options):
+        """
+        :param output_prefix:  Path prefix of the segment files, they are saved to [output_prefix]_seg[NUMBER].mp4.
+        :param fps:            Numeric value, frame rate of the frame stream and of the segments.
+        :param size:           Tuple (width, height) of the frames.
+        :param segments:       List of (segment number, start (secs), end (secs)) tuples, see parse_segments_file.
+        :param backend:        Str, encoder backend, see open_writer. Defaults to 'opencv'.
+        :param options:        Encoder options, see open_writer.
+        """
+        self.fps, self.size, self.backend, self.options = fps, size, backend, options
+        # (number, first frame, last frame + 1, path)
+        self.segments = [(number, int(round(start * fps)), int(round(end * fps)),
+                          output_prefix + '_seg' + str(number) + '.mp4') for number, start, end in segments]
+        self.open_writers = {}
+        self.written = {number: 0 for number, _, _, _ in self.segments}
+        self.frame_idx = 0
+
+    @property
+    def output_paths(self):
+        return [path for _, _, _, path in self.segments]
+
+    def write(self, frame):
+        for number, first, stop, path in self.segments:
+            if first <= self.frame_idx < stop:
+                if number not in self.open_writers:
+                    print('Starting segment', number, 'at output frame', self.frame_idx, '->', path)
+                    self.open_writers[number] = open_writer(path, self.fps, self.size, self.backend, **self.options)
+                self.open_writers[number].write(frame)
+                self.written[number] += 1
+                if self.frame_idx == stop - 1:
+                    self.open_writers.pop(number).release()
+        self.frame_idx += 1
+
+    def release(self):
+        for writer in self.open_writers.values():
+            writer.release()
+        self.open_writers = {}
+        for number, first, stop, path in self.segments:
+            if self.written[number] < stop - first:
+                print('WARNING! Segment', number, 'has', self.written[number], 'frames instead of', stop - first,
+                      '(the combined video is shorter than the segment end).')
+
+
+class TeeWriter:
+    """
+    Passes each frame on to several writers.
+    """
+
+    def __init__(self, writers):
+        self.writers = list(writers)
+
+    def write(self, frame):
+        for writer in self.writers:
+            writer.write(frame)
+
+    def release(self):
+        for writer in self.writers:
+            writer.release()
+
+
+class ProxyWriter:
+    """
+    Downscales frames and passes every step-th one on to another writer (low-resolution, low frame rate proxy video).
+    """
+
+    def __init__(self, writer, size, step=1, interpolation=cv2.INTER_AREA):
+        """
+        :param writer:         Writer of the proxy video (e.g. from open_writer), at the proxy size and frame rate.
+        :param size:           Tuple (width, height) of the proxy frames.
+        :param step:           Int, every step-th frame is written, starting with the first. Defaults to 1.
+        :param interpolation:  Cv2 interpolation flag for downscaling. Defaults to cv2.INTER_AREA.
+        """
+        self.writer, self.step, self.interpolation = writer, step, interpolation
+        self.size = tuple(int(v) for v in size)
+        self.buffer = np.zeros((self.size[1], self.size[0], 3), np.uint8)
+        self.frame_idx = 0
+
+    def write(self, frame):
+        if self.frame_idx % self.step == 0:
+            cv2.resize(frame, self.size, dst=self.buffer, interpolation=self.interpolation)
+            self.writer.write(self.buffer)
+        self.frame_idx += 1
+
+    def release(self):
+        self.writer.release()
@@ -0,0 +1,155 @@
+"""
+CommGame project tools for subsequent video rater task.
+
+Memory-mapped WAV reading and block-wise WAV writing for combine_audio.py, so that the (multi-hundred-MB) repaired mono
+recordings are aligned at constant memory.
+
+WavFile parses the RIFF chunks of a WAV file and memory-maps its data chunk: samples are read from disk only when they
+are accessed, and sample ranges (WavFile.channel(...)[start:stop]) are zero-copy views. write_wav_blocks writes
+channels (e.g. such views) interleaved into a new WAV file, optionally padded with silence at the beginning, in blocks
+of a fixed number of frames, so only one block is in memory at a time.
+
+Supported sample formats: 8-bit unsigned, 16- and 32-bit signed integer PCM, 32- and 64-bit IEEE float, including
+WAVE_FORMAT_EXTENSIBLE files with these subformats.
+
+"""
+
+import os
+import struct
+
+import numpy as np
+
+
+# Frames per block in write_wav_blocks (1 s at 44.1 kHz).
+BLOCK_FRAMES = 44100
+# WAV format tags.
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+# Numpy sample dtypes by (format tag, bits per sample). WAV data is little-endian.
+_SAMPLE_DTYPES = {(WAVE_FORMAT_PCM, 8): np.dtype('u1'),
+                  (WAVE_FORMAT_PCM, 16): np.dtype('<i2'),
+                  (WAVE_FORMAT_PCM, 32): np.dtype('<i4'),
+                  (WAVE_FORMAT_IEEE_FLOAT, 32): np.dtype('<f4'),
+                  (WAVE_FORMAT_IEEE_FLOAT, 64): np.dtype('<f8')}
+
+
+class WavFile:
+    """
+    Memory-mapped WAV file, see the module docstring. Usable as a context manager.
+    """
+
+    def __init__(self, wav_file):
+        """
+        :param wav_file:  Path to the WAV file.
+        """
+        self.path = wav_file
+        format_tag = channels = sample_rate = bits = None
+        data_offset = data_size = None
+        file_size = os.path.getsize(wav_file)
+        with open(wav_file, 'rb') as f:
+            riff, _, wave = struct.unpack('<4sI4s', f.read(12))
+            if riff != b'RIFF' or wave != b'WAVE':
+                raise ValueError('Not a RIFF / WAVE file: ' + wav_file)
+            while True:
+                header = f.read(8)
+                if len(header) < 8:
+                    break
+                chunk_id, chunk_size = struct.unpack('<4sI', header)
+                if chunk_id == b'fmt ':
+                    fmt = f.read(chunk_size)
+                    format_tag, channels, sample_rate, _, _, bits = struct.unpack('<HHIIHH', fmt[:16])
+                    if format_tag == WAVE_FORMAT_EXTENSIBLE and len(fmt) >= 26:
+                        # the subformat GUID starts with the format tag
+                        format_tag = struct.unpack('<H', fmt[24:26])[0]
+                elif chunk_id == b'data':
+                    data_offset = f.tell()
+                    # clamp the size for truncated files (or files written with a placeholder size)
+                    data_size = min(chunk_size, file_size - data_offset)
+                    break
+                else:
+                    f.seek(chunk_size, os.SEEK_CUR)
+                # chunks are word-aligned
+                if chunk_size % 2:
+                    f.seek(1, os.SEEK_CUR)
+        if format_tag is None or data_offset is None:
+            raise ValueError('Missing fmt or data chunk in WAV file: ' + wav_file)
+        dtype = _SAMPLE_DTYPES.get((format_tag, bits))
+        if dtype is None:
+            raise ValueError('Unsupported WAV sample format (format tag ' + str(format_tag) + ', ' + str(bits) +
+                             ' bits) in ' + wav_file)
+        self.sample_rate, self.channels, self.dtype = sample_rate, channels, dtype
+        self.frames = data_size // (dtype.itemsize * channels)
+        if self.frames > 0:
+            self.data = np.memmap(wav_file, dtype=dtype, mode='r', offset=data_offset,
+                                  shape=(self.frames, channels))
+        else:
+            self.data = np.zeros((0, channels), dtype)
+
+    def channel(self, channel=0):
+        """
+        Returns one channel as a 1D, zero-copy (memory-mapped, strided for multi-channel files) view.
+        """
+        return self.data[:, channel]
+
+    def samples(self, start=0, stop=None, channel=0):
+        """
+        Returns the samples start:stop of a channel, as a zero-copy view.
+        """
+        return self.channel(channel)[start:stop]
+
+    def close(self):
+        # drop the reference to the memory map, it is closed once no views are left
+        self.data = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+
+def _wav_header(sample_rate, channels, dtype, frames):
+    dtype = np.dtype(dtype)
+    format_tag = WAVE_FORMAT_IEEE_FLOAT if dtype.kind == 'f' else WAVE_FORMAT_PCM
+    block_align = channels * dtype.itemsize
+    data_size = frames * block_align
+    return (struct.pack('<4sI4s', b'RIFF', 36 + data_size + data_size % 2, b'WAVE') +
+            struct.pack('<4sIHHIIHH', b'fmt ', 16, format_tag, channels, sample_rate, sample_rate * block_align,
+                        block_align, 8 * dtype.itemsize) +
+            struct.pack('<4sI', b'data', data_size))
+
+
+def write_wav_blocks(output_path, channels, sample_rate, padding=0, block_frames=BLOCK_FRAMES):
+    """
+    Writes channels interleaved into a WAV file, in blocks, optionally with silence at the beginning.
+
+    :param output_path:   Path to the output WAV file.
+    :param channels:      List of 1D arrays (e.g. WavFile views) of the same length and dtype, one per channel.
+    :param sample_rate:   Int, sampling rate.
+    :param padding:       Int, number of silent frames at the beginning. Defaults to 0.
+    :param block_frames:  Int, number of frames interleaved and written at a time. Defaults to BLOCK_FRAMES.
+    :return: frames:      Int, number of frames written (padding included).
+    """
+    length = len(channels[0])
+    dtype = np.dtype(channels[0].dtype)
+    if any(len(channel) != length or channel.dtype != dtype for channel in channels):
+        raise ValueError('Channels should have the same length and dtype!')
+    # silence is the midpoint for unsigned 8-bit samples, zero otherwise
+    silence = 128 if dtype.kind == 'u' else 0
+    block = np.empty((block_frames, len(channels)), dtype.newbyteorder('<'))
+    with open(output_path, 'wb') as f:
+        f.write(_wav_header(int(sample_rate), len(channels), dtype, padding + length))
+        block[:] = silence
+        for first in range(0, padding, block_frames):
+            f.write(block[:min(block_frames, padding - first)])
+        for first in range(0, length, block_frames):
+            frames = min(block_frames, length - first)
+            for idx, channel in enumerate(channels):
+                block[:frames, idx] = channel[first:first + frames]
+            f.write(block[:frames])
+        # word-aligned data chunk
+        if (padding + length) * block.itemsize * len(channels) % 2:
+            f.write(b'\x00')
+    return padding + length